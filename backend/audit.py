@@ -0,0 +1,233 @@
+"""
+Guard audit log — one JSON line per chat request for compliance review / offline analysis:
+salted message hash (never the message), framework + toggles, model, every guard verdict with
+its latency (taken from the request's trace spans), prefilter decisions and the block reason.
+Blocked guards are recorded by reason code only (guard / category), never by their free-text
+details, which can echo the user's text. Without AUDIT_HASH_SALT a random salt is generated once
+and kept next to the log (.hash_salt), so hashes can't be reversed with a dictionary.
+record() only appends to an in-memory buffer; a background task writes batches from a worker
+thread and rotates the file by size / age (rotated files gzip-compressed, AUDIT_BACKUPS kept).
+"""
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from backend import tracing
+from backend.config.settings import (
+    AUDIT_ENABLED, AUDIT_LOG_PATH, AUDIT_FLUSH_SEC, AUDIT_BATCH, AUDIT_QUEUE_SIZE,
+    AUDIT_MAX_MB, AUDIT_ROTATE_SEC, AUDIT_BACKUPS, AUDIT_COMPRESS, AUDIT_HASH_SALT,
+)
+
+
+_salt: Optional[str] = None
+
+
+def _hash_salt() -> str:
+    """AUDIT_HASH_SALT, else a per-deployment random salt persisted beside the audit log."""
+    global _salt
+    if _salt is not None:
+        return _salt
+    if AUDIT_HASH_SALT:
+        _salt = AUDIT_HASH_SALT
+        return _salt
+    path = os.path.join(os.path.dirname(os.path.abspath(AUDIT_LOG_PATH)), ".hash_salt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, encoding="utf-8") as f:
+            _salt = f.read().strip()
+        if not _salt:
+            raise RuntimeError(f"[Audit] {path} is empty — delete it or set AUDIT_HASH_SALT")
+        return _salt
+    _salt = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(_salt)
+    print(f"[Audit] AUDIT_HASH_SALT not set — generated a random salt in {path}")
+    return _salt
+
+
+def message_hash(text: str) -> str:
+    return hashlib.sha256((_hash_salt() + text).encode("utf-8")).hexdigest()
+
+
+def _stage(span: tracing.Span) -> str:
+    # "Input Guard" -> "input"
+    return str(span.attributes.get("guard.stage", "")).split(" ")[0].lower()
+
+
+def trace_verdicts(trace: tracing.Trace) -> Dict[str, Any]:
+    """Per-guard verdicts, prefilter decisions and LLM calls of one finished request trace."""
+    guards, prefilter, llm = [], [], []
+    block_reason = None
+    for span in sorted(trace.spans, key=lambda s: s.start_ns):
+        attrs = span.attributes
+        if span.name == "guard.check":
+            guards.append({
+                "stage": _stage(span),
+                "framework": attrs.get("guard.framework"),
+                "guard": attrs.get("guard.name"),
+                "mode": attrs.get("guard.mode"),
+                "safe": attrs.get("guard.safe"),
+                "cache_hit": attrs.get("guard.cache_hit"),
+                "latency_ms": round(span.duration_ms, 2),
+                **({"reason": attrs["guard.reason"]} if "guard.reason" in attrs else {}),
+                **({"error": span.error} if span.error else {}),
+            })
+            if attrs.get("guard.safe") is False and block_reason is None:
+                block_reason = f"{attrs.get('guard.name')}: {attrs.get('guard.reason', '')}".rstrip(": ")
+        elif span.name == "guard.prefilter" and ("guard.blocked" in attrs or "guard.skipped" in attrs):
+            prefilter.append({
+                "stage": _stage(span),
+                "blocked": attrs.get("guard.blocked"),
+                "keyword": attrs.get("guard.keyword"),
+                "skipped": attrs.get("guard.skipped"),
+            })
+            if "guard.blocked" in attrs and block_reason is None:
+                block_reason = f"prefilter {attrs['guard.blocked']}: keyword '{attrs.get('guard.keyword')}'"
+        elif span.name == "llm.chat":
+            llm.append({
+                "model": attrs.get("gen_ai.request.model"),
+                "ttft_ms": attrs.get("llm.ttft_ms"),
+                "latency_ms": round(span.duration_ms, 2),
+                "completed": attrs.get("llm.completed"),
+            })
+    return {"guards": guards, "prefilter": prefilter, "llm": llm, "block_reason": block_reason}
+
+
+class AuditLog:
+    def __init__(self, path: str, enabled: bool = AUDIT_ENABLED):
+        self.path = os.path.abspath(path)
+        self.enabled = enabled
+        self.max_bytes = int(AUDIT_MAX_MB * 1024 * 1024)
+        self._buffer: Deque[str] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._file = None
+        self._file_lock = threading.Lock()   # a cancelled flush's thread may still be writing
+        self._opened_at = 0.0
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.errors = 0
+
+    # --- request path ---
+
+    def record(self, entry: Dict[str, Any]):
+        """Queue one record — never blocks (JSON encoding only)."""
+        if not self.enabled:
+            return
+        if len(self._buffer) >= AUDIT_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self._buffer.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str))
+        self._ensure_writer()
+        if len(self._buffer) >= AUDIT_BATCH:
+            self._wakeup.set()
+
+    def _ensure_writer(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    # --- writer task ---
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=AUDIT_FLUSH_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._buffer:
+            lines = [self._buffer.popleft() for _ in range(min(AUDIT_BATCH, len(self._buffer)))]
+            await asyncio.to_thread(self._write, lines)
+
+    # --- worker thread ---
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _write(self, lines: List[str]):
+        with self._file_lock:
+            self._write_locked(lines)
+
+    def _write_locked(self, lines: List[str]):
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            self.written += len(lines)
+            if self._should_rotate():
+                self._rotate()
+        except OSError as e:
+            self.errors += 1
+            print(f"[Audit] WARN write failed ({len(lines)} records lost): {e}")
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes > 0 and self._file.tell() >= self.max_bytes:
+            return True
+        return AUDIT_ROTATE_SEC > 0 and time.time() - self._opened_at >= AUDIT_ROTATE_SEC
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        if AUDIT_COMPRESS:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self.rotations += 1
+        # Timestamped names sort chronologically: drop the oldest past AUDIT_BACKUPS
+        backups = sorted(glob.glob(f"{glob.escape(base)}-*{ext}*"))
+        for old in backups[:max(0, len(backups) - AUDIT_BACKUPS)]:
+            os.remove(old)
+
+    async def close(self):
+        """Write what is still buffered and close the file (app shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close_file)
+
+    def _close_file(self):
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "errors": self.errors,
+        }
+
+
+# Global instance
+audit_log = AuditLog(AUDIT_LOG_PATH)
@@ -0,0 +1,315 @@
+"""
+Guard verdict / response cache — LRU + TTL with a pluggable backend.
+- memory: per-process OrderedDict (default)
+- sqlite: one WAL-mode SQLite file shared by every uvicorn worker on the host,
+          so a fleet of workers warms up once instead of N times
+
+Keys combine the normalized text with everything that can change the result: framework,
+nemo_mode, enabled guard/category set, guard model names and a fingerprint of the guard
+configuration (rails.co / prompts.yml / config.yml, Llama Guard CATEGORIES, model settings).
+When the fingerprint changes the caches flush themselves; /cache/flush does it on demand.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.config.settings import (
+    CACHE_BACKEND, CACHE_SQLITE_PATH,
+    VERDICT_CACHE_ENABLED, VERDICT_CACHE_MAX_ENTRIES, VERDICT_CACHE_TTL_SEC,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SEC,
+    LLAMA_GUARD_MODEL, NEMO_QWEN_GUARD_MODEL, NEMO_EMBEDDING_MODEL, NEMO_QWEN_CLASSIFY_MODE, NEMO_EMB_ENGINE,
+)
+
+_NEMO_CONFIG_DIR = Path(__file__).parent / "config" / "nemo"
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Cache-key normalization: NFKC, casefold, collapsed whitespace."""
+    return _WS.sub(" ", unicodedata.normalize("NFKC", text or "")).strip().casefold()
+
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+# ============================================================
+# Backends
+# ============================================================
+
+class MemoryBackend:
+    """Per-process LRU. Values are stored as-is."""
+
+    blocking = False
+
+    def __init__(self):
+        self._data: Dict[str, "OrderedDict[str, Tuple[float, Any]]"] = {}
+
+    def get(self, namespace: str, key: str) -> Tuple[bool, Any]:
+        ns = self._data.get(namespace)
+        entry = ns.get(key) if ns is not None else None
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                ns.move_to_end(key)
+                return True, value
+            del ns[key]
+        return False, None
+
+    def set(self, namespace: str, key: str, value: Any, ttl_sec: float, max_entries: int) -> int:
+        """Store and enforce the size cap; returns the number of evicted entries."""
+        ns = self._data.setdefault(namespace, OrderedDict())
+        ns[key] = (time.time() + ttl_sec, value)
+        ns.move_to_end(key)
+        evicted = 0
+        while len(ns) > max_entries:
+            ns.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self, namespace: str) -> int:
+        return len(self._data.pop(namespace, {}))
+
+    def count(self, namespace: str) -> int:
+        return len(self._data.get(namespace, {}))
+
+
+class SQLiteBackend:
+    """
+    SQLite file shared across worker processes.
+    WAL journal + one transaction per write makes every set atomic for concurrent readers;
+    values are JSON. Eviction is least-recently-written once a namespace exceeds its cap.
+    """
+
+    blocking = True
+    _PRUNE_EVERY = 64  # writes between size-cap checks
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, written_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_written ON cache(namespace, written_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread (calls arrive via asyncio.to_thread)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Tuple[bool, Any]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace=? AND key=?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            return False, None
+        if row[1] <= time.time():
+            self._conn().execute("DELETE FROM cache WHERE namespace=? AND key=?", (namespace, key))
+            return False, None
+        return True, json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl_sec: float, max_entries: int) -> int:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache(namespace, key, value, expires_at, written_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl_sec, now),
+            )
+            evicted = 0
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                excess = conn.execute("SELECT COUNT(*) FROM cache WHERE namespace=?", (namespace,)).fetchone()[0] - max_entries
+                if excess > 0:
+                    evicted = conn.execute(
+                        "DELETE FROM cache WHERE namespace=? AND key IN ("
+                        " SELECT key FROM cache WHERE namespace=? ORDER BY written_at ASC LIMIT ?)",
+                        (namespace, namespace, excess),
+                    ).rowcount
+            conn.execute("COMMIT")
+            return evicted
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self, namespace: str) -> int:
+        return self._conn().execute("DELETE FROM cache WHERE namespace=?", (namespace,)).rowcount
+
+    def count(self, namespace: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache WHERE namespace=?", (namespace,)).fetchone()[0]
+
+
+def _make_backend():
+    if CACHE_BACKEND == "sqlite":
+        try:
+            backend = SQLiteBackend(CACHE_SQLITE_PATH)
+            print(f"[Cache] Using shared SQLite cache: {CACHE_SQLITE_PATH}")
+            return backend
+        except Exception as e:
+            print(f"[Cache] WARN SQLite cache unavailable ({e}) — falling back to memory")
+    return MemoryBackend()
+
+
+# ============================================================
+# Config fingerprint
+# ============================================================
+
+class _Fingerprint:
+    """Hash of the guard configuration; recomputed only when a config file changes on disk."""
+
+    def __init__(self):
+        self.value: Optional[str] = None
+        self._stat: Optional[tuple] = None
+
+    def _config_stat(self) -> tuple:
+        stats = []
+        for name in ("rails.co", "prompts.yml", "config.yml"):
+            try:
+                st = os.stat(_NEMO_CONFIG_DIR / name)
+                stats.append((name, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stats.append((name, None, None))
+        return tuple(stats)
+
+    def current(self) -> str:
+        stat = self._config_stat()
+        if stat != self._stat:
+            from backend.guards.llama_guard.checker_llamaguard import CATEGORIES
+            h = hashlib.sha256()
+            for name in ("rails.co", "prompts.yml", "config.yml"):
+                path = _NEMO_CONFIG_DIR / name
+                if path.exists():
+                    h.update(path.read_bytes())
+            h.update(json.dumps(CATEGORIES, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+            h.update(f"{LLAMA_GUARD_MODEL}|{NEMO_QWEN_GUARD_MODEL}|{NEMO_EMBEDDING_MODEL}|{NEMO_QWEN_CLASSIFY_MODE}|{NEMO_EMB_ENGINE}".encode())
+            value = h.hexdigest()[:16]
+            if self.value is not None and value != self.value:
+                print("[Cache] Guard configuration changed — flushing caches")
+                for cache in (verdict_cache, response_cache):
+                    cache.flush()
+            self.value = value
+            self._stat = stat
+        return self.value
+
+
+# ============================================================
+# Cache
+# ============================================================
+
+class Cache:
+    """One namespace (e.g. "verdict", "response") on the shared backend, with hit/miss counters."""
+
+    def __init__(self, namespace: str, backend, enabled: bool, max_entries: int, ttl_sec: float):
+        self.namespace = namespace
+        self.backend = backend
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        # Counters are per worker process
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def key(self, *parts: Any) -> str:
+        return make_key(fingerprint.current(), *parts)
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        """(found, value). Expired entries and backend errors count as misses."""
+        try:
+            if self.backend.blocking:
+                found, value = await asyncio.to_thread(self.backend.get, self.namespace, key)
+            else:
+                found, value = self.backend.get(self.namespace, key)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Cache] {self.namespace} get failed: {e}")
+            found, value = False, None
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, value
+
+    async def set(self, key: str, value: Any):
+        try:
+            if self.backend.blocking:
+                evicted = await asyncio.to_thread(self.backend.set, self.namespace, key, value, self.ttl_sec, self.max_entries)
+            else:
+                evicted = self.backend.set(self.namespace, key, value, self.ttl_sec, self.max_entries)
+            self.evictions += evicted
+        except Exception as e:
+            self.errors += 1
+            print(f"[Cache] {self.namespace} set failed: {e}")
+
+    def flush(self) -> int:
+        return self.backend.clear(self.namespace)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.count(self.namespace),
+            "max_entries": self.max_entries,
+            "ttl_sec": self.ttl_sec,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "fingerprint": fingerprint.value,
+        }
+
+
+async def cached_verdict(
+    key_parts: tuple,
+    text: str,
+    compute: Callable[[], Awaitable[Any]],
+    cacheable: Callable[[Any], bool] = lambda result: True,
+) -> Tuple[Any, bool]:
+    """
+    Return (result, cache_hit) for a guard call.
+    key_parts identify the guard + configuration; `text` is normalized and appended.
+    Results rejected by `cacheable` (errors, fail-open skips) are never stored.
+    """
+    if not verdict_cache.enabled:
+        return await compute(), False
+    key = verdict_cache.key(*key_parts, normalize_text(text))
+    found, value = await verdict_cache.get(key)
+    if found:
+        return value, True
+    result = await compute()
+    if cacheable(result):
+        await verdict_cache.set(key, result)
+    return result, False
+
+
+# Global instances
+_backend = _make_backend()
+fingerprint = _Fingerprint()
+verdict_cache = Cache("verdict", _backend, VERDICT_CACHE_ENABLED, VERDICT_CACHE_MAX_ENTRIES, VERDICT_CACHE_TTL_SEC)
+response_cache = Cache("response", _backend, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SEC)
@@ -11,11 +11,32 @@ OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 GPUSTACK_HOST = os.getenv("GPUSTACK_HOST", "http://localhost:80")
 GPUSTACK_API_KEY = os.getenv("GPUSTACK_API_KEY", "")
 
+# Shared async HTTP client (connection pool + keep-alive) for Ollama / GPUStack
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Max concurrent in-flight requests per upstream host (0 = unlimited), separately for chat
+# generation and for guard model calls (Llama Guard / Qwen guard / embeddings), so short guard
+# calls never queue behind long-running chat streams
+LLM_PER_HOST_CONCURRENCY = int(os.getenv("LLM_PER_HOST_CONCURRENCY", "8"))
+GUARD_PER_HOST_CONCURRENCY = int(os.getenv("GUARD_PER_HOST_CONCURRENCY", "8"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
 # Default model to use
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "scb10x/typhoon2.5-qwen3-4b")
 
 # Llama Guard model name in Ollama
 LLAMA_GUARD_MODEL = os.getenv("LLAMA_GUARD_MODEL", "llama-guard3:8b")
+# Decode budget for a verdict ("unsafe\nS1,S14,S15" is ~15 tokens); the stream is closed as soon as it parses
+LLAMA_GUARD_NUM_PREDICT = int(os.getenv("LLAMA_GUARD_NUM_PREDICT", "24"))
+# Default for ChatRequest.llama_guard_mode:
+#   "separate" — full-prompt check on the user message, then again on the reply (2 full prefills per turn)
+#   "combined" — compact up-front input check, then one conversation-level check (user + reply) on the full prompt
+LLAMA_GUARD_MODE = os.getenv("LLAMA_GUARD_MODE", "separate").lower()
+# Ollama keep_alive for guard models (Llama Guard, Qwen guard): keeps the model and its cached
+# prompt prefix resident between requests instead of the 5-minute default unload. "-1" = forever
+GUARD_KEEP_ALIVE = os.getenv("GUARD_KEEP_ALIVE", "30m")
 
 # ============================================================
 # NeMo Guardrails Model Configuration
@@ -26,6 +47,24 @@ NEMO_QWEN_GUARD_MODEL = os.getenv("NEMO_QWEN_GUARD_MODEL", "qwen3:0.6b")
 # Embedding model (ใช้สำหรับ embedding-based guard)
 NEMO_EMBEDDING_MODEL = os.getenv("NEMO_EMBEDDING_MODEL", "qwen3-embedding:0.6b")
 
+# Qwen classification: "multi" = one multi-label call for all enabled guards,
+# "per_guard" = one prompt per guard type (fallback)
+NEMO_QWEN_CLASSIFY_MODE = os.getenv("NEMO_QWEN_CLASSIFY_MODE", "multi")
+
+# Embedding-mode engine: "native" = in-process nearest-intent rail over the rails.co examples
+# (backend/guards/nemo/embedding_rail.py), "rails" = full LLMRails.generate_async + refusal-text matching
+NEMO_EMB_ENGINE = os.getenv("NEMO_EMB_ENGINE", "native").lower()
+
+# On-disk embedding caches (keyed by rails.co content hash + embedding model):
+# - native rail intent index (.npy, memory-mapped on load)
+# - NeMo's own embedding_search_provider filesystem cache (NEMO_EMB_ENGINE=rails)
+NEMO_EMB_INDEX_DIR = os.getenv("NEMO_EMB_INDEX_DIR", os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "nemo_index"))
+NEMO_EMB_CACHE_DIR = os.getenv("NEMO_EMB_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "nemo_embeddings"))
+
+# Shared embedder (backend/embeddings.py) — texts per /api/embed call, memoized vectors
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MEMO_SIZE = int(os.getenv("EMBED_MEMO_SIZE", "4096"))
+
 # ============================================================
 # System Prompt — กำหนดหน้าที่/บทบาทของโมเดล
 # ============================================================
@@ -58,6 +97,141 @@ API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8000"))
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 
+# ============================================================
+# Warm-up — heavy guard frameworks load lazily (first use) or in a background preload
+# ============================================================
+# Components preloaded in the background at startup (the rest load on first use):
+# guardrails_ai, nemo, llama_guard, gpu (torch). Empty = everything lazy.
+WARMUP_EAGER = [c.strip() for c in os.getenv("WARMUP_EAGER", "guardrails_ai,nemo,llama_guard,gpu").split(",") if c.strip()]
+
+# ============================================================
+# Guard Scheduler — concurrent guard execution
+# ============================================================
+# Thread pool size for sync (CPU-bound / blocking) guard validators
+GUARD_MAX_WORKERS = int(os.getenv("GUARD_MAX_WORKERS", "8"))
+# Single-flight dedupe for guard model calls (Llama Guard / Qwen guard): identical prompts from
+# concurrent requests share one in-flight call (no waiting window)
+GUARD_SINGLE_FLIGHT = os.getenv("GUARD_SINGLE_FLIGHT", "true").lower() == "true"
+
+# ============================================================
+# Guard Verdict Cache — repeated messages skip the guard models
+# ============================================================
+VERDICT_CACHE_ENABLED = os.getenv("VERDICT_CACHE_ENABLED", "true").lower() == "true"
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "10000"))
+VERDICT_CACHE_TTL_SEC = float(os.getenv("VERDICT_CACHE_TTL_SEC", "3600"))
+
+# Full ChatResponse cache for identical, unblocked questions (FAQ-style traffic)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", "1800"))
+
+# Semantic FAQ cache — paraphrases of an already-approved question reuse its answer
+# (matched by NEMO_EMBEDDING_MODEL cosine similarity, after the input guards pass)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_TTL_SEC = float(os.getenv("SEMANTIC_CACHE_TTL_SEC", "3600"))
+
+# Cache backend: "memory" (per worker) or "sqlite" (one file shared by all workers on the host)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "guard_cache.sqlite3"))
+
+# ============================================================
+# Conversation sessions (ChatRequest.session_id) — server-side multi-turn history
+# ============================================================
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))   # LRU eviction past this
+SESSION_TTL_SEC = float(os.getenv("SESSION_TTL_SEC", "3600"))           # idle sessions expire
+# Turns (user + assistant) kept per session; past it the oldest half is dropped at once
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+# Prior turns passed to the hallucination guard as grounding context (most recent kept)
+SESSION_CONTEXT_MAX_CHARS = int(os.getenv("SESSION_CONTEXT_MAX_CHARS", "4000"))
+
+# ============================================================
+# Keyword prefilter — compiled keyword tier in front of the LLM-based guards
+# ============================================================
+# Sure-block keywords (competitor / profanity / lottery) decide without the LLM guard call
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+# Guards that railway vocabulary lets skip (off_topic also covers Llama Guard S15). Empty = never skip.
+# Opt-in: one railway word anywhere skips the guard, so "ตั๋วรถไฟ + <anything>" also gets through
+PREFILTER_ALLOW_SKIP = [g.strip() for g in os.getenv("PREFILTER_ALLOW_SKIP", "").split(",") if g.strip()]
+
+# ============================================================
+# PII handling — block the turn, or mask the PII and let the request proceed
+# ============================================================
+# Default for ChatRequest.pii_action: "block" | "redact"
+# redact: phone / ID / email / ... are replaced with typed placeholders ([PHONE_1]) before any
+# other guard or the LLM sees the message; the placeholder -> original map is returned in the response.
+PII_ACTION = os.getenv("PII_ACTION", "block").lower()
+
+# ============================================================
+# Speculative generation — start the LLM call in parallel with the input guards
+# ============================================================
+# Default for ChatRequest.speculative (tokens are buffered until input guards pass)
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"
+
+# ============================================================
+# Streaming (/chat/stream) — incremental output guarding
+# ============================================================
+# Output guards checked on every window before it is sent to the client
+STREAM_WINDOW_GUARDS = [g.strip() for g in os.getenv("STREAM_WINDOW_GUARDS", "toxicity,competitor").split(",") if g.strip()]
+# A window is released at a sentence/space boundary once it has MIN chars, or hard-cut at MAX chars
+STREAM_WINDOW_MIN_CHARS = int(os.getenv("STREAM_WINDOW_MIN_CHARS", "40"))
+STREAM_WINDOW_MAX_CHARS = int(os.getenv("STREAM_WINDOW_MAX_CHARS", "200"))
+# Tail of the previous window prepended to the next check (catches words split across windows)
+STREAM_WINDOW_OVERLAP = int(os.getenv("STREAM_WINDOW_OVERLAP", "20"))
+
+# ============================================================
+# Resource sampler — CPU / RAM / VRAM snapshot refreshed in the background
+# ============================================================
+# Requests read the latest snapshot instead of polling psutil / Ollama /api/ps themselves
+RESOURCE_SAMPLE_INTERVAL_SEC = float(os.getenv("RESOURCE_SAMPLE_INTERVAL_SEC", "2"))
+# Snapshots kept for GET /resources/history (300 x 2s = last 10 minutes)
+RESOURCE_HISTORY_SIZE = int(os.getenv("RESOURCE_HISTORY_SIZE", "300"))
+# Also sample GPUStack /v1/gpus (when the GPUStack backend is in use)
+RESOURCE_SAMPLE_GPUSTACK = os.getenv("RESOURCE_SAMPLE_GPUSTACK", "false").lower() == "true"
+
+# ============================================================
+# Log streaming (/ws/logs) — request handlers only enqueue; one sender task per subscriber
+# ============================================================
+# Recent events replayed to a client on connect (reconnects send ?after=<seq> and get only what they missed)
+LOG_HISTORY_SIZE = int(os.getenv("LOG_HISTORY_SIZE", "200"))
+# Per-subscriber queue bound; a slow client loses events instead of slowing requests down
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+# When a subscriber queue is full: "drop_oldest" | "drop_newest" (drops are reported as one notice event)
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop_oldest").lower()
+# Send queued events as one JSON array frame (up to LOG_BATCH_MAX events, gathered for LOG_BATCH_WINDOW_MS)
+LOG_BATCH_FRAMES = os.getenv("LOG_BATCH_FRAMES", "true").lower() == "true"
+LOG_BATCH_MAX = int(os.getenv("LOG_BATCH_MAX", "50"))
+LOG_BATCH_WINDOW_MS = float(os.getenv("LOG_BATCH_WINDOW_MS", "10"))
+# Print events to stdout (from its own subscriber task, off the request path)
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "true").lower() == "true"
+
+# ============================================================
+# Guard audit log — one JSON line per request (message hash, toggles, per-guard verdicts)
+# ============================================================
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "true").lower() == "true"
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "audit", "guard_audit.jsonl"))
+# Records are buffered and written by a background task every FLUSH_SEC (or once BATCH records are waiting)
+AUDIT_FLUSH_SEC = float(os.getenv("AUDIT_FLUSH_SEC", "1"))
+AUDIT_BATCH = int(os.getenv("AUDIT_BATCH", "200"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))      # past this, records are dropped (and counted)
+# Rotate the active file at MAX_MB or after ROTATE_SEC (0 = no time rotation); keep BACKUPS rotated files
+AUDIT_MAX_MB = float(os.getenv("AUDIT_MAX_MB", "50"))
+AUDIT_ROTATE_SEC = float(os.getenv("AUDIT_ROTATE_SEC", "86400"))
+AUDIT_BACKUPS = int(os.getenv("AUDIT_BACKUPS", "30"))
+AUDIT_COMPRESS = os.getenv("AUDIT_COMPRESS", "true").lower() == "true"   # gzip rotated files
+# Salt for the message hash (set per deployment so hashes can't be matched against other systems;
+# empty = a random salt is generated once and kept in <audit dir>/.hash_salt)
+AUDIT_HASH_SALT = os.getenv("AUDIT_HASH_SALT", "")
+
+# ============================================================
+# Tracing — per-request spans (guards, upstream LLM calls, stages)
+# ============================================================
+# Finished traces are appended as OTLP/JSON lines here (empty = no export;
+# ChatRequest.trace still returns the breakdown in the response)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "srt-guardrails")
+
 # ============================================================
 # Guardrail Framework Metadata
 # ============================================================
@@ -0,0 +1,65 @@
+"""
+Shared embedder — NEMO_EMBEDDING_MODEL via the Ollama /api/embed endpoint.
+Vectors are L2-normalized (dot product == cosine similarity) and memoized per
+normalized text, so the same message is embedded once per request pipeline
+(the text sent to the model is the original, not the normalized key).
+"""
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+from backend.cache import normalize_text
+from backend.config.settings import OLLAMA_HOST, NEMO_EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBED_MEMO_SIZE
+from backend.ollama_service import get_http_client, host_slot
+
+
+class Embedder:
+    def __init__(self, model: str = NEMO_EMBEDDING_MODEL, memo_size: int = EMBED_MEMO_SIZE):
+        self.model = model
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.calls = 0
+
+    async def _request(self, texts: List[str]) -> np.ndarray:
+        url = f"{OLLAMA_HOST}/api/embed"
+        async with host_slot(url, "guard"):
+            resp = await get_http_client().post(url, json={"model": self.model, "input": texts})
+        resp.raise_for_status()
+        self.calls += 1
+        vectors = np.asarray(resp.json()["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts -> (len(texts), dim) float32 matrix. Raises on backend errors."""
+        # The memo is keyed by normalized text, but the model always sees the original text;
+        # rows come from this call's own dict, so a concurrent call evicting the memo can't break it
+        keys = [normalize_text(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}   # key -> first original text with that key
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            vec = self._memo.get(key)
+            if vec is not None:
+                self._memo.move_to_end(key)
+                found[key] = vec
+            else:
+                missing[key] = text
+        pending = list(missing.items())
+        for i in range(0, len(pending), EMBED_BATCH_SIZE):
+            batch = pending[i:i + EMBED_BATCH_SIZE]
+            for (key, _), vec in zip(batch, await self._request([text for _, text in batch])):
+                found[key] = self._memo[key] = vec
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        rows = [found[key] for key in keys]
+        return np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
+
+
+# Global instance
+embedder = Embedder()
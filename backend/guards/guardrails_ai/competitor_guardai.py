@@ -3,34 +3,40 @@ Guardrails AI — Competitor Mention Guard (Output Guard)
 Uses Guardrails AI Hub 'CompetitorCheck' validator.
 """
 from typing import Tuple
-from guardrails import Guard
-try:
+from backend.guards.guardrails_ai.lazy_guard import LazyHubGuard, is_validation_failure, guard_error
+
+
+def _build_guard():
+    from guardrails import Guard
     from guardrails.hub import CompetitorCheck
-except ImportError:
-    CompetitorCheck = None
+    return Guard().use(
+        CompetitorCheck, 
+        competitors=["AirAsia", "Nok Air", "Thai Lion Air", "Grab", "Bolt", "Uber", "Nakhonchai Air"],
+        llm_callable="ollama/scb10x/typhoon2.5-qwen3-4b",
+        on_fail="exception"
+    )
 
 class CompetitorGuard:
     def __init__(self):
-        if CompetitorCheck:
-            self.guard = Guard().use(
-                CompetitorCheck, 
-                competitors=["AirAsia", "Nok Air", "Thai Lion Air", "Grab", "Bolt", "Uber", "Nakhonchai Air"],
-                llm_callable="ollama/scb10x/typhoon2.5-qwen3-4b",
-                on_fail="exception"
-            )
-            self._has_guard = True
-        else:
-            self._has_guard = False
-            print("⚠️ CompetitorCheck not found in Hub, please install: guardrails hub install hub://guardrails/competitor_check")
+        self._guard = LazyHubGuard(
+            "Competitor Guard", _build_guard,
+            "⚠️ CompetitorCheck not found in Hub, please install: guardrails hub install hub://guardrails/competitor_check",
+        )
+
+    def load(self) -> bool:
+        return self._guard.load()
 
     def check(self, text: str, model: str = None) -> Tuple[bool, str]:
-        if not self._has_guard:
+        guard = self._guard.get()
+        if guard is None:
             return True, "Guard not installed"
 
         try:
-            self.guard.validate(text)
+            guard.validate(text)
             return True, "Clean"
         except Exception as e:
+            if not is_validation_failure(e):
+                return False, guard_error(e)
             return False, f"Competitor detected (Hub): {str(e)}"
 
 competitor_guard = CompetitorGuard()
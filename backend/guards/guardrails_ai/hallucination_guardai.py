@@ -3,34 +3,41 @@ Guardrails AI — Hallucination Detection Guard (Output Guard)
 Uses Guardrails AI Hub 'MiniCheck' (as requested) or fallback.
 """
 from typing import Tuple
-from guardrails import Guard
-try:
+from backend.guards.guardrails_ai.lazy_guard import LazyHubGuard, is_validation_failure, guard_error
+
+
+def _build_guard():
+    from guardrails import Guard
     # User requested BespokeMiniCheck
     # This is often 'hub://bespokelabs/minicheck' -> class MiniCheck or BespokeMiniCheck
     from guardrails.hub import BespokeMiniCheck
-except ImportError:
-    BespokeMiniCheck = None
+    return Guard().use(
+        BespokeMiniCheck,
+        on_fail="exception"
+    )
 
 class HallucinationGuard:
     def __init__(self):
-        if BespokeMiniCheck:
-            self.guard = Guard().use(
-                BespokeMiniCheck,
-                on_fail="exception"
-            )
-            self._has_guard = True
-        else:
-            self._has_guard = False
-            print("⚠️ BespokeMiniCheck not found in Hub.")
+        self._guard = LazyHubGuard("Hallucination Guard", _build_guard, "⚠️ BespokeMiniCheck not found in Hub.")
+
+    def load(self) -> bool:
+        return self._guard.load()
 
-    def check(self, response: str, model: str = None) -> Tuple[bool, str]:
-        if not self._has_guard:
+    def check(self, response: str, model: str = None, context: str = None) -> Tuple[bool, str]:
+        """context: grounding text the response is checked against (system prompt + conversation so far)"""
+        guard = self._guard.get()
+        if guard is None:
             return True, "Guard not installed"
 
         try:
-            self.guard.validate(response) 
+            if context:
+                guard.validate(response, metadata={"context": context})
+            else:
+                guard.validate(response)
             return True, "Response appears grounded"
         except Exception as e:
+            if not is_validation_failure(e):
+                return False, guard_error(e)
             return False, f"Hallucination detected (Hub): {str(e)}"
 
 hallucination_guard = HallucinationGuard()
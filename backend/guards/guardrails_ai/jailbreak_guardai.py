@@ -3,39 +3,36 @@ Guardrails AI — Jailbreak Detection Guard (Input Guard)
 Uses Guardrails AI Hub 'DetectJailbreak' (or 'PromptInjection' as fallback).
 """
 from typing import Tuple
-from guardrails import Guard
-try:
-    # User requested 'DetectJailbreak'. Structurally checking if it exists under that name or similar.
-    # Functionally 'PromptInjection' is the standard Deepset one.
-    # 'DetectJailbreak' might be a specific one user saw. I will try importing standard ones.
+from backend.guards.guardrails_ai.lazy_guard import LazyHubGuard, is_validation_failure, guard_error
+
+
+def _build_guard():
+    from guardrails import Guard
     # If using 'hub://guardrails/detect_jailbreak', class is DetectJailbreak.
     from guardrails.hub import DetectJailbreak
-except ImportError:
-    try:
-        from guardrails.hub import DetectJailbreak
-    except ImportError:
-        DetectJailbreak = None
+    return Guard().use(
+        DetectJailbreak, 
+        on_fail="exception"
+    )
 
 class JailbreakGuard:
     def __init__(self):
-        if DetectJailbreak:
-            self.guard = Guard().use(
-                DetectJailbreak, 
-                on_fail="exception"
-            )
-            self._has_guard = True
-        else:
-            self._has_guard = False
-            print("⚠️ DetectJailbreak/PromptInjection not found in Hub.")
+        self._guard = LazyHubGuard("Jailbreak Guard", _build_guard, "⚠️ DetectJailbreak/PromptInjection not found in Hub.")
+
+    def load(self) -> bool:
+        return self._guard.load()
 
     def check(self, text: str, model: str = None) -> Tuple[bool, str]:
-        if not self._has_guard:
+        guard = self._guard.get()
+        if guard is None:
             return True, "Guard not installed"
             
         try:
-            self.guard.validate(text)
+            guard.validate(text)
             return True, "Safe"
         except Exception as e:
+            if not is_validation_failure(e):
+                return False, guard_error(e)
             return False, f"Jailbreak detected (Hub): {str(e)}"
 
 jailbreak_guard = JailbreakGuard()
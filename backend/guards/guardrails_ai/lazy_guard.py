@@ -0,0 +1,52 @@
+"""
+Lazy Guardrails AI Hub guard — the validator import and Guard().use(...) (which loads
+models such as Detoxify) run on first use or during warm-up, not at module import.
+"""
+import threading
+from typing import Any, Callable, Optional
+
+# Details prefix when a validator raised something other than a validation failure (LLM timeout,
+# connection error, ...): the verdict cache must not remember it (see main._guardai_cacheable)
+GUARD_ERROR = "Guard error"
+
+
+def is_validation_failure(e: Exception) -> bool:
+    """on_fail="exception" raises guardrails' ValidationError ("Validation failed for field ...")."""
+    return "ValidationError" in type(e).__name__ or "Validation failed" in str(e)
+
+
+def guard_error(e: Exception) -> str:
+    return f"{GUARD_ERROR}: {type(e).__name__}: {e}"
+
+
+class LazyHubGuard:
+    def __init__(self, name: str, build: Callable[[], Any], missing_msg: str):
+        """
+        build: imports the hub validator and returns the Guard (ImportError = not installed)
+        missing_msg: printed once if the validator is not available
+        """
+        self.name = name
+        self._build = build
+        self._missing_msg = missing_msg
+        self._guard: Optional[Any] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Any]:
+        """The Guard, or None if the validator is not installed / failed to load."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        self._guard = self._build()
+                        print(f"[{self.name}] OK Guardrails AI validator loaded")
+                    except ImportError:
+                        print(self._missing_msg)
+                    except Exception as e:
+                        print(f"[{self.name}] WARN validator not available ({e})")
+                    self._loaded = True
+        return self._guard
+
+    def load(self) -> bool:
+        """Warm-up hook: build now. Returns True if the guard is available."""
+        return self.get() is not None
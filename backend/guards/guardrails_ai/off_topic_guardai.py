@@ -4,39 +4,40 @@ Uses Guardrails AI Hub RestrictToTopic validator.
 Falls back to LLM-based classification via Ollama if Hub validator is unavailable.
 """
 from typing import Tuple
+from backend.guards.guardrails_ai.lazy_guard import LazyHubGuard, is_validation_failure, guard_error
+
 
 # --- Guardrails AI Hub: RestrictToTopic ---
-try:
+def _build_guard():
     from guardrails import Guard
-    from guardrails.hub import RestrictToTopic as _RestrictToTopic
     from guardrails.hub import RestrictToTopic
-except ImportError:
-    RestrictToTopic = None
+    return Guard().use(
+        RestrictToTopic,
+        valid_topics=["trains", "railway services", "ticket booking", "train schedules", "SRT Thailand", "travel by train"],
+        disable_classifier=True, 
+        disable_llm=False,
+        llm_callable="ollama/scb10x/typhoon2.5-qwen3-4b",
+        on_fail="exception"
+    )
 
 class OffTopicGuard:
     def __init__(self):
-        if RestrictToTopic:
-            self.guard = Guard().use(
-                RestrictToTopic,
-                valid_topics=["trains", "railway services", "ticket booking", "train schedules", "SRT Thailand", "travel by train"],
-                disable_classifier=True, 
-                disable_llm=False,
-                llm_callable="ollama/scb10x/typhoon2.5-qwen3-4b",
-                on_fail="exception"
-            )
-            self._has_guard = True
-        else:
-            self._has_guard = False
-            print("⚠️ RestrictToTopic not found in Hub.")
+        self._guard = LazyHubGuard("Off-Topic Guard", _build_guard, "⚠️ RestrictToTopic not found in Hub.")
+
+    def load(self) -> bool:
+        return self._guard.load()
 
     def check(self, text: str, model: str = None) -> Tuple[bool, str]:
-        if not self._has_guard:
+        guard = self._guard.get()
+        if guard is None:
             return True, "Guard not installed"
             
         try:
-            self.guard.validate(text)
+            guard.validate(text)
             return True, "On-topic"
         except Exception as e:
+            if not is_validation_failure(e):
+                return False, guard_error(e)
             return False, f"Off-Topic detected (Hub): {str(e)}"
 
 off_topic_guard = OffTopicGuard()
@@ -5,23 +5,19 @@ Supplements with LLM-based Thai toxicity check via Ollama.
 """
 from typing import Tuple
 import re
+from backend.guards.guardrails_ai.lazy_guard import LazyHubGuard, is_validation_failure, guard_error
 
-# --- Guardrails AI Hub: ToxicLanguage ---
-try:
+
+# --- Guardrails AI Hub: ToxicLanguage (Detoxify is loaded on first use / warm-up) ---
+def _build_guard():
     from guardrails import Guard
     from guardrails.hub import ToxicLanguage as _ToxicLanguage
-
-    _toxic_guard = Guard().use(
+    return Guard().use(
         _ToxicLanguage,
         threshold=0.5,
         validation_method="sentence",
         on_fail="exception",
     )
-    _HAS_GUARD = True
-    print("[Toxicity Guard] OK Guardrails AI ToxicLanguage (Detoxify) loaded")
-except Exception as e:
-    _HAS_GUARD = False
-    print(f"[Toxicity Guard] WARN ToxicLanguage not available ({e})")
 
 # --- LLM-based Thai toxicity check ---
 from backend.ollama_service import ollama_service
@@ -32,6 +28,10 @@ class ToxicityGuard:
 
     def __init__(self):
         self.default_model = "scb10x/typhoon2.5-qwen3-4b"
+        self._guard = LazyHubGuard("Toxicity Guard", _build_guard, "[Toxicity Guard] WARN ToxicLanguage not available")
+
+    def load(self) -> bool:
+        return self._guard.load()
 
     def check(self, text: str, model: str = None) -> Tuple[bool, str]:
         """
@@ -39,13 +39,14 @@ class ToxicityGuard:
         Used for both input guard and output guard.
         """
         # 1. Guardrails AI Hub — ToxicLanguage (Detoxify, EN-focused)
-        if _HAS_GUARD:
+        guard = self._guard.get()
+        if guard is not None:
             try:
-                _toxic_guard.validate(text)
+                guard.validate(text)
             except Exception as e:
-                error_msg = str(e)
-                if "Validation failed" in error_msg or "ValidationError" in type(e).__name__:
-                    return False, f"Toxicity detected (Hub): {error_msg[:100]}"
+                if is_validation_failure(e):
+                    return False, f"Toxicity detected (Hub): {str(e)[:100]}"
+                return True, guard_error(e)   # fail open, but not cached as "Clean"
 
         return True, "Clean"
 
@@ -0,0 +1,69 @@
+"""
+Multi-keyword matcher — a keyword trie compiled once into a single regex.
+The trie shape (shared prefixes factored out: นา(?:ย|ง(?:สาว)?)) keeps matching at each
+offset proportional to the keyword length, and the scan runs inside the C regex engine,
+so one pass over the text finds every keyword. Used for PII name keywords and keyword prefilters.
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple, Union
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in node.items() if ch != ""]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            # A keyword ends here but longer ones continue: greedy optional -> longest match wins
+            return ("(?:" + body + ")?") if len(alts) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    keywords: iterable of strings, or {keyword: payload} (payload is returned with each match)
+    ignore_case: case-insensitive matching (offsets refer to the original text)
+    At each offset the longest keyword wins; matches starting at different offsets may overlap.
+    """
+
+    def __init__(self, keywords: Union[Iterable[str], Mapping[str, Any]], ignore_case: bool = True):
+        items = keywords.items() if isinstance(keywords, Mapping) else ((k, None) for k in keywords)
+        self.ignore_case = ignore_case
+        self._payloads: Dict[str, Tuple[str, Any]] = {}
+        for keyword, payload in items:
+            if keyword:
+                self._payloads[self._fold(keyword)] = (keyword, payload)
+
+        flags = re.IGNORECASE if ignore_case else 0
+        trie = _trie_pattern(self._payloads) if self._payloads else r"(?!)"
+        self._search_re = re.compile(trie, flags)
+        self._scan_re = re.compile(f"(?=({trie}))", flags)
+
+    def _fold(self, s: str) -> str:
+        return s.lower() if self.ignore_case else s
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """Yield (start, end, keyword, payload) for every keyword occurrence, in offset order."""
+        for m in self._scan_re.finditer(text):
+            keyword, payload = self._payloads[self._fold(m.group(1))]
+            yield m.start(1), m.end(1), keyword, payload
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str, Any]]:
+        return list(self.iter_matches(text))
+
+    def search(self, text: str) -> bool:
+        """True if any keyword occurs in text."""
+        return self._search_re.search(text) is not None
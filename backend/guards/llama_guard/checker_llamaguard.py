@@ -2,9 +2,13 @@
 Llama Guard 3 8B — Full 15-Category Safety Check (Customized for SRT)
 Uses the actual llama-guard3 model with individually toggleable S1–S15 categories.
 """
-from typing import Tuple, Dict, List
+import re
+from contextlib import aclosing
+from functools import lru_cache
+from typing import Any, Tuple, Dict, List, Optional
 from backend.ollama_service import ollama_service
-from backend.config.settings import LLAMA_GUARD_MODEL
+from backend.guards.singleflight import SingleFlight
+from backend.config.settings import LLAMA_GUARD_MODEL, LLAMA_GUARD_NUM_PREDICT, GUARD_KEEP_ALIVE
 
 
 CATEGORIES = {
@@ -41,21 +45,49 @@ CATEGORIES = {
     "S16": "Profanity, Toxicity, and Sarcasm. Using offensive language, swear words, insults, highly disrespectful language, passive-aggressive sarcasm, or masked words (using symbols to bypass filters). Includes Thai context: คำหยาบ (ไอ้เหี้ย, สัส, ควย, แม่ง, หน้าโง่), คำเลี่ยง (ค_ย, สั*ส, อห.), คำประชดประชัน (บริการหมาไม่แดก, เจริญล่ะ, รถไฟหรือเต่า, บริการดีจังเลยนะเรื่องโง่ๆ). Block any verbal abuse.",
 }
 
-class LlamaGuardChecker:
-    def check(self, text: str, enabled_categories: List[str] = None, role: str = "User") -> Tuple[bool, str]:
-        if enabled_categories is None:
-            enabled_categories = list(CATEGORIES.keys())
-        print(f"🛠️ [DEBUG] Llama Guard is checking {len(enabled_categories)} categories: {enabled_categories}")
-        if not enabled_categories:
-            return True, "No categories enabled — skipped"
+# Guard name (Guardrails AI / NeMo toggles) -> equivalent custom Llama Guard category
+GUARD_TO_LLAMA_CATEGORY = {
+    "competitor": "S14",
+    "off_topic": "S15",
+    "toxicity": "S16",
+}
+
+# Verdict format: "safe" | "unsafe\nS1,S14" — nothing after the category line is ever read.
+# No "\n\n" stop: a reply opening with a blank line would stop empty and fail open; the
+# decode is bounded by num_predict and the stream is closed once _parse_verdict succeeds.
+_GUARD_OPTIONS = {"num_predict": LLAMA_GUARD_NUM_PREDICT, "stop": ["<|eot_id|>"]}
+_CATEGORY_LINE_RE = re.compile(r"^\s*S\d+(?:\s*,\s*S\d+)*\s*$", re.IGNORECASE)
+
+
+def _parse_verdict(text: str, finished: bool) -> Optional[Tuple[bool, str]]:
+    """
+    (is_safe, verdict) once the verdict is complete, else None.
+    A line only counts once its newline arrived (or the stream ended) — "S1" may still become "S14".
+    """
+    lines = text.split("\n")
+    complete = [line for line in (lines if finished else lines[:-1]) if line.strip()]  # blank lines carry nothing
+    if not complete:
+        return None
+    first = complete[0].strip().lower()
+    if "unsafe" not in first:
+        return True, "safe"
+    if len(complete) > 1 and _CATEGORY_LINE_RE.match(complete[1]):
+        return False, f"unsafe\n{complete[1].strip()}"
+    if finished or len(complete) > 1:
+        return False, "\n".join(line.strip() for line in complete).strip()
+    return None
+
 
-        cat_block = "\n".join(
-            f"{k}: {CATEGORIES[k]}"
-            for k in enabled_categories if k in CATEGORIES
-        )
+@lru_cache(maxsize=128)
+def _prompt_prefix(role: str, categories: Tuple[str, ...]) -> str:
+    """
+    Everything before the message — identical for every request with the same (role, category set),
+    so Ollama reuses the KV cache of this prefix and only prefills the message tokens.
+    """
+    cat_block = "\n".join(f"{k}: {CATEGORIES[k]}" for k in categories)
 
-        # 👇 1. เอา [INST] ออก และปรับให้ตรงตาม Standard Llama Guard 3 เป๊ะๆ
-        prompt = f"""Task: Check if there is unsafe, competitor-related, or off-topic content in '{role}' messages. 
+    # 👇 1. เอา [INST] ออก และปรับให้ตรงตาม Standard Llama Guard 3 เป๊ะๆ
+    return f"""Task: Check if there is unsafe, competitor-related, or off-topic content in '{role}' messages. 
 You are a strict guard for the State Railway of Thailand (SRT). Any topic not about trains or SRT is UNSAFE (S15).
 
 <BEGIN UNSAFE CONTENT CATEGORIES>
@@ -81,26 +113,123 @@ S14
 </EXAMPLES OF UNSAFE CONTENT>
 
 <BEGIN CONVERSATION>
-{role}: {text}
+"""
+
+
+@lru_cache(maxsize=128)
+def _compact_prefix(role: str, categories: Tuple[str, ...]) -> str:
+    """Small prompt for the up-front input check of the combined mode: category titles only, no examples."""
+    cat_block = "\n".join(f"{k}: {CATEGORIES[k].split('.')[0]}." for k in categories)
+    return f"""Task: Check if there is unsafe, competitor-related, or off-topic content in '{role}' messages.
+You are a strict guard for the State Railway of Thailand (SRT). Any topic not about trains or SRT is UNSAFE (S15).
+
+<BEGIN UNSAFE CONTENT CATEGORIES>
+{cat_block}
+<END UNSAFE CONTENT CATEGORIES>
+
+<BEGIN CONVERSATION>
+"""
+
+
+def _prompt_suffix(role: str) -> str:
+    return f"""
 <END CONVERSATION>
 
 Provide your safety assessment for {role} in the above conversation:
 - First line must read 'safe' or 'unsafe'.
 - If unsafe, a second line must include a comma-separated list of violated categories."""
-        messages = [{"role": "user", "content": prompt}]
-        response_text = ""
+
+
+def _normalize_categories(enabled_categories: List[str]) -> Tuple[str, ...]:
+    """Same set -> same prefix, whatever order the toggles arrived in."""
+    return tuple(k for k in CATEGORIES if k in enabled_categories)
+
+
+def build_prompt(text: str, enabled_categories: List[str], role: str = "User",
+                 context: Optional[str] = None, compact: bool = False) -> str:
+    """
+    context: the user message this Agent reply answers -> one conversation-level prompt (both turns)
+    compact: short category titles instead of the full definitions + examples
+    """
+    categories = _normalize_categories(enabled_categories)
+    prefix = _compact_prefix(role, categories) if compact else _prompt_prefix(role, categories)
+    conversation = f"{role}: {text}"
+    if context is not None:
+        conversation = f"User: {context}\n\n{conversation}"
+    return prefix + conversation + _prompt_suffix(role)
+
+
+async def _generate_verdict(prompt: str) -> Tuple[str, Optional[Tuple[bool, str]]]:
+    """One Llama Guard call -> (raw output, parsed verdict or None)."""
+    messages = [{"role": "user", "content": prompt}]
+    response_text = ""
+    # Stop reading (and close the upstream request) as soon as the verdict has been parsed
+    async with aclosing(ollama_service.chat_stream(LLAMA_GUARD_MODEL, messages, options=_GUARD_OPTIONS,
+                                                   keep_alive=GUARD_KEEP_ALIVE, purpose="guard")) as stream:
+        async for chunk in stream:
+            response_text += chunk
+            if response_text.startswith("Error calling"):
+                continue
+            verdict = _parse_verdict(response_text, finished=False)
+            if verdict:
+                return response_text, verdict
+    if response_text.startswith("Error calling"):
+        return response_text, None
+    return response_text, _parse_verdict(response_text, finished=True)
+
+
+# Identical concurrent checks from different requests share one call (GUARD_SINGLE_FLIGHT)
+_verdict_flight = SingleFlight("llama_guard", _generate_verdict)
+
+
+class LlamaGuardChecker:
+    async def check(self, text: str, enabled_categories: List[str] = None, role: str = "User",
+                    context: Optional[str] = None, compact: bool = False) -> Tuple[bool, str]:
+        """
+        Separate mode: check(user_text, role="User") then check(reply, role="Agent").
+        Combined mode (LLAMA_GUARD_MODE): check(user_text, compact=True) up front, then one
+        conversation-level check(reply, role="Agent", context=user_text) on the full prefix.
+        """
+        if enabled_categories is None:
+            enabled_categories = list(CATEGORIES.keys())
+        print(f"🛠️ [DEBUG] Llama Guard is checking {len(enabled_categories)} categories: {enabled_categories}")
+        if not enabled_categories:
+            return True, "No categories enabled — skipped"
+
+        prompt = build_prompt(text, enabled_categories, role, context=context, compact=compact)
         try:
-            for chunk in ollama_service.chat_stream(LLAMA_GUARD_MODEL, messages):
-                response_text += chunk
+            response_text, verdict = await _verdict_flight.submit(prompt, prompt)
         except Exception as e:
             return True, f"Llama Guard check failed (skipped): {str(e)}"
+        if response_text.startswith("Error calling"):
+            return True, f"Llama Guard check failed (skipped): {response_text}"
+        if verdict is None:
+            return True, "Llama Guard check failed (skipped): empty response"
 
         # 👇 2. เพิ่ม DEBUG Print จะได้เห็นว่า Llama Guard ตอบอะไรกลับมาจริงๆ!
         print(f"🧐 [DEBUG Llama Guard 3] Raw Output:\n{response_text.strip()}")
 
-        first_line = response_text.strip().split("\n")[0].lower()
-        if "unsafe" in first_line:
-            return False, f"Llama Guard 3: {response_text.strip()}"
+        is_safe, parsed = verdict
+        if not is_safe:
+            return False, f"Llama Guard 3: {parsed}"
         return True, "Llama Guard 3: Safe"
 
+    async def warm_up(self) -> Dict[str, Any]:
+        """
+        Load the model and prefill the default (User / Agent, all categories) prefixes once, so the first
+        real check only pays for its message tokens. Best-effort: Ollama being down is not an error.
+        """
+        reply = ""
+        for role in ("User", "Agent"):
+            messages = [{"role": "user", "content": build_prompt("", list(CATEGORIES), role)}]
+            try:
+                async for chunk in ollama_service.chat_stream(LLAMA_GUARD_MODEL, messages, options={"num_predict": 1},
+                                                              keep_alive=GUARD_KEEP_ALIVE, purpose="guard"):
+                    reply += chunk
+            except Exception as e:
+                reply = f"Error calling Ollama: {e}"
+            if reply.startswith("Error calling"):
+                break
+        return {"prefix_warm": not reply.startswith("Error calling")}
+
 llama_guard_checker = LlamaGuardChecker()
\ No newline at end of file
@@ -1,46 +1,131 @@
 """
 Llama Guard 3 8B — PII Detection Guard
 Comprehensive regex patterns for Thai PII.
+All patterns are compiled once into a single alternation of named groups, so a message is
+scanned in one pass; name keywords are found with a trie-compiled KeywordMatcher.
 """
 import re
-from typing import Tuple, List
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from backend.guards.keyword_matcher import KeywordMatcher
+
+
+@dataclass(frozen=True)
+class PIISpan:
+    type: str           # e.g. "PHONE", "ID_CARD", "NAME"
+    start: int
+    end: int
+    text: str
+    via: str = ""       # NAME only: the keyword that introduced the name
+
+
+# Alternation order = priority when two patterns match at the same offset
+# (keyword-prefixed patterns first, then longer digit runs before shorter ones).
+PII_PATTERNS: Dict[str, str] = {
+    "EMAIL":         r"[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}",
+    "BANK_ACCOUNT":  r"(?:เลขบัญชี|บัญชี|account)\s*[:：]?\s*\d{3}[-\s]?\d{1}[-\s]?\d{5}[-\s]?\d{1}",
+    "DOB":           r"(?:เกิด|วันเกิด|born)\s*[:：]?\s*\d{1,2}[-/.\s]\d{1,2}[-/.\s]\d{2,4}",
+    "LINE_ID":       r"(?:line|ไลน์|ไอดี)\s*[:：]?\s*[@]?[a-zA-Z0-9._\-]{3,}",
+    "ADDRESS":       r"(?:บ้านเลขที่|ที่อยู่|ซอย|ถนน|ตำบล|อำเภอ|จังหวัด)\s*[:：]?\s*\S+",
+    "CREDIT_CARD":   r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b",
+    "ID_CARD":       r"\b\d{1}[-\s]?\d{4}[-\s]?\d{5}[-\s]?\d{2}[-\s]?\d{1}\b",   # also covers 13 raw digits
+    "PHONE":         r"(?:0[689]\d{1}[-.\s]?\d{3}[-.\s]?\d{4}|0[2-9]\d{1}[-.\s]?\d{3}[-.\s]?\d{4})",
+    "PASSPORT":      r"\b[A-Z]{1,2}\d{6,8}\b",
+}
+
+NAME_KEYWORDS = ["ชื่อ", "นามสกุล", "นาย", "นาง", "นางสาว", "ด.ช.", "ด.ญ.", "คุณ"]
+
+# "คุณ" is also part of everyday words (ขอบคุณ, คุณภาพ, ...) — not a name introducer there
+_NAME_NOT_AFTER = {"คุณ": ("ขอบ",)}
+_NAME_NOT_BEFORE = {"คุณ": ("ภาพ", "สมบัติ", "ค่า", "ประโยชน์")}
+
+# Every character a PII_PATTERNS match can start with. The leading lookahead lets the regex
+# engine reject most offsets with one set test instead of trying each alternative in turn.
+# Keep in sync when adding a pattern.
+_PII_FIRST_CHARS = r"a-zA-Z0-9._%+\-เบวไทซถตอจ"
+
+_PII_RE = re.compile(
+    f"(?=[{_PII_FIRST_CHARS}])(?:"
+    + "|".join(f"(?P<{name}>{pattern})" for name, pattern in PII_PATTERNS.items())
+    + ")",
+    re.IGNORECASE,
+)
+# NAME = one short standalone token. Thai is written without spaces, so a longer letter run
+# after the keyword is the rest of the sentence ("คุณช่วยบอกเวลารถไฟหน่อย"), not a name.
+_NAME_TAIL_RE = re.compile(r"\s*[:：]?\s*([\u0E00-\u0E7Fa-zA-Z]{3,12})(?![\u0E00-\u0E7Fa-zA-Z])")
+_HAS_DIGIT_RE = re.compile(r"\d")
+_NAME_MATCHER = KeywordMatcher(NAME_KEYWORDS, ignore_case=False)
+
 
 class PIIGuard:
     def __init__(self):
-        self.patterns = {
-            "PHONE":         r"(?:0[689]\d{1}[-.\s]?\d{3}[-.\s]?\d{4}|0[2-9]\d{1}[-.\s]?\d{3}[-.\s]?\d{4})",
-            "ID_CARD":       r"\b\d{1}[-\s]?\d{4}[-\s]?\d{5}[-\s]?\d{2}[-\s]?\d{1}\b",
-            "ID_CARD_RAW":   r"\b\d{13}\b",
-            "EMAIL":         r"[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}",
-            "CREDIT_CARD":   r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b",
-            "BANK_ACCOUNT":  r"(?:เลขบัญชี|บัญชี|account)\s*[:：]?\s*\d{3}[-\s]?\d{1}[-\s]?\d{5}[-\s]?\d{1}",
-            "PASSPORT":      r"\b[A-Z]{1,2}\d{6,8}\b",
-            "LINE_ID":       r"(?:line|ไลน์|ไอดี)\s*[:：]?\s*[@]?[a-zA-Z0-9._\-]{3,}",
-            "DOB":           r"(?:เกิด|วันเกิด|born)\s*[:：]?\s*\d{1,2}[-/.\s]\d{1,2}[-/.\s]\d{2,4}",
-            "ADDRESS":       r"(?:บ้านเลขที่|ที่อยู่|ซอย|ถนน|ตำบล|อำเภอ|จังหวัด)\s*[:：]?\s*\S+",
-        }
-
-        self.name_keywords = [
-            "ชื่อ", "นามสกุล", "นาย", "นาง", "นางสาว", "ด.ช.", "ด.ญ.", "คุณ",
-        ]
+        self.patterns = PII_PATTERNS
+        self.name_keywords = NAME_KEYWORDS
+
+    def find(self, text: str) -> List[PIISpan]:
+        """All PII spans (non-overlapping, sorted by offset)."""
+        spans = [PIISpan(m.lastgroup, m.start(), m.end(), m.group()) for m in _PII_RE.finditer(text)]
+
+        for kw_start, kw_end, keyword, _ in _NAME_MATCHER.iter_matches(text):
+            if text[:kw_start].endswith(_NAME_NOT_AFTER.get(keyword, ())):
+                continue
+            if text.startswith(_NAME_NOT_BEFORE.get(keyword, ()), kw_end):
+                continue
+            m = _NAME_TAIL_RE.match(text, kw_end)
+            if not m:
+                continue
+            start, end = m.start(1), m.end(1)
+            if any(s.start < end and start < s.end for s in spans):
+                continue  # already inside a typed span (e.g. ADDRESS)
+            spans.append(PIISpan("NAME", start, end, text[start:end], via=keyword))
+
+        spans.sort(key=lambda s: s.start)
+        return spans
 
     def scan(self, text: str) -> Tuple[bool, str]:
-        found: List[str] = []
-        for pii_type, pattern in self.patterns.items():
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                found.append(f"{pii_type}: {len(matches)}")
-
-        for keyword in self.name_keywords:
-            if keyword in text:
-                pattern = rf"{re.escape(keyword)}\s*[:：]?\s*([\u0E00-\u0E7Fa-zA-Z]+\s*[\u0E00-\u0E7Fa-zA-Z]*)"
-                match = re.search(pattern, text)
-                if match and len(match.group(1).strip()) > 2:
-                    found.append(f"NAME(via '{keyword}')")
-                    break
-
-        if found:
-            return False, ", ".join(found)
-        return True, "No PII detected"
+        spans = self.find(text)
+        if not spans:
+            return True, "No PII detected"
+
+        counts: Dict[str, int] = {}
+        name_via = ""
+        for span in spans:
+            if span.type == "NAME":
+                name_via = name_via or span.via
+            else:
+                counts[span.type] = counts.get(span.type, 0) + 1
+        found = [f"{pii_type}: {n}" for pii_type, n in counts.items()]
+        if name_via:
+            found.append(f"NAME(via '{name_via}')")
+        return False, ", ".join(found)
+
+    def redact(self, text: str) -> Tuple[str, Dict[str, str]]:
+        """
+        Replace every PII span with a typed placeholder -> (redacted_text, {placeholder: original}).
+        Numbered per type ([PHONE_1], [PHONE_2]); the same value reuses its placeholder.
+        ADDRESS spans without a number (a street / district / province name) are left as is —
+        they are usually the route being asked about, not someone's address.
+        """
+        spans = [s for s in self.find(text) if s.type != "ADDRESS" or _HAS_DIGIT_RE.search(s.text)]
+        if not spans:
+            return text, {}
+
+        placeholders: Dict[Tuple[str, str], str] = {}
+        counts: Dict[str, int] = {}
+        parts: List[str] = []
+        pos = 0
+        for span in spans:
+            if span.start < pos:
+                continue  # NAME span inside an earlier typed span
+            key = (span.type, span.text)
+            if key not in placeholders:
+                counts[span.type] = counts.get(span.type, 0) + 1
+                placeholders[key] = f"[{span.type}_{counts[span.type]}]"
+            parts.append(text[pos:span.start])
+            parts.append(placeholders[key])
+            pos = span.end
+        parts.append(text[pos:])
+        return "".join(parts), {ph: original for (_, original), ph in placeholders.items()}
 
 pii_guard = PIIGuard()
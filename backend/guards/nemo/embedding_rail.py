@@ -0,0 +1,179 @@
+"""
+Embedding Rail — in-process nearest-intent classifier for NeMo `emb` mode.
+Same idea as NeMo's `embeddings_only` dialog rail, without the LLMRails flow machinery:
+- the `user said "..."` examples of every intent flow in rails.co are embedded once
+- a message is embedded once and compared to all examples with one NumPy mat-vec product
+- nearest intent >= embeddings_only_similarity_threshold (config.yml, 0.4) wins,
+  otherwise the fallback intent ("user said something safe")
+Intents named "<user|bot> expressed <guard>" map to guard types (e.g. off topic -> off_topic).
+
+The example embeddings are persisted to NEMO_EMB_INDEX_DIR as <model>-<hash>.npy (+ .json),
+keyed by a hash of rails.co + the embedding model, and memory-mapped on load — new workers
+skip the embedding pass entirely; after a rails.co edit only new/changed examples are embedded.
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config.settings import FRAMEWORK_INFO, NEMO_EMB_INDEX_DIR
+from backend.embeddings import embedder
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+_CONFIG_DIR = Path(__file__).parent.parent.parent / "config" / "nemo"
+_FLOW = re.compile(r"^flow\s+(.+?)\s*$")
+_USER_SAID = re.compile(r'user said\s+"((?:[^"\\]|\\.)*)"')
+_GUARD_INTENT = re.compile(r"^(?:user|bot) expressed (.+)$")
+
+
+def parse_intent_examples(colang: str) -> Dict[str, List[str]]:
+    """{intent flow name: [example utterances]} for every flow made of `user said "..."` lines."""
+    intents: Dict[str, List[str]] = {}
+    flow = None
+    for line in colang.splitlines():
+        m = _FLOW.match(line)
+        if m:
+            flow = m.group(1)
+            continue
+        if flow is None or line.lstrip().startswith("#"):
+            continue
+        for example in _USER_SAID.findall(line):
+            intents.setdefault(flow, []).append(example.replace('\\"', '"'))
+    return intents
+
+
+def intent_guard(intent: str) -> Optional[str]:
+    """"user expressed off topic" -> "off_topic"; non-guard intents (greeting, safe) -> None."""
+    m = _GUARD_INTENT.match(intent)
+    guard = m.group(1).strip().replace(" ", "_") if m else None
+    return guard if guard in FRAMEWORK_INFO["nemo"]["supports"] else None
+
+
+# Bumped when the stored vectors change meaning (2: examples embedded as written, not NFKC-casefolded)
+_INDEX_VERSION = 2
+
+
+def _write_atomic(path: Path, write):
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class EmbeddingRail:
+    def __init__(self, config_dir: Path = _CONFIG_DIR, index_dir: str = NEMO_EMB_INDEX_DIR):
+        self.config_dir = config_dir
+        self.index_dir = Path(index_dir)
+        self.threshold = 0.4
+        self.fallback_intent = "user said something safe"
+        self.intents: List[str] = []
+        self._example_intent: Optional[np.ndarray] = None   # example row -> index into self.intents
+        self._matrix: Optional[np.ndarray] = None           # (n_examples, dim), L2-normalized
+
+    def _load_config(self):
+        if yaml is None:
+            return
+        with open(self.config_dir / "config.yml", "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+        user_messages = config.get("rails", {}).get("dialog", {}).get("user_messages", {})
+        self.threshold = float(user_messages.get("embeddings_only_similarity_threshold", self.threshold))
+        self.fallback_intent = user_messages.get("embeddings_only_fallback_intent", self.fallback_intent)
+
+    def _model_prefix(self) -> str:
+        return re.sub(r"[^A-Za-z0-9._-]+", "_", embedder.model)
+
+    def _load_index(self, digest: str, examples: List[str]) -> Optional[np.ndarray]:
+        npy = self.index_dir / f"{self._model_prefix()}-{digest}.npy"
+        meta = npy.with_suffix(".json")
+        if not (npy.exists() and meta.exists()):
+            return None
+        try:
+            info = json.loads(meta.read_text(encoding="utf-8"))
+            if info.get("version") != _INDEX_VERSION or info.get("examples") != examples:
+                return None
+            return np.load(npy, mmap_mode="r")
+        except Exception as e:
+            print(f"[NeMo] WARN Ignoring unreadable embedding index {npy.name}: {e}")
+            return None
+
+    def _previous_vectors(self) -> Dict[str, np.ndarray]:
+        """example -> vector from earlier indexes of the same embedding model."""
+        reuse: Dict[str, np.ndarray] = {}
+        for meta in self.index_dir.glob(f"{self._model_prefix()}-*.json"):
+            try:
+                info = json.loads(meta.read_text(encoding="utf-8"))
+                if info.get("version") != _INDEX_VERSION:
+                    continue
+                old_examples = info["examples"]
+                matrix = np.load(meta.with_suffix(".npy"), mmap_mode="r")
+                if matrix.shape[0] == len(old_examples):
+                    reuse.update(zip(old_examples, matrix))
+            except Exception:
+                continue
+        return reuse
+
+    async def _build_index(self, digest: str, examples: List[str]) -> np.ndarray:
+        reuse = self._previous_vectors() if self.index_dir.exists() else {}
+        missing = [ex for ex in dict.fromkeys(examples) if ex not in reuse]
+        if missing:
+            reuse.update(zip(missing, await embedder.embed(missing)))
+        matrix = np.vstack([np.asarray(reuse[ex], dtype=np.float32) for ex in examples])
+        print(f"[NeMo] Embedding index built: {len(missing)} embedded, {len(examples) - len(missing)} reused")
+
+        try:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            npy = self.index_dir / f"{self._model_prefix()}-{digest}.npy"
+            meta = npy.with_suffix(".json")
+            _write_atomic(npy, lambda f: np.save(f, matrix))
+            _write_atomic(meta, lambda f: f.write(json.dumps(
+                {"version": _INDEX_VERSION, "model": embedder.model, "examples": examples}, ensure_ascii=False).encode("utf-8")))
+            # Drop indexes of older rails.co versions for this model
+            for old in self.index_dir.glob(f"{self._model_prefix()}-*"):
+                if old.stem != npy.stem and old.suffix in (".npy", ".json"):
+                    old.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"[NeMo] WARN Could not persist embedding index: {e}")
+        return matrix
+
+    async def load(self):
+        """Parse rails.co and load (or build) the example embedding index."""
+        self._load_config()
+        colang = (self.config_dir / "rails.co").read_text(encoding="utf-8")
+        intents = parse_intent_examples(colang)
+        examples = [ex for exs in intents.values() for ex in exs]
+        digest = hashlib.sha256(f"{embedder.model}\0{colang}".encode("utf-8")).hexdigest()[:16]
+        matrix = self._load_index(digest, examples)
+        if matrix is None:
+            matrix = await self._build_index(digest, examples)
+        self._matrix = matrix
+        self.intents = list(intents)
+        self._example_intent = np.repeat(np.arange(len(intents)), [len(exs) for exs in intents.values()])
+        print(f"[NeMo] Embedding rail ready: {len(self.intents)} intents, {len(examples)} examples")
+
+    @property
+    def ready(self) -> bool:
+        return self._matrix is not None
+
+    async def classify(self, text: str) -> Tuple[str, float, Optional[str]]:
+        """-> (intent, similarity, guard type or None)."""
+        if self._matrix is None:
+            await self.load()
+        sims = self._matrix @ await embedder.embed_one(text)
+        best = int(np.argmax(sims))
+        similarity = float(sims[best])
+        if similarity < self.threshold:
+            return self.fallback_intent, similarity, None
+        intent = self.intents[self._example_intent[best]]
+        return intent, similarity, intent_guard(intent)
+
+
+# Global instance
+embedding_rail = EmbeddingRail()
@@ -0,0 +1,105 @@
+"""
+Keyword prefilter — a compiled keyword tier in front of the LLM-based guards.
+One KeywordMatcher pass over the message:
+  - sure-block keywords (competitor names, Thai profanity, lottery...) decide the verdict
+    without the LLM round trip of CompetitorCheck / RestrictToTopic / Llama Guard S14-S16
+  - sure-allow railway vocabulary lets PREFILTER_ALLOW_SKIP guards (off_topic / S15) be skipped
+    (opt-in, empty by default: a railway word does not make the rest of the message on-topic)
+  - anything else falls through to the LLM guard unchanged
+Guards are named like the toggles (competitor, off_topic, toxicity) or by Llama Guard category (S14-S16).
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from backend.config.settings import PREFILTER_ENABLED, PREFILTER_ALLOW_SKIP, PURE_FRAMEWORK_MODE
+from backend.guards.keyword_matcher import KeywordMatcher
+from backend.guards.llama_guard.checker_llamaguard import GUARD_TO_LLAMA_CATEGORY
+
+
+# Only unambiguous keywords — a false positive here blocks without any LLM second opinion.
+# Latin brand names that are also everyday English words (grab a seat, bolt the door, Uber-)
+# are left to the LLM competitor guard; their Thai spellings are unambiguous.
+SURE_BLOCK: Dict[str, List[str]] = {
+    "competitor": [
+        "แอร์เอเชีย", "AirAsia", "Air Asia", "นกแอร์", "Nok Air", "ไทยไลอ้อนแอร์", "ไลอ้อนแอร์", "Thai Lion Air",
+        "นครชัยแอร์", "Nakhonchai Air", "แกร็บ", "โบลท์", "อูเบอร์",
+    ],
+    "toxicity": ["เหี้ย", "สัส", "ควย", "หน้าโง่", "fuck", "shit"],
+    "off_topic": ["หวย", "เลขเด็ด", "ดูดวง"],
+}
+
+# Railway vocabulary: a message using it is on-topic enough to skip the off-topic LLM call.
+# Thai SRT terms only — generic words ("train", "SRT", บางซื่อ as a district) also appear in
+# off-topic messages ("how do I train my dog", "write an SRT subtitle file").
+SURE_ALLOW: List[str] = [
+    "รถไฟ", "การรถไฟ", "รฟท", "ขบวนรถ", "สถานีรถไฟ", "ชานชาลา", "ตู้นอน", "กรุงเทพอภิวัฒน์",
+]
+
+# Longer words that contain a sure-allow keyword but are not about the railway; the longest
+# keyword wins at an offset, so these shadow the shorter match (รถไฟเหาะ = roller coaster)
+NOT_ALLOW: List[str] = ["รถไฟเหาะ"]
+
+_CATEGORY_TO_GUARD = {category: guard for guard, category in GUARD_TO_LLAMA_CATEGORY.items()}
+
+
+@dataclass
+class PrefilterVerdict:
+    blocked: Optional[str] = None           # guard / category decided by a sure-block keyword
+    keyword: Optional[str] = None           # the sure-block keyword
+    skipped: Set[str] = field(default_factory=set)   # guards / categories sure-allow lets skip
+    allow_keyword: Optional[str] = None     # the railway keyword that allowed the skip
+
+
+class KeywordPrefilter:
+    def __init__(self, allow_skip: Iterable[str] = PREFILTER_ALLOW_SKIP):
+        keywords = {kw: ("block", guard) for guard, kws in SURE_BLOCK.items() for kw in kws}
+        keywords.update({kw: ("allow", None) for kw in SURE_ALLOW})
+        keywords.update({kw: ("none", None) for kw in NOT_ALLOW})
+        self._matcher = KeywordMatcher(keywords)
+        self.allow_skip = set(allow_skip)
+
+    @property
+    def enabled(self) -> bool:
+        # Evaluation runs of the pure frameworks must not be short-circuited
+        return PREFILTER_ENABLED and not PURE_FRAMEWORK_MODE
+
+    @staticmethod
+    def _bounded(text: str, start: int, end: int) -> bool:
+        """Latin keywords must be whole words (Grab, not 'grabbed'); Thai has no word spaces."""
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        latin = text[start].isascii() and text[start].isalnum()
+        return not latin or not ((before.isascii() and before.isalnum()) or (after.isascii() and after.isalnum()))
+
+    def check(self, text: str, guards: Iterable[str]) -> PrefilterVerdict:
+        """
+        guards: the guards / categories of this pass, in priority order.
+        Returns the highest-priority sure-block hit, else the guards sure-allow lets skip.
+        """
+        guards = list(guards)
+        verdict = PrefilterVerdict()
+        if not self.enabled or not guards:
+            return verdict
+
+        blocked: Dict[str, str] = {}
+        for start, end, keyword, (tier, guard) in self._matcher.iter_matches(text):
+            if not self._bounded(text, start, end):
+                continue
+            if tier == "block":
+                blocked.setdefault(guard, keyword)
+            elif tier == "allow" and verdict.allow_keyword is None:
+                verdict.allow_keyword = keyword
+
+        for name in guards:
+            guard = _CATEGORY_TO_GUARD.get(name, name)
+            if guard in blocked:
+                verdict.blocked, verdict.keyword = name, blocked[guard]
+                return verdict
+
+        if verdict.allow_keyword:
+            verdict.skipped = {name for name in guards if _CATEGORY_TO_GUARD.get(name, name) in self.allow_skip}
+        return verdict
+
+
+# Global instance
+keyword_prefilter = KeywordPrefilter()
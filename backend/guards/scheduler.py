@@ -0,0 +1,81 @@
+"""
+Guard Scheduler — runs a framework's enabled guards concurrently.
+Sync (CPU-bound / blocking) guards go to a shared thread pool, async (LLM-backed) guards are awaited.
+Priority is the order of the task list: the reported violation is always the highest-priority
+guard that blocks, exactly as if the guards had run one after another, and everything still
+running is cancelled as soon as that verdict is known.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+from backend.config.settings import GUARD_MAX_WORKERS
+
+# Guardrails AI validators hold models/clients that don't pickle, so a thread pool
+# (not a process pool) is used; Detoxify/torch and HTTP calls release the GIL anyway.
+_executor = ThreadPoolExecutor(max_workers=GUARD_MAX_WORKERS, thread_name_prefix="guard")
+
+
+@dataclass
+class GuardTask:
+    name: str                                   # guard name, e.g. "pii", "off_topic"
+    fn: Callable[[], Any]                       # returns (is_safe, details) — sync or coroutine function
+    is_async: bool = False                      # True: awaited on the loop, False: run in the thread pool
+
+
+@dataclass
+class GuardOutcome:
+    name: str
+    is_safe: bool
+    details: str
+    latency: float
+
+
+async def run_in_pool(fn: Callable[[], Any]) -> Any:
+    """Run a sync guard call on the shared guard thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, fn)
+
+
+async def _run(task: GuardTask) -> GuardOutcome:
+    start = time.time()
+    if task.is_async:
+        is_safe, details = await task.fn()
+    else:
+        is_safe, details = await run_in_pool(task.fn)
+    return GuardOutcome(task.name, is_safe, details, time.time() - start)
+
+
+async def run_guards(tasks: List[GuardTask]) -> Tuple[Optional[GuardOutcome], List[GuardOutcome]]:
+    """
+    Run all tasks concurrently.
+
+    Returns (violation, outcomes):
+      - violation: the first blocking outcome in priority (list) order, or None if all passed
+      - outcomes: every outcome that completed before the decision
+    A blocking verdict from a lower-priority guard is held until every higher-priority
+    guard has passed; the remaining tasks are then cancelled (thread-pool work is abandoned).
+    """
+    if not tasks:
+        return None, []
+
+    futures = {asyncio.ensure_future(_run(task)): idx for idx, task in enumerate(tasks)}
+    results: List[Optional[GuardOutcome]] = [None] * len(tasks)
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                results[futures[fut]] = fut.result()
+
+            for outcome in results:
+                if outcome is None:
+                    break  # a higher-priority guard is still running
+                if not outcome.is_safe:
+                    return outcome, [r for r in results if r is not None]
+        return None, [r for r in results if r is not None]
+    finally:
+        for fut in pending:
+            fut.cancel()
@@ -0,0 +1,87 @@
+"""
+Guard single-flight dedupe (not batching) — concurrent identical guard model calls (same prompt, e.g. a popular FAQ
+arriving from several requests at once) share one upstream call instead of each sending it.
+No batching window: the first caller dispatches immediately, later identical callers join it
+while it is in flight. Ollama has no multi-prompt endpoint, so distinct prompts are simply sent
+concurrently and land on OLLAMA_NUM_PARALLEL slots on their own.
+A call whose waiters were all cancelled (e.g. a higher-priority guard already blocked) is aborted.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from backend.config.settings import GUARD_SINGLE_FLIGHT
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str, call: Callable[..., Awaitable[Any]], enabled: bool = GUARD_SINGLE_FLIGHT):
+        """call: coroutine function making one model call"""
+        self.name = name
+        self.enabled = enabled
+        self._call = call
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.calls = 0
+        self.submitted = 0
+        self.shared = 0
+        _registry[name] = self
+
+    async def submit(self, key: Hashable, *args: Any) -> Any:
+        """Run call(*args), or join the in-flight call with the same `key`."""
+        if not self.enabled:
+            return await self._call(*args)
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A flight never spans event loops (tests / worker restarts)
+            self._inflight, self._loop = {}, loop
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = self._inflight[key] = _Flight(loop.create_task(self._call(*args)))
+            flight.task.add_done_callback(lambda task, k=key, f=flight: self._landed(k, f))
+            self.calls += 1
+        else:
+            self.shared += 1
+        flight.waiters += 1
+        self.submitted += 1
+
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody wants it any more: close the upstream request, and don't let a new caller join it
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                flight.task.cancel()
+            raise
+
+    def _landed(self, key: Hashable, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.task.cancelled():
+            flight.task.exception()  # retrieved even if nobody waits any more
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "submitted": self.submitted,
+            "shared": self.shared,
+        }
+
+
+_registry: Dict[str, SingleFlight] = {}
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: flight.stats() for name, flight in _registry.items()}
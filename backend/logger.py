@@ -1,37 +1,191 @@
+"""
+Log bus for the /ws/logs panel and the console.
+log() only appends the event to a ring buffer and to each subscriber's bounded queue; every
+subscriber (one per WebSocket, plus the console) has its own sender task, so a stalled browser
+tab drops its own events (LOG_QUEUE_POLICY) instead of slowing /chat down.
+Events carry a sequence number: a client connecting with ?after=<seq> gets only what it missed.
+"""
 import asyncio
-import json
+import sys
+from collections import deque
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
 
 from fastapi import WebSocket
 
+from backend.config.settings import (
+    LOG_HISTORY_SIZE, LOG_QUEUE_SIZE, LOG_QUEUE_POLICY,
+    LOG_BATCH_FRAMES, LOG_BATCH_MAX, LOG_BATCH_WINDOW_MS, LOG_CONSOLE,
+)
+
+
+def _drop_notice(dropped: int) -> Dict[str, Any]:
+    # Dropped events are coalesced into one notice instead of vanishing silently
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "step": "System",
+        "status": "info",
+        "details": f"{dropped} log events dropped (slow consumer)",
+        "latency": 0.0,
+        "metrics": {},
+        "blocked": False,
+    }
+
+
+class _Subscriber:
+    def __init__(self, name: str, send: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+                 maxsize: int = LOG_QUEUE_SIZE, policy: str = LOG_QUEUE_POLICY):
+        self.name = name
+        self._send = send
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.queue: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.pending_drops = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def offer(self, message: Dict[str, Any]):
+        """Enqueue without blocking; on overflow drop per policy."""
+        if len(self.queue) >= self.maxsize:
+            self.pending_drops += 1
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return
+            self.queue.popleft()
+        self.queue.append(message)
+        self._wakeup.set()
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        frame = [self.queue.popleft() for _ in range(min(limit, len(self.queue)))]
+        if self.pending_drops:
+            frame.insert(0, _drop_notice(self.pending_drops))
+            self.pending_drops = 0
+        return frame
+
+    async def run(self, batch_max: int, window: float):
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if window > 0 and len(self.queue) < batch_max:
+                await asyncio.sleep(window)   # let the rest of a request's burst arrive
+            frame = self._take(batch_max)
+            await self._send(frame)
+            self.sent += len(frame)
+
+    def start(self, batch_max: int, window: float):
+        self.task = asyncio.get_running_loop().create_task(self.run(batch_max, window))
+        # A failed send (closed socket) just ends this subscriber; retrieve the error so it isn't reported as unhandled
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "queued": len(self.queue), "sent": self.sent, "dropped": self.dropped}
+
+
+def _console_line(message: Dict[str, Any]) -> str:
+    """Console: show duration and resources when present."""
+    details, latency, metrics = message["details"], message["latency"], message["metrics"]
+    extra = ""
+    if latency > 0:
+        extra = f" ({latency:.2f}s)"
+
+    # Only add auto-metrics to console if details is NOT multiline
+    if metrics and "\n" not in details:
+        parts = []
+        if metrics.get("cpu_percent") is not None:
+            parts.append(f"CPU {metrics['cpu_percent']}%")
+
+        if metrics.get("ram_used_gb") is not None:
+            ram_str = f"RAM {metrics['ram_used_gb']}GB"
+            if metrics.get("ram_total_gb"):
+                ram_str += f"/{metrics['ram_total_gb']}GB"
+            if metrics.get("ram_percent") is not None:
+                ram_str += f" ({metrics['ram_percent']}%)"
+            parts.append(ram_str)
+
+        if metrics.get("process_mem_mb") is not None:
+            parts.append(f"App {metrics['process_mem_mb']}MB")
+
+        if metrics.get("gpu_mem_mb") is not None:
+            gpu_str = f"GPU {metrics['gpu_mem_mb']}MB"
+            if metrics.get("gpu_mem_gb"):
+                gpu_str += f" ({metrics['gpu_mem_gb']}GB)"
+            if metrics.get("gpu_percent") is not None:
+                gpu_str += f" {metrics['gpu_percent']}%"
+            parts.append(gpu_str)
+
+        if parts:
+            extra += " [" + " | ".join(parts) + "]"
+    if message["blocked"]:
+        extra += " [BLOCKED]"
+    time_str = message["timestamp"][11:19]
+    return f"[{time_str}] [{message['step'].upper()}] [{message['status'].upper()}] {details}{extra}"
+
+
+def _write_console(frame: List[Dict[str, Any]]):
+    sys.stdout.write("".join(_console_line(m) + "\n" for m in frame))
+    sys.stdout.flush()
+
+
 class LogManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.history: List[Dict[str, Any]] = []
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=max(1, LOG_HISTORY_SIZE))
+        self._sockets: Dict[WebSocket, _Subscriber] = {}
+        self._console: Optional[_Subscriber] = None
+        self._seq = 0
+        self.batch_max = max(1, LOG_BATCH_MAX) if LOG_BATCH_FRAMES else 1
+        self.window = LOG_BATCH_WINDOW_MS / 1000 if LOG_BATCH_FRAMES else 0.0
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, after: Optional[int] = None):
+        """Accept and subscribe; replay history newer than `after` (all of it if None or from an older server run)."""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        # Send history upon connection if needed
-        # for log in self.history:
-        #     await websocket.send_json(log)
+
+        async def send(frame: List[Dict[str, Any]]):
+            if LOG_BATCH_FRAMES:
+                await websocket.send_json(frame)
+            else:
+                for message in frame:
+                    await websocket.send_json(message)
+
+        subscriber = _Subscriber(f"ws:{id(websocket):x}", send)
+        if after is None or after > self._seq:
+            after = 0
+        for message in self.history:
+            if message["seq"] > after:
+                subscriber.offer(message)
+        self._sockets[websocket] = subscriber
+        subscriber.start(self.batch_max, self.window)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        subscriber = self._sockets.pop(websocket, None)
+        if subscriber is not None and subscriber.task is not None:
+            subscriber.task.cancel()
+
+    def _ensure_console(self):
+        if not LOG_CONSOLE:
+            return
+        loop = asyncio.get_running_loop()
+        if self._console is not None and self._console.task.get_loop() is loop and not self._console.task.done():
+            return
+
+        async def write(frame: List[Dict[str, Any]]):
+            # stdout can block (pipes, slow terminals): write from a worker thread
+            await asyncio.to_thread(_write_console, frame)
+
+        self._console = _Subscriber("console", write, maxsize=max(LOG_QUEUE_SIZE, 10000))
+        self._console.start(max(1, LOG_BATCH_MAX), 0.0)
 
-    async def broadcast(self, message: Dict[str, Any]):
+    def broadcast(self, message: Dict[str, Any]):
+        """Record and fan out one event — never awaits."""
+        self._seq += 1
+        message["seq"] = self._seq
         self.history.append(message)
-        # Keep history manageable
-        if len(self.history) > 100:
-            self.history.pop(0)
-            
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                # Handle broken connections generally by removing them in disconnect
-                pass
+        if self._console is not None:
+            self._console.offer(message)
+        for subscriber in self._sockets.values():
+            subscriber.offer(message)
 
     async def log(self, step: str, status: str, details: str, latency: float = 0.0, metrics: Dict[str, Any] | None = None, blocked: bool = False):
         """
@@ -52,45 +206,29 @@ class LogManager:
             "metrics": metrics or {},
             "blocked": blocked,
         }
-        # Console: show duration and resources when present
-        extra = ""
-        if latency > 0:
-            extra = f" ({latency:.2f}s)"
-        if latency > 0:
-            extra = f" ({latency:.2f}s)"
-        
-        # Only add auto-metrics to console if details is NOT multiline
-        if metrics and "\n" not in details:
-            parts = []
-            if metrics.get("cpu_percent") is not None:
-                cpu_str = f"CPU {metrics['cpu_percent']}%"
-                parts.append(cpu_str)
-
-            if metrics.get("ram_used_gb") is not None:
-                ram_str = f"RAM {metrics['ram_used_gb']}GB"
-                if metrics.get("ram_total_gb"):
-                    ram_str += f"/{metrics['ram_total_gb']}GB"
-                if metrics.get("ram_percent") is not None:
-                    ram_str += f" ({metrics['ram_percent']}%)"
-                parts.append(ram_str)
-            
-            if metrics.get("process_mem_mb") is not None:
-                parts.append(f"App {metrics['process_mem_mb']}MB")
-
-            if metrics.get("gpu_mem_mb") is not None:
-                gpu_str = f"GPU {metrics['gpu_mem_mb']}MB"
-                if metrics.get("gpu_mem_gb"):
-                    gpu_str += f" ({metrics['gpu_mem_gb']}GB)"
-                if metrics.get("gpu_percent") is not None:
-                    gpu_str += f" {metrics['gpu_percent']}%"
-                parts.append(gpu_str)
-            
-            if parts:
-                extra += " [" + " | ".join(parts) + "]"
-        if blocked:
-            extra += " [BLOCKED]"
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] [{step.upper()}] [{status.upper()}] {details}{extra}")
-        await self.broadcast(message)
+        self._ensure_console()
+        self.broadcast(message)
+
+    async def close(self):
+        """Stop all sender tasks; whatever the console has not printed yet is flushed."""
+        for websocket in list(self._sockets):
+            self.disconnect(websocket)
+        if self._console is not None:
+            self._console.task.cancel()
+            remaining = self._console._take(len(self._console.queue))
+            if remaining:
+                _write_console(remaining)
+            self._console = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seq": self._seq,
+            "history": len(self.history),
+            "policy": LOG_QUEUE_POLICY,
+            "batch_frames": LOG_BATCH_FRAMES,
+            "subscribers": [s.stats() for s in self._sockets.values()],
+            "console": self._console.stats() if self._console else None,
+        }
 
 # Global instance
 log_manager = LogManager()
@@ -1,15 +1,56 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple, AsyncGenerator
+from contextlib import asynccontextmanager, aclosing
+import asyncio
+import hashlib
+from datetime import datetime
+import json
+import re
 import time
 
+from backend import tracing, prometheus
 from backend.logger import log_manager
-from backend.ollama_service import ollama_service, gpustack_service, get_service
-from backend.config.settings import SYSTEM_PROMPT, FRAMEWORK_INFO
-from backend.metrics import get_resource_metrics
+from backend.ollama_service import ollama_service, gpustack_service, get_service, close_http_client
+from backend.config.settings import (
+    SYSTEM_PROMPT, FRAMEWORK_INFO, SPECULATIVE_GENERATION, PII_ACTION, LLAMA_GUARD_MODE,
+    STREAM_WINDOW_GUARDS, STREAM_WINDOW_MIN_CHARS, STREAM_WINDOW_MAX_CHARS, STREAM_WINDOW_OVERLAP,
+)
+from backend.guards.llama_guard.checker_llamaguard import GUARD_TO_LLAMA_CATEGORY
+from backend.guards.llama_guard.pii_llamaguard import pii_guard as pii_scanner
+from backend.guards.guardrails_ai.lazy_guard import GUARD_ERROR
+from backend.guards.scheduler import GuardTask, run_guards, run_in_pool
+from backend.guards.prefilter import keyword_prefilter, PrefilterVerdict
+from backend.guards.singleflight import single_flight_stats
+from backend.cache import cached_verdict, verdict_cache, response_cache, normalize_text, make_key, fingerprint
+from backend.semantic_cache import semantic_cache
+from backend.metrics import get_resource_metrics, resource_sampler
+from backend.speculative import SpeculativeStream
+from backend.warmup import warmup
+from backend.sessions import sessions
+from backend.audit import audit_log, message_hash, trace_verdicts
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background preload of WARMUP_EAGER frameworks; the rest load on first use
+    warmup.start_eager()
+    # Resource snapshot refreshed in the background; requests only read it
+    resource_sampler.start()
+    if audit_log.enabled:
+        message_hash("")  # resolve / create the hash salt now rather than on the first request
+    yield
+    await resource_sampler.stop()
+    await log_manager.close()
+    await audit_log.close()
+    # Release pooled keep-alive connections to Ollama / GPUStack
+    await close_http_client()
+
 
-app = FastAPI(title="SRT Chatbot Guardrails")
+app = FastAPI(title="SRT Chatbot Guardrails", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -56,12 +97,20 @@ class ChatRequest(BaseModel):
     nemo: GuardToggle = GuardToggle()
     nemo_mode: str = "emb"  # "emb" | "qwen" | "hybrid"
     llama_guard: LlamaGuardToggle = LlamaGuardToggle()
+    llama_guard_mode: str = LLAMA_GUARD_MODE  # "separate" | "combined" (compact input check + one conversation-level output check)
+    speculative: bool = SPECULATIVE_GENERATION  # start the LLM while input guards run (tokens held until they pass)
+    pii_action: str = PII_ACTION  # "block" | "redact" (mask PII with placeholders and continue)
+    session_id: Optional[str] = None  # multi-turn: the server keeps this conversation's guard-cleared history
+    trace: bool = False  # attach the per-span latency breakdown (guards, LLM calls, stages) to the response
 
 class ChatResponse(BaseModel):
     response: str
     blocked: bool = False
     violation_type: Optional[str] = None
     framework_used: Optional[str] = None
+    redactions: Optional[Dict[str, str]] = None  # placeholder -> original value (pii_action="redact")
+    session_id: Optional[str] = None
+    trace: Optional[Dict[str, Any]] = None  # ChatRequest.trace: span breakdown (see backend/tracing.py)
 
 # FRAMEWORK_INFO is imported from backend.config.settings
 
@@ -82,7 +131,8 @@ def _load_guard(framework: str, guard_name: str):
 async def health_check(backend: str = "ollama"):
     svc = get_service(backend)
     gpu_info = await svc.check_gpu()
-    return {"status": "ok", "gpu": gpu_info, "backend": backend}
+    return {"status": "ok", "gpu": gpu_info, "backend": backend, "warmup": warmup.status(), "single_flight": single_flight_stats(),
+            "logs": log_manager.stats(), "audit": audit_log.stats()}
 
 @app.get("/models")
 async def get_models(backend: str = "ollama"):
@@ -90,22 +140,185 @@ async def get_models(backend: str = "ollama"):
     models = await svc.list_models()
     return {"models": models, "backend": backend}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (per worker process)."""
+    return PlainTextResponse(prometheus.render(), media_type=prometheus.CONTENT_TYPE)
+
+@app.get("/resources")
+async def resources():
+    """Latest sampled CPU / RAM / VRAM snapshot."""
+    return {"sampler": resource_sampler.status(), "latest": resource_sampler.latest}
+
+@app.get("/resources/history")
+async def resources_history(limit: Optional[int] = None):
+    """Ring-buffer time series of snapshots (oldest first)."""
+    return {"interval_sec": resource_sampler.interval, "samples": resource_sampler.series(limit)}
+
 @app.get("/frameworks")
 async def get_frameworks():
     return {"frameworks": FRAMEWORK_INFO}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "verdict_cache": verdict_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+    }
+
+@app.post("/cache/flush")
+async def cache_flush():
+    """Drop all cached guard verdicts and responses (e.g. after editing rails.co, CATEGORIES or model settings)."""
+    flushed = {"verdict": verdict_cache.flush(), "response": response_cache.flush(), "semantic": semantic_cache.clear()}
+    await log_manager.log(
+        "System", "info",
+        f"Cache flushed (verdict: {flushed['verdict']}, response: {flushed['response']}, semantic: {flushed['semantic']} entries)",
+    )
+    return {"flushed": flushed}
+
+@app.get("/cache/semantic")
+async def semantic_cache_entries():
+    return {"stats": semantic_cache.stats(), "entries": semantic_cache.entries()}
+
+@app.delete("/cache/semantic")
+async def semantic_cache_clear():
+    cleared = semantic_cache.clear()
+    await log_manager.log("System", "info", f"Semantic cache cleared ({cleared} entries)")
+    return {"cleared": cleared}
+
+@app.delete("/cache/semantic/{entry_id}")
+async def semantic_cache_delete(entry_id: str):
+    if not semantic_cache.delete(entry_id):
+        raise HTTPException(status_code=404, detail=f"Semantic cache entry not found: {entry_id}")
+    await log_manager.log("System", "info", f"Semantic cache entry {entry_id} invalidated")
+    return {"deleted": entry_id}
+
+@app.get("/sessions")
+async def session_stats():
+    return sessions.stats()
+
+@app.get("/sessions/{session_id}")
+async def session_get(session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return session.summary(time.time())
+
+@app.delete("/sessions/{session_id}")
+async def session_delete(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    await log_manager.log("System", "info", f"Session {session_id} deleted")
+    return {"deleted": session_id}
+
 @app.websocket("/ws/logs")
-async def websocket_endpoint(websocket: WebSocket):
-    await log_manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, after: Optional[int] = None):
+    # after: last seq the client already has (reconnect) — only newer events are replayed
+    await log_manager.connect(websocket, after)
     try:
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         log_manager.disconnect(websocket)
 
 
 # --- Guard runners ---
 
+def _llama_cacheable(result) -> bool:
+    # Fail-open skips (Ollama down, timeout) must not be remembered as "safe"
+    return not result[1].startswith("Llama Guard check failed")
+
+
+def _guardai_cacheable(result) -> bool:
+    # Validator exceptions that were not a validation failure (LLM timeout, connection error)
+    return result[1] != "Guard not installed" and not result[1].startswith(GUARD_ERROR)
+
+
+def _nemo_cacheable(result) -> bool:
+    return result[2] not in ("nemo_error", "nemo_unavailable") and "error" not in result[1].lower()
+
+
+async def _prefilter(step: str, fw: str, text: str, guards: List[str]) -> PrefilterVerdict:
+    """Keyword tier in front of the LLM guards: log and return the sure-block / sure-allow verdict."""
+    with tracing.span("guard.prefilter", **{"guard.stage": step, "guard.framework": fw}) as span:
+        verdict = keyword_prefilter.check(text, guards)
+        span.set(**{
+            "guard.blocked": verdict.blocked, "guard.keyword": verdict.keyword,
+            "guard.skipped": sorted(verdict.skipped) or None,
+        })
+    if verdict.blocked:
+        await log_manager.log(step, "error", f"[{fw}] Prefilter: {verdict.blocked} sure-block keyword '{verdict.keyword}' — ข้าม LLM guard")
+    elif verdict.skipped:
+        await log_manager.log(step, "info", f"[{fw}] Prefilter: railway vocabulary '{verdict.allow_keyword}' — skip {', '.join(sorted(verdict.skipped))}")
+    return verdict
+
+
+async def _guard_verdict(step: str, fw: str, guard: str, key_parts: Any, text: str, compute,
+                         cacheable, mode: Optional[str] = None):
+    """cached_verdict() inside a guard.check span (framework, guard, mode, cache hit, verdict)."""
+    with tracing.span("guard.check", **{
+        "guard.stage": step, "guard.framework": fw, "guard.name": guard, "guard.mode": mode,
+    }) as span:
+        result, hit = await cached_verdict(key_parts, text, compute, cacheable=cacheable)
+        span.set(**{"guard.cache_hit": hit, "guard.safe": bool(result[0])})
+        if not result[0]:
+            span.set(**{"guard.reason": _reason_code(guard, result)})
+    return result, hit
+
+
+_LLAMA_CATEGORY_RE = re.compile(r"\bS\d{1,2}\b")
+
+
+def _reason_code(guard: str, result: Tuple) -> str:
+    """
+    Short code for a blocking verdict — goes to traces and the audit log instead of the
+    free-text details, which may quote the user's text (e.g. validator exception messages).
+    """
+    if len(result) > 2 and result[2]:
+        return str(result[2])                     # NeMo: violation type
+    categories = _LLAMA_CATEGORY_RE.findall(str(result[1]))
+    if categories:
+        return ",".join(dict.fromkeys(categories))  # Llama Guard: S1, S10, ...
+    return guard
+
+
+async def _run_guard_specs(step: str, fw: str, text: str, specs: List[Tuple[str, str, str, Any]],
+                           scopes: Optional[Dict[str, Any]] = None) -> Optional[ChatResponse]:
+    """
+    Run (guard, violation_type, user_message, fn) specs concurrently via the guard scheduler.
+    Each sync `fn` runs on the guard thread pool behind the verdict cache.
+    scopes: extra verdict-cache key per guard whose verdict depends on more than `text` (e.g. context)
+    Returns the blocked ChatResponse of the highest-priority violation, or None.
+    """
+    scopes = scopes or {}
+    pre = await _prefilter(step, fw, text, [guard for guard, _, _, _ in specs])
+    if pre.blocked:
+        _, vtype, msg, _ = next(spec for spec in specs if spec[0] == pre.blocked)
+        return ChatResponse(response=msg, blocked=True, violation_type=vtype, framework_used=fw)
+    specs = [spec for spec in specs if spec[0] not in pre.skipped]
+    if not specs:
+        return None
+    await log_manager.log(step, "processing", f"[{fw}] Checking {', '.join(vtype for _, vtype, _, _ in specs)} (parallel)...")
+
+    async def cached(guard: str, fn):
+        result, _ = await _guard_verdict(
+            step, fw, guard, (fw, guard, scopes.get(guard)), text, lambda: run_in_pool(fn),
+            cacheable=_guardai_cacheable,
+        )
+        return result
+
+    tasks = [GuardTask(name=guard, fn=lambda g=guard, f=fn: cached(g, f), is_async=True) for guard, _, _, fn in specs]
+    violation, _ = await run_guards(tasks)
+    if violation is None:
+        return None
+    _, vtype, msg, _ = next(spec for spec in specs if spec[0] == violation.name)
+    await log_manager.log(step, "error", f"[{fw}] {vtype} Blocked: {violation.details}", violation.latency)
+    return ChatResponse(response=msg, blocked=True, violation_type=vtype, framework_used=fw)
+
+
 async def run_input_guards(request: ChatRequest) -> Optional[ChatResponse]:
     fw = request.framework
     if fw == "none":
@@ -115,10 +328,22 @@ async def run_input_guards(request: ChatRequest) -> Optional[ChatResponse]:
     if fw == "llama_guard":
         toggles = request.llama_guard
         enabled = [k for k in ["S1","S2","S3","S4","S5","S6","S7","S8","S9","S10","S11","S12","S13","S14","S15","S16"] if getattr(toggles, k)]
+        pre = await _prefilter("Input Guard", "Llama Guard 3", request.message, enabled)
+        if pre.blocked:
+            return ChatResponse(response="ข้อความละเมิดนโยบายความปลอดภัย",
+                                blocked=True, violation_type="Llama Guard", framework_used=fw)
+        enabled = [k for k in enabled if k not in pre.skipped]
         if enabled:
             from backend.guards.llama_guard.checker_llamaguard import llama_guard_checker
-            await log_manager.log("Input Guard", "processing", f"[Llama Guard 3] Checking {len(enabled)} categories...")
-            is_safe, details = llama_guard_checker.check(request.message, enabled, role="User")
+            compact = request.llama_guard_mode == "combined"
+            await log_manager.log("Input Guard", "processing", f"[Llama Guard 3/{request.llama_guard_mode}] Checking {len(enabled)} categories{' (compact)' if compact else ''}...")
+            (is_safe, details), hit = await _guard_verdict(
+                "Input Guard", fw, "llama_guard", ("llama_guard", "User", enabled, compact), request.message,
+                lambda: llama_guard_checker.check(request.message, enabled, role="User", compact=compact),
+                cacheable=_llama_cacheable, mode=request.llama_guard_mode,
+            )
+            if hit:
+                await log_manager.log("Input Guard", "info", "[Llama Guard 3] Verdict cache hit")
             if not is_safe:
                 await log_manager.log("Input Guard", "error", f"[Llama Guard 3] Blocked: {details}")
                 return ChatResponse(response="ข้อความละเมิดนโยบายความปลอดภัย",
@@ -136,15 +361,26 @@ async def run_input_guards(request: ChatRequest) -> Optional[ChatResponse]:
 
         # Build list of enabled input guards
         enabled_input = []
-        if toggles.pii: enabled_input.append("pii")
+        if toggles.pii: enabled_input.append("pii")  # redact mode: checks the masked text
         if toggles.jailbreak: enabled_input.append("jailbreak")
         if toggles.toxicity: enabled_input.append("toxicity")
         if toggles.off_topic: enabled_input.append("off_topic")
 
-        if enabled_input:
+        pre = await _prefilter("Input Guard", "NeMo", request.message, enabled_input)
+        enabled_input = [g for g in enabled_input if g not in pre.skipped]
+        if pre.blocked or enabled_input:
             nemo_mode = getattr(request, "nemo_mode", "emb")
-            await log_manager.log("Input Guard", "processing", f"[NeMo-{nemo_mode}] Checking {', '.join(g.upper() for g in enabled_input)}...")
-            is_safe, details, violation = await check_all_guards(request.message, enabled_input, nemo_mode)
+            if pre.blocked:
+                is_safe, details, violation = False, f"Prefilter keyword '{pre.keyword}'", pre.blocked
+            else:
+                await log_manager.log("Input Guard", "processing", f"[NeMo-{nemo_mode}] Checking {', '.join(g.upper() for g in enabled_input)}...")
+                (is_safe, details, violation), hit = await _guard_verdict(
+                    "Input Guard", fw, ",".join(enabled_input), ("nemo", nemo_mode, enabled_input), request.message,
+                    lambda: check_all_guards(request.message, enabled_input, nemo_mode),
+                    cacheable=_nemo_cacheable, mode=nemo_mode,
+                )
+                if hit:
+                    await log_manager.log("Input Guard", "info", f"[NeMo-{nemo_mode}] Verdict cache hit")
             if not is_safe:
                 if violation == "nemo_unavailable":
                     await log_manager.log("Input Guard", "error", f"[NeMo] Unavailable: {details}")
@@ -176,50 +412,46 @@ async def run_input_guards(request: ChatRequest) -> Optional[ChatResponse]:
 
 
     # === GUARDRAILS AI HANDLING (Legacy/Hybrid) ===
-    # === 1. PII Detection (regex — fast) ===
+    # All enabled input guards run concurrently; list order = priority of the reported violation.
+    message = request.message
+    specs = []
     if toggles.pii and "pii" in FRAMEWORK_INFO[fw]["supports"]:
+        # 1. PII Detection (regex — fast). Redact mode: runs on the masked text, so PII the Thai
+        #    regex scanner doesn't cover (e.g. DetectPII PERSON / LOCATION) still blocks
         mod = _load_guard(fw, "pii")
-        await log_manager.log("Input Guard", "processing", f"[{fw}] Checking PII...")
-        is_safe, details = mod.pii_guard.scan(request.message)
-        if not is_safe:
-            await log_manager.log("Input Guard", "error", f"[{fw}] PII Blocked: {details}")
-            return ChatResponse(response="ข้อความมีข้อมูลส่วนบุคคล (PII) ไม่สามารถประมวลผลได้",
-                                blocked=True, violation_type="PII", framework_used=fw)
-
-    # === 2. Jailbreak Attempt (regex — fast, specific) ===
+        specs.append(("pii", "PII", "ข้อความมีข้อมูลส่วนบุคคล (PII) ไม่สามารถประมวลผลได้",
+                      lambda g=mod.pii_guard: g.scan(message)))
     if toggles.jailbreak and "jailbreak" in FRAMEWORK_INFO[fw]["supports"]:
+        # 2. Jailbreak Attempt
         mod = _load_guard(fw, "jailbreak")
-        await log_manager.log("Input Guard", "processing", f"[{fw}] Checking Jailbreak...")
-        is_safe, details = mod.jailbreak_guard.check(request.message)
-        if not is_safe:
-            await log_manager.log("Input Guard", "error", f"[{fw}] Jailbreak Blocked: {details}")
-            return ChatResponse(response="ข้อความละเมิดนโยบายความปลอดภัย",
-                                blocked=True, violation_type="Jailbreak", framework_used=fw)
-
-    # === 3. Profanity & Toxicity (regex — fast) ===
+        specs.append(("jailbreak", "Jailbreak", "ข้อความละเมิดนโยบายความปลอดภัย",
+                      lambda g=mod.jailbreak_guard: g.check(message)))
     if toggles.toxicity and "toxicity" in FRAMEWORK_INFO[fw]["supports"]:
+        # 3. Profanity & Toxicity
         mod = _load_guard(fw, "toxicity")
-        await log_manager.log("Input Guard", "processing", f"[{fw}] Checking Toxicity...")
-        is_safe, details = mod.toxicity_guard.check(request.message)
-        if not is_safe:
-            await log_manager.log("Input Guard", "error", f"[{fw}] Toxicity Blocked: {details}")
-            return ChatResponse(response="ข้อความมีเนื้อหาที่ไม่เหมาะสม",
-                                blocked=True, violation_type="Toxicity", framework_used=fw)
-
-    # === 4. Off-Topic (LLM — slower, catch-all) ===
+        specs.append(("toxicity", "Toxicity", "ข้อความมีเนื้อหาที่ไม่เหมาะสม",
+                      lambda g=mod.toxicity_guard: g.check(message)))
     if toggles.off_topic and "off_topic" in FRAMEWORK_INFO[fw]["supports"]:
+        # 4. Off-Topic (LLM — slower, catch-all)
         mod = _load_guard(fw, "off_topic")
-        await log_manager.log("Input Guard", "processing", f"[{fw}] Checking Off-Topic...")
-        is_safe, details = mod.off_topic_guard.check(request.message, request.model)
-        if not is_safe:
-            await log_manager.log("Input Guard", "error", f"[{fw}] Off-Topic Blocked: {details}")
-            return ChatResponse(response="ฉันสามารถตอบคำถามเกี่ยวกับการรถไฟแห่งประเทศไทยเท่านั้น",
-                                blocked=True, violation_type="Off-Topic", framework_used=fw)
+        specs.append(("off_topic", "Off-Topic", "ฉันสามารถตอบคำถามเกี่ยวกับการรถไฟแห่งประเทศไทยเท่านั้น",
+                      lambda g=mod.off_topic_guard: g.check(message, request.model)))
+
+    return await _run_guard_specs("Input Guard", fw, message, specs)
 
-    return None
 
+def _selected(guard: str, only: Optional[Set[str]]) -> bool:
+    """True if `guard` (guard name or Llama Guard category code) is part of this pass."""
+    return only is None or guard in only
 
-async def run_output_guards(response_text: str, request: ChatRequest) -> Optional[ChatResponse]:
+
+async def run_output_guards(response_text: str, request: ChatRequest,
+                            only: Optional[Set[str]] = None) -> Optional[ChatResponse]:
+    """
+    Run output guards on `response_text`.
+    only: restrict this pass to these guard names / Llama Guard category codes
+          (used by /chat/stream to guard windows incrementally). None = all.
+    """
     fw = request.framework
     if fw == "none":
         return None
@@ -227,11 +459,25 @@ async def run_output_guards(response_text: str, request: ChatRequest) -> Optiona
     # --- Llama Guard: same S1-S14 check on output ---
     if fw == "llama_guard":
         toggles = request.llama_guard
-        enabled = [k for k in ["S1","S2","S3","S4","S5","S6","S7","S8","S9","S10","S11","S12","S13","S14","S15","S16"] if getattr(toggles, k)]
+        enabled = [k for k in ["S1","S2","S3","S4","S5","S6","S7","S8","S9","S10","S11","S12","S13","S14","S15","S16"] if getattr(toggles, k) and _selected(k, only)]
+        pre = await _prefilter("Output Guard", "Llama Guard 3", response_text, enabled)
+        if pre.blocked:
+            return ChatResponse(response="คำตอบถูกกรองเนื่องจากมีเนื้อหาไม่เหมาะสม",
+                                blocked=True, violation_type="Llama Guard", framework_used=fw)
+        enabled = [k for k in enabled if k not in pre.skipped]
         if enabled:
             from backend.guards.llama_guard.checker_llamaguard import llama_guard_checker
-            await log_manager.log("Output Guard", "processing", f"[Llama Guard 3] Checking output ({len(enabled)} categories)...")
-            is_safe, details = llama_guard_checker.check(response_text, enabled, role="Agent")
+            # combined: one conversation-level assessment (user turn + reply) instead of the reply alone
+            context = request.message if request.llama_guard_mode == "combined" else None
+            scope = "Agent" if context is None else "Conversation"
+            await log_manager.log("Output Guard", "processing", f"[Llama Guard 3/{request.llama_guard_mode}] Checking {scope.lower()} ({len(enabled)} categories)...")
+            (is_safe, details), hit = await _guard_verdict(
+                "Output Guard", fw, "llama_guard", ("llama_guard", scope, enabled, normalize_text(context or "")), response_text,
+                lambda: llama_guard_checker.check(response_text, enabled, role="Agent", context=context),
+                cacheable=_llama_cacheable, mode=request.llama_guard_mode,
+            )
+            if hit:
+                await log_manager.log("Output Guard", "info", "[Llama Guard 3] Verdict cache hit")
             if not is_safe:
                 await log_manager.log("Output Guard", "error", f"[Llama Guard 3] Blocked: {details}")
                 return ChatResponse(response="คำตอบถูกกรองเนื่องจากมีเนื้อหาไม่เหมาะสม",
@@ -249,14 +495,25 @@ async def run_output_guards(response_text: str, request: ChatRequest) -> Optiona
 
         # Build list of enabled output guards
         enabled_output = []
-        if toggles.hallucination: enabled_output.append("hallucination")
-        if toggles.toxicity: enabled_output.append("toxicity")
-        if toggles.competitor: enabled_output.append("competitor")
+        if toggles.hallucination and _selected("hallucination", only): enabled_output.append("hallucination")
+        if toggles.toxicity and _selected("toxicity", only): enabled_output.append("toxicity")
+        if toggles.competitor and _selected("competitor", only): enabled_output.append("competitor")
 
-        if enabled_output:
+        pre = await _prefilter("Output Guard", "NeMo", response_text, enabled_output)
+        enabled_output = [g for g in enabled_output if g not in pre.skipped]
+        if pre.blocked or enabled_output:
             nemo_mode = getattr(request, "nemo_mode", "emb")
-            await log_manager.log("Output Guard", "processing", f"[NeMo-{nemo_mode}] Checking {', '.join(g.upper() for g in enabled_output)}...")
-            is_safe, details, violation = await check_all_guards(response_text, enabled_output, nemo_mode)
+            if pre.blocked:
+                is_safe, details, violation = False, f"Prefilter keyword '{pre.keyword}'", pre.blocked
+            else:
+                await log_manager.log("Output Guard", "processing", f"[NeMo-{nemo_mode}] Checking {', '.join(g.upper() for g in enabled_output)}...")
+                (is_safe, details, violation), hit = await _guard_verdict(
+                    "Output Guard", fw, ",".join(enabled_output), ("nemo", nemo_mode, enabled_output), response_text,
+                    lambda: check_all_guards(response_text, enabled_output, nemo_mode),
+                    cacheable=_nemo_cacheable, mode=nemo_mode,
+                )
+                if hit:
+                    await log_manager.log("Output Guard", "info", f"[NeMo-{nemo_mode}] Verdict cache hit")
             if not is_safe:
                 if violation == "nemo_unavailable":
                     await log_manager.log("Output Guard", "error", f"[NeMo] Unavailable: {details}")
@@ -286,52 +543,79 @@ async def run_output_guards(response_text: str, request: ChatRequest) -> Optiona
 
 
     # === GUARDRAILS AI HANDLING (Legacy/Hybrid) ===
-    # === 1. Hallucination ===
-    if toggles.hallucination and "hallucination" in FRAMEWORK_INFO[fw]["supports"]:
+    # All enabled output guards run concurrently; list order = priority of the reported violation.
+    specs = []
+    scopes = {}
+    if toggles.hallucination and "hallucination" in FRAMEWORK_INFO[fw]["supports"] and _selected("hallucination", only):
+        # 1. Hallucination
         mod = _load_guard(fw, "hallucination")
-        await log_manager.log("Output Guard", "processing", f"[{fw}] Checking Hallucination...")
         if fw == "guardrails_ai":
-            is_safe, details = mod.hallucination_guard.check(response_text, request.model)
+            context = _grounding_context(request)
+            scopes["hallucination"] = make_key(context)
+            fn = lambda g=mod.hallucination_guard: g.check(response_text, request.model, context=context)
         else:
-            is_safe, details = mod.hallucination_guard.check(response_text)
-        if not is_safe:
-            await log_manager.log("Output Guard", "error", f"[{fw}] Hallucination Blocked: {details}")
-            return ChatResponse(response="คำตอบถูกกรองเนื่องจากอาจมีข้อมูลที่ไม่ถูกต้อง",
-                                blocked=True, violation_type="Hallucination", framework_used=fw)
-
-    # === 2. Profanity & Toxicity ===
-    if toggles.toxicity and "toxicity" in FRAMEWORK_INFO[fw]["supports"]:
+            fn = lambda g=mod.hallucination_guard: g.check(response_text)
+        specs.append(("hallucination", "Hallucination", "คำตอบถูกกรองเนื่องจากอาจมีข้อมูลที่ไม่ถูกต้อง", fn))
+    if toggles.toxicity and "toxicity" in FRAMEWORK_INFO[fw]["supports"] and _selected("toxicity", only):
+        # 2. Profanity & Toxicity
         mod = _load_guard(fw, "toxicity")
-        await log_manager.log("Output Guard", "processing", f"[{fw}] Checking Toxicity...")
-        is_safe, details = mod.toxicity_guard.check(response_text)
-        if not is_safe:
-            await log_manager.log("Output Guard", "error", f"[{fw}] Toxicity Blocked: {details}")
-            return ChatResponse(response="คำตอบถูกกรองเนื่องจากมีเนื้อหาไม่เหมาะสม",
-                                blocked=True, violation_type="Toxicity", framework_used=fw)
-
-    # === 3. Competitor Mention ===
-    if toggles.competitor and "competitor" in FRAMEWORK_INFO[fw]["supports"]:
+        specs.append(("toxicity", "Toxicity", "คำตอบถูกกรองเนื่องจากมีเนื้อหาไม่เหมาะสม",
+                      lambda g=mod.toxicity_guard: g.check(response_text)))
+    if toggles.competitor and "competitor" in FRAMEWORK_INFO[fw]["supports"] and _selected("competitor", only):
+        # 3. Competitor Mention
         mod = _load_guard(fw, "competitor")
-        await log_manager.log("Output Guard", "processing", f"[{fw}] Checking Competitor...")
-        is_safe, details = mod.competitor_guard.check(response_text)
-        if not is_safe:
-            await log_manager.log("Output Guard", "error", f"[{fw}] Competitor Blocked: {details}")
-            return ChatResponse(response="คำตอบถูกกรองเนื่องจากมีการกล่าวถึงคู่แข่ง",
-                                blocked=True, violation_type="Competitor", framework_used=fw)
+        specs.append(("competitor", "Competitor", "คำตอบถูกกรองเนื่องจากมีการกล่าวถึงคู่แข่ง",
+                      lambda g=mod.competitor_guard: g.check(response_text)))
 
-    return None
+    return await _run_guard_specs("Output Guard", fw, response_text, specs, scopes)
 
 
 # --- Main Chat Endpoint ---
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    start_time = time.time()
-    fw = request.framework
+async def _log_system_complete(label: str, total_sec: float, metrics: Dict[str, Any], blocked: bool):
+    """Final per-request summary (time + resource snapshot) for the log panel."""
+    ram_info = f"RAM: {metrics.get('ram_used_gb', '—')}GB"
+    if metrics.get('ram_percent'): ram_info += f" ({metrics['ram_percent']}%)"
 
+    process_info = f"App: {metrics.get('process_mem_mb', '—')}MB"
+
+    # Show GB if > 1GB, else MB
+    gpu_mem = metrics.get('gpu_mem_gb')
+    if gpu_mem and gpu_mem > 1.0:
+        gpu_info = f"GPU: {gpu_mem}GB"
+    else:
+        gpu_info = f"GPU: {metrics.get('gpu_mem_mb', '—')}MB"
+
+    if metrics.get('gpu_percent'): gpu_info += f" ({metrics['gpu_percent']}%)"
+
+    await log_manager.log(
+        "System", "complete",
+        f"{label} {total_sec:.2f}s\n"
+        f"CPU: {metrics.get('cpu_percent', '—')}%\n"
+        f"{ram_info}\n"
+        f"{process_info}\n"
+        f"{gpu_info}",
+        total_sec,
+        metrics=metrics,
+        blocked=blocked,
+    )
+
+
+async def _input_stage(request: ChatRequest, start_time: float) -> Optional[ChatResponse]:
+    """Run + log the input guards. Returns the blocked response, or None if input passed."""
+    fw = request.framework
+    if not warmup.is_ready(fw):
+        await log_manager.log("System", "info", f"[Warmup] Loading {fw} (first use)...")
+        with tracing.span("warmup.ensure", **{"warmup.component": fw}) as span:
+            loaded = await warmup.ensure(fw)
+            span.set(**{"warmup.loaded": loaded})
+        if not loaded:
+            await log_manager.log("System", "warning", f"[Warmup] {fw} failed to load — guards report their own fallback")
     await log_manager.log("Input Guard", "start", f"Framework: {fw} — Checking input...")
     input_guard_start = time.time()
-    blocked = await run_input_guards(request)
+    with tracing.span("stage.input_guards", **{"guard.framework": fw}) as span:
+        blocked = await run_input_guards(request)
+        span.set(**{"stage.blocked": bool(blocked)})
     input_guard_sec = time.time() - input_guard_start
     if blocked:
         total_sec = time.time() - start_time
@@ -343,49 +627,307 @@ async def chat(request: ChatRequest):
             metrics=metrics,
             blocked=True,
         )
-        cpu_info = f"CPU {metrics.get('cpu_percent', '—')}%"
-        
-        ram_info = f"RAM: {metrics.get('ram_used_gb', '—')}GB"
-        if metrics.get('ram_percent'): ram_info += f" ({metrics['ram_percent']}%)"
+        await _log_system_complete("Blocked (Input)", total_sec, metrics, blocked=True)
+        return blocked
+    await log_manager.log("Input Guard", "success", f"Input ผ่านทุกด่านแล้ว ({input_guard_sec:.2f}s)", input_guard_sec)
+    return None
 
-        process_info = f"App: {metrics.get('process_mem_mb', '—')}MB"
 
-        # Show GB if > 1GB, else MB
-        gpu_mem = metrics.get('gpu_mem_gb')
-        if gpu_mem and gpu_mem > 1.0:
-            gpu_info = f"GPU: {gpu_mem}GB"
-        else:
-            gpu_info = f"GPU: {metrics.get('gpu_mem_mb', '—')}MB"
-            
-        if metrics.get('gpu_percent'): gpu_info += f" ({metrics['gpu_percent']}%)"
+async def _log_output_blocked(start_time: float, output_guard_sec: float):
+    total_sec = time.time() - start_time
+    metrics = get_resource_metrics()
+    await log_manager.log(
+        "Output Guard", "success",
+        f"Blocked (output) — รวม {total_sec:.2f}s",
+        output_guard_sec,
+        metrics=metrics,
+        blocked=True,
+    )
+    await _log_system_complete("Blocked (Output)", total_sec, metrics, blocked=True)
+
+
+_SYSTEM_PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+
+def _request_scope(request: ChatRequest) -> str:
+    """Everything except the message that decides the answer: model/backend/framework/toggles, system prompt, guard config."""
+    config = request.model_dump(exclude={"message", "speculative", "session_id", "trace"})
+    return make_key(fingerprint.current(), _SYSTEM_PROMPT_HASH, config)
+
 
+def _response_key(request: ChatRequest) -> str:
+    """Same question + same scope -> same answer."""
+    return response_cache.key("chat", _request_scope(request), normalize_text(request.message))
+
+
+def _has_history(request: ChatRequest) -> bool:
+    # With earlier turns the answer depends on the conversation, not just the message: no cache reuse
+    return bool(sessions.history(request.session_id, _guard_scope(request)))
+
+
+def _semantic_enabled(request: ChatRequest) -> bool:
+    # Only answers that went through guards count as approved
+    return semantic_cache.enabled and request.framework != "none" and not _has_history(request)
+
+
+async def _cached_response(request: ChatRequest, start_time: float) -> Optional[ChatResponse]:
+    """Serve an identical, previously unblocked question from the response cache (skips guards + LLM)."""
+    if not response_cache.enabled or _has_history(request):
+        return None
+    found, value = await response_cache.get(_response_key(request))
+    if not found:
+        return None
+    tracing.current_span().set(**{"chat.cache": "response"})
+    total_sec = time.time() - start_time
+    await log_manager.log("System", "info", f"Response cache hit — ข้ามการตรวจและการสร้างคำตอบ ({total_sec:.3f}s)")
+    await _log_system_complete("Complete (cached)", total_sec, get_resource_metrics(), blocked=False)
+    return ChatResponse(**value)
+
+
+async def _store_response(request: ChatRequest, response: ChatResponse):
+    # Only replies that passed every guard and came from a healthy backend are reusable
+    if response.blocked or response.response.startswith("Error calling"):
+        return
+    # The redaction map holds raw PII: never cached, re-attached per request
+    value = response.model_dump(exclude={"redactions", "session_id", "trace"})
+    if response_cache.enabled and not _has_history(request):
+        await response_cache.set(_response_key(request), value)
+    if _semantic_enabled(request):
+        await semantic_cache.add(request.message, _request_scope(request), value)
+
+
+def _pii_guard_enabled(request: ChatRequest) -> bool:
+    fw = request.framework
+    if fw == "llama_guard":
+        return request.llama_guard.S7
+    toggles: Optional[GuardToggle] = getattr(request, fw, None)
+    return bool(toggles and toggles.pii and "pii" in FRAMEWORK_INFO[fw]["supports"])
+
+
+async def _redact_input(request: ChatRequest) -> Tuple[ChatRequest, Dict[str, str]]:
+    """
+    pii_action="redact": mask PII in the message with typed placeholders ([PHONE_1], [ID_CARD_1], ...)
+    and continue with the masked copy, so guards, caches, logs and the LLM payload never see the raw values.
+    Runs before the cache lookup and before speculative generation starts. The framework's own
+    PII guard still checks the masked copy and blocks whatever the regex scanner missed.
+    """
+    if request.pii_action != "redact" or not _pii_guard_enabled(request):
+        return request, {}
+    redacted, redactions = pii_scanner.redact(request.message)
+    if not redactions:
+        return request, {}
+    counts: Dict[str, int] = {}
+    for placeholder in redactions:
+        pii_type = placeholder[1:].rsplit("_", 1)[0]
+        counts[pii_type] = counts.get(pii_type, 0) + 1
+    summary = ", ".join(f"{t}: {n}" for t, n in counts.items())
+    tracing.current_span().set(**{"pii.redactions": len(redactions)})
+    await log_manager.log("Input Guard", "info", f"[PII] Redacted ({summary}) — ปิดบังข้อมูลส่วนบุคคลแล้วดำเนินการต่อ")
+    return request.model_copy(update={"message": redacted}), redactions
+
+
+def _build_messages(request: ChatRequest) -> List[Dict[str, str]]:
+    # system + cleared history + new message: append-only, so the backend can reuse the cached prefix
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *sessions.history(request.session_id, _guard_scope(request)),
+        {"role": "user", "content": request.message},
+    ]
+
+
+def _grounding_context(request: ChatRequest) -> str:
+    """What the reply may rely on: the system prompt facts, the conversation so far, the question."""
+    history = sessions.grounding_context(request.session_id, _guard_scope(request))
+    return "\n\n".join(part for part in (SYSTEM_PROMPT, history, f"User: {request.message}") if part)
+
+
+def _guard_scope(request: ChatRequest) -> Optional[str]:
+    """The guard config a turn is cleared under (framework, mode, toggles); None if no guard runs at all."""
+    fw = request.framework
+    if fw == "llama_guard":
+        toggles = request.llama_guard.model_dump()
+        enabled = any(toggles.values())
+    elif fw in FRAMEWORK_INFO and fw != "none":
+        toggles = getattr(request, fw).model_dump()
+        enabled = any(on and guard in FRAMEWORK_INFO[fw]["supports"] for guard, on in toggles.items())
+    else:
+        return None
+    if not enabled:
+        return None
+    mode = request.llama_guard_mode if fw == "llama_guard" else request.nemo_mode if fw == "nemo" else None
+    return make_key(fw, mode, toggles, request.pii_action)
+
+
+def _record_turn(request: ChatRequest, response: ChatResponse):
+    """Remember a turn that passed every guard (blocked and unguarded turns never enter the history)."""
+    if request.session_id and not response.blocked and not response.response.startswith("Error calling"):
+        sessions.record(request.session_id, _guard_scope(request), request.message, response.response)
+
+
+@asynccontextmanager
+async def _session_turn(request: ChatRequest):
+    """Serialize turns of one session so each sees the previous turn's history (reset if the guard scope changed)."""
+    if not request.session_id:
+        yield
+        return
+    session = sessions.get_or_create(request.session_id)
+    async with session.lock:
+        sessions.begin_turn(session, _guard_scope(request))
+        yield
+
+
+async def _semantic_lookup(request: ChatRequest):
+    with tracing.span("cache.semantic_lookup") as span:
+        hit = await semantic_cache.lookup(request.message, _request_scope(request))
+        span.set(**{"cache.hit": hit is not None})
+    return hit
+
+
+def _trace_attributes(request: ChatRequest, endpoint: str) -> Dict[str, Any]:
+    fw = request.framework
+    mode = request.llama_guard_mode if fw == "llama_guard" else request.nemo_mode if fw == "nemo" else None
+    return {
+        "http.route": endpoint, "chat.framework": fw, "chat.guard_mode": mode,
+        "chat.backend": request.backend, "gen_ai.request.model": request.model,
+        "chat.speculative": request.speculative, "chat.session": bool(request.session_id),
+    }
+
+
+@asynccontextmanager
+async def _request_trace(request: ChatRequest, endpoint: str):
+    """Root span of one request; the finished trace is exported (TRACE_EXPORT_PATH) on exit."""
+    trace = None
+    prometheus.INFLIGHT.inc()
+    try:
+        with tracing.trace("chat", **_trace_attributes(request, endpoint)) as trace:
+            yield trace
+    finally:
+        prometheus.INFLIGHT.dec()
+        if trace is not None:
+            await tracing.export(trace)
+            audit_log.record(_audit_record(request, trace))
+
+
+def _audit_record(request: ChatRequest, trace: tracing.Trace) -> Dict[str, Any]:
+    """One audit line: who decided what, how fast — the message itself only as a salted hash."""
+    fw = request.framework
+    toggles: Any = getattr(request, fw, None)
+    root = trace.root.attributes
+    return {
+        "ts": datetime.fromtimestamp(trace.root.start_ns / 1e9).isoformat(),
+        "trace_id": trace.trace_id,
+        "endpoint": root.get("http.route"),
+        "message_sha256": message_hash(request.message),
+        "message_chars": len(request.message),
+        "session_id": request.session_id,
+        "framework": fw,
+        "mode": root.get("chat.guard_mode"),
+        "toggles": [name for name, on in toggles.model_dump().items() if on] if isinstance(toggles, BaseModel) else [],
+        "model": request.model,
+        "backend": request.backend,
+        "pii_action": request.pii_action,
+        "pii_redactions": root.get("pii.redactions", 0),
+        "blocked": root.get("chat.blocked"),
+        "violation_type": root.get("chat.violation_type"),
+        "cache": root.get("chat.cache"),
+        "latency_ms": round(trace.root.duration_ms, 2),
+        "error": trace.root.error,
+        **trace_verdicts(trace),
+    }
+
+
+def _trace_outcome(span, response: ChatResponse):
+    span.set(**{"chat.blocked": response.blocked, "chat.violation_type": response.violation_type})
+
+
+async def _guarded_generation(request: ChatRequest, start_time: float):
+    """
+    Input guards + start of generation -> (early_response, token_stream, llm_start).
+    early_response is the blocked response, or a semantic-cache answer to a paraphrased
+    question (looked up concurrently with the input guards, served only if they pass).
+    With request.speculative the LLM call starts *together with* the input guards; its
+    tokens are buffered and only released if the guards pass, otherwise the upstream
+    generation is aborted. Without it, generation starts after the guards pass.
+    """
+    svc = get_service(request.backend)
+    speculative = None
+    semantic = None
+    llm_start = time.time()
+    if _semantic_enabled(request):
+        semantic = asyncio.ensure_future(_semantic_lookup(request))
+    if request.speculative and request.framework != "none":
+        speculative = SpeculativeStream(svc.chat_stream(request.model, _build_messages(request)))
+        await log_manager.log("LLM", "processing", f"[speculative] เริ่มสร้างคำตอบจาก {request.model} ({request.backend}) ระหว่างตรวจ Input...")
+
+    try:
+        blocked = await _input_stage(request, start_time)
+        hit = await semantic if semantic and not blocked else None
+    except BaseException:
+        if speculative:
+            await speculative.cancel()
+        if semantic:
+            semantic.cancel()
+        raise
+    if blocked:
+        if semantic:
+            semantic.cancel()
+        if speculative:
+            dropped = speculative.buffered
+            await speculative.cancel()
+            await log_manager.log("LLM", "info", f"[speculative] Aborted upstream generation ({dropped} buffered chunks dropped)")
+        return blocked, None, llm_start
+
+    if hit:
+        entry, similarity = hit
+        if speculative:
+            await speculative.cancel()
+        tracing.current_span().set(**{"chat.cache": "semantic", "chat.cache_similarity": round(similarity, 4)})
+        total_sec = time.time() - start_time
         await log_manager.log(
-            "System", "complete",
-            f"Blocked (Input) {total_sec:.2f}s\n"
-            f"CPU: {metrics.get('cpu_percent', '—')}%\n"
-            f"{ram_info}\n"
-            f"{process_info}\n"
-            f"{gpu_info}",
-            total_sec,
-            metrics=metrics,
-            blocked=True,
+            "LLM", "info",
+            f"Semantic cache hit (sim {similarity:.3f}) — ใช้คำตอบที่ผ่านการตรวจแล้วของ \"{entry.question[:60]}\"",
         )
-        return blocked
-    await log_manager.log("Input Guard", "success", f"Input ผ่านทุกด่านแล้ว ({input_guard_sec:.2f}s)", input_guard_sec)
+        await _log_system_complete("Complete (semantic cache)", total_sec, get_resource_metrics(), blocked=False)
+        return ChatResponse(**entry.response), None, llm_start
 
+    if speculative:
+        return None, speculative, llm_start
     llm_start = time.time()
-    svc = get_service(request.backend)
     await log_manager.log("LLM", "processing", f"กำลังสร้างคำตอบจาก {request.model} ({request.backend})...")
+    return None, svc.chat_stream(request.model, _build_messages(request)), llm_start
 
-    system_prompt = SYSTEM_PROMPT
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": request.message},
-    ]
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    async with _request_trace(request, "/chat") as trace:
+        request, redactions = await _redact_input(request)
+        async with _session_turn(request):
+            response = await _chat(request)
+            _record_turn(request, response)
+        _trace_outcome(trace.root, response)
+    if redactions:
+        response.redactions = redactions
+    response.session_id = request.session_id
+    if request.trace:
+        response.trace = trace.summary()
+    return response
+
+
+async def _chat(request: ChatRequest) -> ChatResponse:
+    start_time = time.time()
+    fw = request.framework
+
+    cached = await _cached_response(request, start_time)
+    if cached:
+        return cached
+
+    early, stream, llm_start = await _guarded_generation(request, start_time)
+    if early:
+        return early
 
     full_response = ""
     try:
-        for chunk in svc.chat_stream(request.model, messages):
+        async for chunk in stream:
             full_response += chunk
     except Exception as e:
         await log_manager.log("LLM", "error", f"Generation failed: {e}")
@@ -396,79 +938,197 @@ async def chat(request: ChatRequest):
 
     await log_manager.log("Output Guard", "start", f"Framework: {fw} — Checking output...")
     output_guard_start = time.time()
-    blocked = await run_output_guards(full_response, request)
+    with tracing.span("stage.output_guards", **{"guard.framework": fw}) as span:
+        blocked = await run_output_guards(full_response, request)
+        span.set(**{"stage.blocked": bool(blocked)})
     output_guard_sec = time.time() - output_guard_start
     if blocked:
-        total_sec = time.time() - start_time
-        metrics = get_resource_metrics()
-        await log_manager.log(
-            "Output Guard", "success",
-            f"Blocked (output) — รวม {total_sec:.2f}s",
-            output_guard_sec,
-            metrics=metrics,
-            blocked=True,
-        )
-        cpu_info = f"CPU {metrics.get('cpu_percent', '—')}%"
-        
-        ram_info = f"RAM: {metrics.get('ram_used_gb', '—')}GB"
-        if metrics.get('ram_percent'): ram_info += f" ({metrics['ram_percent']}%)"
+        await _log_output_blocked(start_time, output_guard_sec)
+        return blocked
+    await log_manager.log("Output Guard", "success", f"Output ผ่านทุกด่านแล้ว ({output_guard_sec:.2f}s)", output_guard_sec)
 
-        process_info = f"App: {metrics.get('process_mem_mb', '—')}MB"
+    total_sec = time.time() - start_time
+    await _log_system_complete("Complete", total_sec, get_resource_metrics(), blocked=False)
 
-        # Show GB if > 1GB, else MB
-        gpu_mem = metrics.get('gpu_mem_gb')
-        if gpu_mem and gpu_mem > 1.0:
-            gpu_info = f"GPU: {gpu_mem}GB"
-        else:
-            gpu_info = f"GPU: {metrics.get('gpu_mem_mb', '—')}MB"
-            
-        if metrics.get('gpu_percent'): gpu_info += f" ({metrics['gpu_percent']}%)"
+    result = ChatResponse(response=full_response, framework_used=fw)
+    await _store_response(request, result)
+    return result
 
-        await log_manager.log(
-            "System", "complete",
-            f"Blocked (Output) {total_sec:.2f}s\n"
-            f"CPU: {metrics.get('cpu_percent', '—')}%\n"
-            f"{ram_info}\n"
-            f"{process_info}\n"
-            f"{gpu_info}",
-            total_sec,
-            metrics=metrics,
-            blocked=True,
-        )
-        return blocked
+
+# --- Streaming Chat Endpoint (SSE) ---
+
+_WINDOW_BOUNDARY = re.compile(r"[.!?。\n]|\s")
+
+
+def _next_window(buffer: str) -> Tuple[str, str]:
+    """
+    Split a guardable window off the front of `buffer` -> (window, rest).
+    Cuts at the last sentence/space boundary once STREAM_WINDOW_MIN_CHARS is reached,
+    or hard-cuts at STREAM_WINDOW_MAX_CHARS. Returns ("", buffer) if not ready yet.
+    """
+    cut = 0
+    for m in _WINDOW_BOUNDARY.finditer(buffer, 0, STREAM_WINDOW_MAX_CHARS):
+        cut = m.end()
+    if cut >= STREAM_WINDOW_MIN_CHARS:
+        return buffer[:cut], buffer[cut:]
+    if len(buffer) >= STREAM_WINDOW_MAX_CHARS:
+        return buffer[:STREAM_WINDOW_MAX_CHARS], buffer[STREAM_WINDOW_MAX_CHARS:]
+    return "", buffer
+
+
+def _stream_guard_sets() -> Tuple[Set[str], Set[str]]:
+    """(guards checked per window, guards checked once on the full reply)."""
+    window = set(STREAM_WINDOW_GUARDS)
+    window |= {GUARD_TO_LLAMA_CATEGORY[g] for g in STREAM_WINDOW_GUARDS if g in GUARD_TO_LLAMA_CATEGORY}
+    every = {"hallucination", "toxicity", "competitor"} | set(FRAMEWORK_INFO["llama_guard"]["supports"])
+    return window, every - window
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+async def _stream_turn(request: ChatRequest, redactions: Dict[str, str]) -> AsyncGenerator[str, None]:
+    """One /chat/stream turn after redaction (see chat_stream for the events)."""
+    start_time = time.time()
+    fw = request.framework
+
+    cached = await _cached_response(request, start_time)
+    if cached:
+        cached.redactions = redactions or None
+        cached.session_id = request.session_id
+        _record_turn(request, cached)
+        yield _sse("token", {"text": cached.response})
+        _trace_outcome(tracing.current_span(), cached)
+        yield _sse("done", cached)
+        return
+
+    early, token_stream, llm_start = await _guarded_generation(request, start_time)
+    if early and early.blocked:
+        _trace_outcome(tracing.current_span(), early)
+        yield _sse("blocked", {**jsonable_encoder(early), "retract": False})
+        return
+    if early:
+        early.redactions = redactions or None
+        early.session_id = request.session_id
+        _record_turn(request, early)
+        yield _sse("token", {"text": early.response})
+        _trace_outcome(tracing.current_span(), early)
+        yield _sse("done", early)
+        return
+
+    window_only, final_only = _stream_guard_sets()
+    guard_windows = fw != "none"
+    full_response = ""
+    pending = ""
+    prev_tail = ""
+    ttft = None
+    window_guard_sec = 0.0
+
+    async def check_window(window: str) -> Optional[ChatResponse]:
+        nonlocal prev_tail, window_guard_sec
+        t0 = time.time()
+        with tracing.span("stage.output_window", **{"guard.framework": fw, "stream.offset": len(full_response)}) as span:
+            result = await run_output_guards(prev_tail + window, request, only=window_only)
+            span.set(**{"stage.blocked": bool(result)})
+        window_guard_sec += time.time() - t0
+        prev_tail = window[-STREAM_WINDOW_OVERLAP:] if STREAM_WINDOW_OVERLAP else ""
+        return result
+
+    async with aclosing(token_stream) as stream:
+        async for chunk in stream:
+            if not chunk:
+                continue
+            if ttft is None:
+                ttft = time.time() - llm_start
+            full_response += chunk
+            if not guard_windows:
+                yield _sse("token", {"text": chunk})
+                continue
+            pending += chunk
+            window, pending = _next_window(pending)
+            while window:
+                blocked = await check_window(window)
+                if blocked:
+                    # Leaving the `async with` closes the upstream request.
+                    await log_manager.log("Output Guard", "error", f"[stream] Window blocked after {len(full_response)} chars")
+                    await _log_output_blocked(start_time, window_guard_sec)
+                    _trace_outcome(tracing.current_span(), blocked)
+                    yield _sse("blocked", {**jsonable_encoder(blocked), "retract": False})
+                    return
+                yield _sse("token", {"text": window})
+                window, pending = _next_window(pending)
+
+    if pending:
+        blocked = await check_window(pending)
+        if blocked:
+            await _log_output_blocked(start_time, window_guard_sec)
+            _trace_outcome(tracing.current_span(), blocked)
+            yield _sse("blocked", {**jsonable_encoder(blocked), "retract": False})
+            return
+        yield _sse("token", {"text": pending})
+
+    llm_sec = time.time() - llm_start
+    ttft_info = f", TTFT {ttft:.2f}s" if ttft is not None else ""
+    await log_manager.log("LLM", "success", f"สร้างคำตอบเสร็จสิ้น ({llm_sec:.2f}s{ttft_info})", llm_sec)
+
+    output_guard_start = time.time()
+    with tracing.span("stage.output_guards", **{"guard.framework": fw}) as span:
+        blocked = await run_output_guards(full_response, request, only=final_only)
+        span.set(**{"stage.blocked": bool(blocked)})
+    output_guard_sec = time.time() - output_guard_start + window_guard_sec
+    if blocked:
+        await _log_output_blocked(start_time, output_guard_sec)
+        _trace_outcome(tracing.current_span(), blocked)
+        yield _sse("blocked", {**jsonable_encoder(blocked), "retract": True})
+        return
     await log_manager.log("Output Guard", "success", f"Output ผ่านทุกด่านแล้ว ({output_guard_sec:.2f}s)", output_guard_sec)
 
     total_sec = time.time() - start_time
-    metrics = get_resource_metrics()
-    cpu_info = f"CPU {metrics.get('cpu_percent', '—')}%"
-    
-    ram_info = f"RAM: {metrics.get('ram_used_gb', '—')}GB"
-    if metrics.get('ram_percent'): ram_info += f" ({metrics['ram_percent']}%)"
+    await _log_system_complete("Complete", total_sec, get_resource_metrics(), blocked=False)
+    result = ChatResponse(response=full_response, framework_used=fw)
+    await _store_response(request, result)
+    _record_turn(request, result)
+    result.redactions = redactions or None
+    result.session_id = request.session_id
+    _trace_outcome(tracing.current_span(), result)
+    yield _sse("done", result)
 
-    process_info = f"App: {metrics.get('process_mem_mb', '—')}MB"
 
-    # Show GB if > 1GB, else MB
-    gpu_mem = metrics.get('gpu_mem_gb')
-    if gpu_mem and gpu_mem > 1.0:
-        gpu_info = f"GPU: {gpu_mem}GB"
-    else:
-        gpu_info = f"GPU: {metrics.get('gpu_mem_mb', '—')}MB"
-        
-    if metrics.get('gpu_percent'): gpu_info += f" ({metrics['gpu_percent']}%)"
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Same pipeline as /chat, streamed as Server-Sent Events.
 
-    await log_manager.log(
-        "System", "complete",
-        f"Complete {total_sec:.2f}s\n"
-        f"CPU: {metrics.get('cpu_percent', '—')}%\n"
-        f"{ram_info}\n"
-        f"{process_info}\n"
-        f"{gpu_info}",
-        total_sec,
-        metrics=metrics,
-        blocked=False,
-    )
+    Events:
+      redacted {"message", "redactions"} — pii_action="redact" only: the masked message actually processed
+      token   {"text": ...}           — guard-approved text, in order
+      blocked ChatResponse + "retract" — stop; if retract is true, drop the text already shown
+      done    ChatResponse             — full reply, passed all output guards
+      trace   span breakdown           — request.trace only, last event (after done/blocked)
+
+    Windowed guards (STREAM_WINDOW_GUARDS, e.g. toxicity/competitor) run on each
+    sentence/window *before* it is released, and the upstream generation is closed
+    as soon as a window trips. Guards that need the whole reply (hallucination, the
+    remaining Llama Guard categories) run once at the end.
+    """
+    async def events() -> AsyncGenerator[str, None]:
+        async with _request_trace(request, "/chat/stream") as trace:
+            turn_request, redactions = await _redact_input(request)
+            if redactions:
+                yield _sse("redacted", {"message": turn_request.message, "redactions": redactions})
+            async with _session_turn(turn_request):
+                async with aclosing(_stream_turn(turn_request, redactions)) as turn:
+                    async for event in turn:
+                        yield event
+        if request.trace:
+            yield _sse("trace", trace.summary())
 
-    return ChatResponse(response=full_response, framework_used=fw)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 if __name__ == "__main__":
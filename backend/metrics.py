@@ -1,74 +1,205 @@
 """
 Lightweight CPU/GPU metrics for logging. Optional psutil for CPU.
+A background sampler refreshes one snapshot every RESOURCE_SAMPLE_INTERVAL_SEC (psutil and
+torch in a worker thread, Ollama /api/ps and GPUStack /v1/gpus over the shared async client),
+so get_resource_metrics() on the request path is a dict copy. The last RESOURCE_HISTORY_SIZE
+snapshots are kept as a time series for the UI (GET /resources/history).
 """
-from typing import Dict, Any
+import asyncio
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
 
-def get_resource_metrics() -> Dict[str, Any]:
-    """Return current CPU and GPU usage for log. Safe to call; missing deps return N/A."""
-    out: Dict[str, Any] = {
+from backend.config.settings import (
+    OLLAMA_HOST, GPUSTACK_HOST, GPUSTACK_API_KEY,
+    RESOURCE_SAMPLE_INTERVAL_SEC, RESOURCE_HISTORY_SIZE, RESOURCE_SAMPLE_GPUSTACK,
+)
+
+
+def _empty() -> Dict[str, Any]:
+    return {
         "cpu_percent": None, "cpu_cores": None, "cpu_threads": None,
         "ram_percent": None, "ram_used_mb": None, "ram_used_gb": None, "ram_total_gb": None,
         "process_mem_mb": None, "process_mem_gb": None, "process_threads": None,
         "gpu_mem_mb": None, "gpu_mem_gb": None, "gpu_percent": None, "gpu_name": None
     }
 
-    try:
-        import psutil
-        cpu = psutil.cpu_percent(interval=None)
-        out["cpu_percent"] = round(cpu, 1)
-        out["cpu_cores"] = psutil.cpu_count(logical=False)
-        out["cpu_threads"] = psutil.cpu_count(logical=True)
-        
-        # System RAM
-        mem = psutil.virtual_memory()
-        out["ram_percent"] = mem.percent
-        out["ram_used_mb"] = round(mem.used / (1024 ** 2), 2)
-        out["ram_used_gb"] = round(mem.used / (1024 ** 3), 2)
-        out["ram_total_gb"] = round(mem.total / (1024 ** 3), 2)
-
-        # Process Memory (App Usage)
-        process = psutil.Process()
-        mem_info = process.memory_info()
-        out["process_mem_mb"] = round(mem_info.rss / (1024 ** 2), 2)
-        out["process_mem_gb"] = round(mem_info.rss / (1024 ** 3), 2)
-        out["process_threads"] = process.num_threads()
-    except ImportError:
-        print("[Metrics] 'psutil' module not found.")
-    except Exception as e:
-        print(f"[Metrics] CPU/RAM Error: {e}")
-
-    # GPU: Get specific usage from Ollama API
-    try:
-        import requests
-        resp = requests.get("http://localhost:11434/api/ps", timeout=0.2)
-        if resp.status_code == 200:
-            data = resp.json()
-            models = data.get("models", [])
-            total_vram_bytes = sum(m.get("size_vram", 0) for m in models)
-            
-            # MB
-            out["gpu_mem_mb"] = round(total_vram_bytes / (1024 ** 2), 2)
-            # GB
-            out["gpu_mem_gb"] = round(total_vram_bytes / (1024 ** 3), 2)
-            
-            # % Usage (Model VRAM / Total System VRAM)
-            total_system_vram = 0
+
+class ResourceSampler:
+    def __init__(self, interval: float, history_size: int):
+        self.interval = max(0.2, interval)
+        self.latest: Dict[str, Any] = _empty()
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=max(1, history_size))
+        self.samples = 0
+        self.errors = 0
+        self._task: Optional[asyncio.Task] = None
+        self._process = None          # psutil.Process, created once
+        self._psutil_missing = False
+        self._vram_total: Optional[int] = None   # total VRAM never changes: queried once
+        self._gpu_name: Optional[str] = None
+
+    # --- collection (worker thread) ---
+
+    def _collect_host(self) -> Dict[str, Any]:
+        """psutil + torch — blocking calls, run via asyncio.to_thread."""
+        out: Dict[str, Any] = {}
+        if not self._psutil_missing:
+            try:
+                import psutil
+                if self._process is None:
+                    self._process = psutil.Process()
+                    # First cpu_percent(interval=None) call only sets the baseline
+                    psutil.cpu_percent(interval=None)
+                out["cpu_percent"] = round(psutil.cpu_percent(interval=None), 1)
+                out["cpu_cores"] = psutil.cpu_count(logical=False)
+                out["cpu_threads"] = psutil.cpu_count(logical=True)
+
+                # System RAM
+                mem = psutil.virtual_memory()
+                out["ram_percent"] = mem.percent
+                out["ram_used_mb"] = round(mem.used / (1024 ** 2), 2)
+                out["ram_used_gb"] = round(mem.used / (1024 ** 3), 2)
+                out["ram_total_gb"] = round(mem.total / (1024 ** 3), 2)
+
+                # Process Memory (App Usage)
+                mem_info = self._process.memory_info()
+                out["process_mem_mb"] = round(mem_info.rss / (1024 ** 2), 2)
+                out["process_mem_gb"] = round(mem_info.rss / (1024 ** 3), 2)
+                out["process_threads"] = self._process.num_threads()
+            except ImportError:
+                self._psutil_missing = True
+                print("[Metrics] 'psutil' module not found.")
+            except Exception as e:
+                print(f"[Metrics] CPU/RAM Error: {e}")
+
+        if self._vram_total is None and "torch" in sys.modules:
+            # Only if torch is already loaded (warm-up "gpu") — importing it here would take seconds
             try:
-                import torch
+                torch = sys.modules["torch"]
                 if torch.cuda.is_available():
-                    out["gpu_name"] = torch.cuda.get_device_name(0)
-                    # free, total = torch.cuda.mem_get_info(0)
-                    _, total_system_vram = torch.cuda.mem_get_info(0)
-            except:
-                out["gpu_name"] = "Ollama GPU"
-            
-            if total_system_vram > 0:
-                out["gpu_percent"] = round((total_vram_bytes / total_system_vram) * 100, 1)
-            else:
-                out["gpu_percent"] = 0.0
-
-    except Exception as e:
-        # print(f"[Metrics] Ollama GPU Check Error: {e}") 
-        pass
-
-    return out
+                    self._gpu_name = torch.cuda.get_device_name(0)
+                    _, self._vram_total = torch.cuda.mem_get_info(0)
+                else:
+                    self._vram_total = 0
+            except Exception:
+                self._vram_total = 0
+        return out
+
+    async def _collect_ollama(self) -> Dict[str, Any]:
+        """GPU: model VRAM from Ollama /api/ps."""
+        from backend.ollama_service import get_http_client
+        try:
+            resp = await get_http_client().get(f"{OLLAMA_HOST}/api/ps", timeout=1.0)
+            if resp.status_code != 200:
+                return {}
+            models = resp.json().get("models", [])
+        except Exception:
+            return {}
+        total_vram_bytes = sum(m.get("size_vram", 0) for m in models)
+        out = {
+            "gpu_mem_mb": round(total_vram_bytes / (1024 ** 2), 2),
+            "gpu_mem_gb": round(total_vram_bytes / (1024 ** 3), 2),
+            "gpu_name": self._gpu_name or "Ollama GPU",
+            "ollama_models": [m.get("name") for m in models],
+        }
+        # % Usage (Model VRAM / Total System VRAM)
+        out["gpu_percent"] = round(total_vram_bytes / self._vram_total * 100, 1) if self._vram_total else 0.0
+        return out
+
+    async def _collect_gpustack(self) -> Dict[str, Any]:
+        from backend.ollama_service import get_http_client
+        headers = {"Authorization": f"Bearer {GPUSTACK_API_KEY}"} if GPUSTACK_API_KEY else {}
+        try:
+            resp = await get_http_client().get(f"{GPUSTACK_HOST.rstrip('/')}/v1/gpus", headers=headers, timeout=1.0)
+            if resp.status_code != 200:
+                return {}
+            body = resp.json()
+        except Exception:
+            return {}
+        gpus = []
+        for gpu in body.get("data", body.get("items", [])):
+            memory, core = gpu.get("memory") or {}, gpu.get("core") or {}
+            gpus.append({
+                "name": gpu.get("name"),
+                "mem_used_gb": round(memory["used"] / (1024 ** 3), 2) if memory.get("used") is not None else None,
+                "mem_total_gb": round(memory["total"] / (1024 ** 3), 2) if memory.get("total") is not None else None,
+                "mem_percent": memory.get("utilization_rate"),
+                "util_percent": core.get("utilization_rate"),
+                "temperature": gpu.get("temperature"),
+            })
+        return {"gpustack_gpus": gpus}
+
+    async def sample(self) -> Dict[str, Any]:
+        """Take one snapshot now and make it the latest."""
+        jobs = [asyncio.to_thread(self._collect_host), self._collect_ollama()]
+        if RESOURCE_SAMPLE_GPUSTACK:
+            jobs.append(self._collect_gpustack())
+        snapshot = _empty()
+        for part in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(part, BaseException):
+                self.errors += 1
+                continue
+            snapshot.update(part)
+        snapshot["sampled_at"] = time.time()
+        self.latest = snapshot
+        self.history.append(snapshot)
+        self.samples += 1
+        return snapshot
+
+    # --- background task ---
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.sample()
+            except Exception as e:
+                self.errors += 1
+                print(f"[Metrics] Sampler error: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        """Start sampling on the running loop (idempotent; restarted if its loop is gone)."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def series(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        items = list(self.history)
+        return items[-limit:] if limit else items
+
+    def status(self) -> Dict[str, Any]:
+        age = time.time() - self.latest["sampled_at"] if "sampled_at" in self.latest else None
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_sec": self.interval,
+            "samples": self.samples,
+            "errors": self.errors,
+            "history": len(self.history),
+            "age_sec": round(age, 2) if age is not None else None,
+        }
+
+
+def get_resource_metrics() -> Dict[str, Any]:
+    """Return current CPU and GPU usage for log. Safe to call; missing deps return N/A."""
+    try:
+        # Callers without the app lifespan (scripts, tests) still get a sampler on first use
+        resource_sampler.start()
+    except RuntimeError:
+        pass  # no running loop
+    return dict(resource_sampler.latest)
+
+
+# Global instance
+resource_sampler = ResourceSampler(RESOURCE_SAMPLE_INTERVAL_SEC, RESOURCE_HISTORY_SIZE)
@@ -1,10 +1,143 @@
-from typing import List, Dict, Any, Generator, AsyncGenerator
-from starlette.concurrency import run_in_threadpool
-import os
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
 import json
-import requests
-import torch
-from backend.config.settings import OLLAMA_HOST, GPUSTACK_HOST, GPUSTACK_API_KEY
+import time
+import httpx
+from backend import tracing
+from backend.config.settings import (
+    OLLAMA_HOST, GPUSTACK_HOST, GPUSTACK_API_KEY,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_KEEPALIVE_EXPIRY,
+    LLM_PER_HOST_CONCURRENCY, GUARD_PER_HOST_CONCURRENCY, LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+)
+
+
+# --- Shared async HTTP client ---
+# One pooled client per event loop: keep-alive connections are reused across
+# requests, and a semaphore per (upstream host, purpose) caps concurrent calls — chat
+# generation and guard calls have separate pools.
+# (Pooled connections and semaphores are bound to the loop that created them, so both
+# are rebuilt if a new loop shows up — e.g. scripts calling asyncio.run() repeatedly.)
+_http_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_host_limits: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+
+
+async def _aclose_quietly(client: httpx.AsyncClient):
+    try:
+        await client.aclose()
+    except Exception as e:
+        print(f"[HTTP] Failed to close stale client: {e}")
+
+
+def _check_loop():
+    global _http_client, _client_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _client_loop:
+        old, old_loop = _http_client, _client_loop
+        _http_client = None
+        _host_limits.clear()
+        _client_loop = loop
+        if old is not None and not old.is_closed:
+            # ปิด client เดิมบน loop ของมันเองถ้ายังเปิดอยู่ ไม่งั้น best-effort บน loop ปัจจุบัน
+            if old_loop is not None and not old_loop.is_closed():
+                old_loop.call_soon_threadsafe(old_loop.create_task, _aclose_quietly(old))
+            else:
+                loop.create_task(_aclose_quietly(old))
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared pooled AsyncClient (created lazily on first use)."""
+    global _http_client
+    _check_loop()
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared client (called on app shutdown)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+class _NoLimit:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def host_slot(url: str, purpose: str = "chat"):
+    """Per-host concurrency limiter (async context manager); purpose "chat" | "guard" picks the pool."""
+    limit = GUARD_PER_HOST_CONCURRENCY if purpose == "guard" else LLM_PER_HOST_CONCURRENCY
+    if limit <= 0:
+        return _NoLimit()
+    _check_loop()
+    key = (urlsplit(url).netloc, purpose)
+    if key not in _host_limits:
+        _host_limits[key] = asyncio.Semaphore(limit)
+    return _host_limits[key]
+
+
+class _LLMSpan:
+    """Span for one upstream LLM call: TTFT, output chunks and decode rate."""
+
+    def __init__(self, system: str, model: str):
+        self.span = tracing.start_span("llm.chat", tracing.SPAN_KIND_CLIENT, **{
+            "gen_ai.system": system, "gen_ai.request.model": model,
+        })
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.chunks = 0
+
+    def chunk(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+            self.span.set(**{"llm.ttft_ms": round((self.first - self.start) * 1000, 2)})
+        self.chunks += 1
+
+    def end(self, error: Optional[str] = None, done: bool = True):
+        elapsed = time.perf_counter() - (self.first or self.start)
+        attrs = {"llm.output_chunks": self.chunks, "llm.completed": done}
+        if self.chunks > 1 and elapsed > 0:
+            attrs["llm.chunks_per_sec"] = round((self.chunks - 1) / elapsed, 2)
+        self.span.set(**attrs)
+        self.span.end(error)
+
+
+def _torch_gpu_info() -> Dict[str, Any]:
+    try:
+        import torch
+    except ImportError:
+        return {"cuda_available": False, "gpu_name": "None", "torch_version": None}
+    cuda_available = torch.cuda.is_available()
+    gpu_name = torch.cuda.get_device_name(0) if cuda_available else "None"
+    return {
+        "cuda_available": cuda_available,
+        "gpu_name": gpu_name,
+        "torch_version": torch.__version__
+    }
+
+
+def _ollama_usage(span, body: Dict[str, Any]):
+    """Token counts / decode rate from Ollama's final stream message."""
+    eval_count, eval_ns = body.get("eval_count"), body.get("eval_duration")
+    span.set(**{
+        "gen_ai.usage.input_tokens": body.get("prompt_eval_count"),
+        "gen_ai.usage.output_tokens": eval_count,
+        "llm.tokens_per_sec": round(eval_count / (eval_ns / 1e9), 2) if eval_count and eval_ns else None,
+    })
 
 
 class OllamaService:
@@ -12,51 +145,65 @@ class OllamaService:
 
     async def check_gpu(self) -> Dict[str, Any]:
         """Check if PyTorch can see the GPU."""
-        # Non-blocking check for local torch
-        cuda_available = torch.cuda.is_available()
-        gpu_name = torch.cuda.get_device_name(0) if cuda_available else "None"
-        return {
-            "cuda_available": cuda_available,
-            "gpu_name": gpu_name,
-            "torch_version": torch.__version__
-        }
+        # torch is imported on first call, in a worker thread (the import alone takes seconds)
+        return await asyncio.to_thread(_torch_gpu_info)
 
     async def list_models(self) -> List[str]:
         """List available models from Ollama."""
-        def _fetch():
-            try:
-                response = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=2.0)
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    return [m["name"] for m in models]
-                return []
-            except Exception as e:
-                print(f"[Ollama] Error listing models: {e}")
-                return []
-        return await run_in_threadpool(_fetch)
-
-    # Use sync generator for now as FastAPI handles threadpool offloading effectively for iterators
-    def chat_stream(self, model: str, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+        try:
+            response = await get_http_client().get(f"{OLLAMA_HOST}/api/tags", timeout=2.0)
+            if response.status_code == 200:
+                models = response.json().get("models", [])
+                return [m["name"] for m in models]
+            return []
+        except Exception as e:
+            print(f"[Ollama] Error listing models: {e}")
+            return []
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, str]],
+                          options: Optional[Dict[str, Any]] = None,
+                          response_format: Optional[Any] = None,
+                          keep_alive: Optional[str] = None,
+                          purpose: str = "chat") -> AsyncGenerator[str, None]:
+        """
+        options: extra Ollama generation options (num_predict, stop, ...), merged over temperature=0
+        response_format: Ollama structured output — "json" or a JSON schema dict
+        keep_alive: how long Ollama keeps the model (and its prompt KV cache) loaded, e.g. "30m"
+        purpose: "guard" for guard model calls — own per-host slot pool (see host_slot)
+        """
         url = f"{OLLAMA_HOST}/api/chat"
         payload = {
-            "model": model, 
-            "messages": messages, 
+            "model": model,
+            "messages": messages,
             "stream": True,
-            "options": {"temperature": 0} 
+            "options": {"temperature": 0, **(options or {})}
         }
+        if response_format is not None:
+            payload["format"] = response_format
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
 
+        llm_span, done, error = _LLMSpan("ollama", model), False, None
         try:
-            with requests.post(url, json=payload, stream=True, timeout=60) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        body = json.loads(line)
-                        if "message" in body:
-                            yield body["message"].get("content", "")
-                        if body.get("done", False):
-                            break
+            async with host_slot(url, purpose):
+                async with get_http_client().stream("POST", url, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line:
+                            body = json.loads(line)
+                            if "message" in body:
+                                llm_span.chunk()
+                                yield body["message"].get("content", "")
+                            if body.get("done", False):
+                                done = True
+                                _ollama_usage(llm_span.span, body)
+                                break
         except Exception as e:
+            error = str(e)
             yield f"Error calling Ollama: {str(e)}"
+        finally:
+            # Also runs when the consumer closes the stream early (guard verdict parsed, output blocked)
+            llm_span.end(error, done)
 
 
 class GPUStackService:
@@ -73,74 +220,94 @@ class GPUStackService:
         return h
 
     async def check_gpu(self) -> Dict[str, Any]:
-        def _check():
-            try:
-                headers = self._headers()
-                resp = requests.get(f"{self.base_url}/v1/gpus", headers=headers, timeout=1.5)
-                if resp.status_code == 200:
-                    gpus = resp.json().get("data", resp.json().get("items", []))
-                    if gpus:
-                        gpu_info = gpus[0]
-                        return {
-                            "cuda_available": True,
-                            "gpu_name": gpu_info.get("name", gpu_info.get("gpu_id", "GPUStack GPU")),
-                            "gpu_count": len(gpus),
-                            "backend": "gpustack",
-                        }
-            except Exception:
-                pass
-            
-            try:
-                resp = requests.get(f"{self.base_url}/v1/models", headers=self._headers(), timeout=1.5)
-                if resp.status_code == 200:
-                    return {"cuda_available": True, "gpu_name": "GPUStack (connected)", "backend": "gpustack"}
-            except Exception:
-                pass
-
-            return {"cuda_available": False, "gpu_name": "GPUStack (offline)", "backend": "gpustack"}
-
-        return await run_in_threadpool(_check)
+        client = get_http_client()
+        try:
+            resp = await client.get(f"{self.base_url}/v1/gpus", headers=self._headers(), timeout=1.5)
+            if resp.status_code == 200:
+                gpus = resp.json().get("data", resp.json().get("items", []))
+                if gpus:
+                    gpu_info = gpus[0]
+                    return {
+                        "cuda_available": True,
+                        "gpu_name": gpu_info.get("name", gpu_info.get("gpu_id", "GPUStack GPU")),
+                        "gpu_count": len(gpus),
+                        "backend": "gpustack",
+                    }
+        except Exception:
+            pass
+
+        try:
+            resp = await client.get(f"{self.base_url}/v1/models", headers=self._headers(), timeout=1.5)
+            if resp.status_code == 200:
+                return {"cuda_available": True, "gpu_name": "GPUStack (connected)", "backend": "gpustack"}
+        except Exception:
+            pass
+
+        return {"cuda_available": False, "gpu_name": "GPUStack (offline)", "backend": "gpustack"}
 
     async def list_models(self) -> List[str]:
-        def _fetch():
-            try:
-                headers = self._headers()
-                resp = requests.get(f"{self.base_url}/v1/models", headers=headers, timeout=1.5)
-                if resp.status_code == 200:
-                    data = resp.json().get("data", [])
-                    return [m["id"] for m in data]
-                return []
-            except Exception as e:
-                print(f"[GPUStack] Error listing models: {e}")
-                return []
-        return await run_in_threadpool(_fetch)
-
-    def chat_stream(self, model: str, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+        try:
+            resp = await get_http_client().get(f"{self.base_url}/v1/models", headers=self._headers(), timeout=1.5)
+            if resp.status_code == 200:
+                data = resp.json().get("data", [])
+                return [m["id"] for m in data]
+            return []
+        except Exception as e:
+            print(f"[GPUStack] Error listing models: {e}")
+            return []
+
+    async def chat_stream(self, model: str, messages: List[Dict[str, str]],
+                          options: Optional[Dict[str, Any]] = None,
+                          response_format: Optional[Any] = None,
+                          keep_alive: Optional[str] = None,
+                          purpose: str = "chat") -> AsyncGenerator[str, None]:
+        """
+        Same signature as OllamaService.chat_stream; Ollama options are mapped to OpenAI fields.
+        keep_alive has no OpenAI equivalent (models stay deployed; prefix caching is a server-side setting).
+        """
         url = f"{self.base_url}/v1/chat/completions"
         headers = self._headers()
         payload = {"model": model, "messages": messages, "stream": True}
+        options = options or {}
+        if "temperature" in options:
+            payload["temperature"] = options["temperature"]
+        if "num_predict" in options:
+            payload["max_tokens"] = options["num_predict"]
+        if "stop" in options:
+            payload["stop"] = options["stop"]
+        if response_format is not None:
+            if isinstance(response_format, dict):
+                payload["response_format"] = {"type": "json_schema", "json_schema": {"name": "output", "schema": response_format}}
+            else:
+                payload["response_format"] = {"type": "json_object"}
 
+        llm_span, done, error = _LLMSpan("gpustack", model), False, None
         try:
-            with requests.post(url, json=payload, headers=headers, stream=True, timeout=60) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if not line:
-                        continue
-                    line_str = line.decode("utf-8") if isinstance(line, bytes) else line
-                    if line_str.startswith("data: "):
-                        data_str = line_str[6:]
-                        if data_str.strip() == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(data_str)
-                            delta = chunk.get("choices", [{}])[0].get("delta", {})
-                            content = delta.get("content", "")
-                            if content:
-                                yield content
-                        except json.JSONDecodeError:
+            async with host_slot(url, purpose):
+                async with get_http_client().stream("POST", url, json=payload, headers=headers) as response:
+                    response.raise_for_status()
+                    async for line_str in response.aiter_lines():
+                        if not line_str:
                             continue
+                        if line_str.startswith("data: "):
+                            data_str = line_str[6:]
+                            if data_str.strip() == "[DONE]":
+                                done = True
+                                break
+                            try:
+                                chunk = json.loads(data_str)
+                                delta = chunk.get("choices", [{}])[0].get("delta", {})
+                                content = delta.get("content", "")
+                                if content:
+                                    llm_span.chunk()
+                                    yield content
+                            except json.JSONDecodeError:
+                                continue
         except Exception as e:
+            error = str(e)
             yield f"Error calling GPUStack: {str(e)}"
+        finally:
+            llm_span.end(error, done)
 
 
 # --- Singleton instances ---
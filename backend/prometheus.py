@@ -0,0 +1,242 @@
+"""
+Prometheus metrics — counters / gauges / histograms served on GET /metrics (text format 0.0.4).
+Fed from finished tracing spans (backend/tracing.py), so the request path only pays a few dict
+updates per span: request counts/latency, blocks by violation type, per-guard latency, upstream
+LLM TTFT / duration / tokens, cache hits. No prometheus_client dependency.
+Values are per worker process — scrape each uvicorn worker (or run one worker per port).
+"""
+import bisect
+import math
+from typing import Dict, List, Sequence, Tuple
+
+from backend import tracing
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """Child for these label values (created on first use, then one dict lookup)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_str(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines += self._render_child(key, child)
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{self._label_str(key)} {_format(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)   # per bucket, last = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, key, child: _HistogramValue) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.upper_bounds + (math.inf,), child.counts):
+            cumulative += count
+            le = 'le="' + _format(bound) + '"'
+            lines.append(f"{self.name}_bucket{self._label_str(key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {_format(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {child.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+registry = Registry()
+
+# mode: Llama Guard separate / combined, NeMo emb / qwen / hybrid ("" for other frameworks)
+REQUESTS = registry.counter("guardrails_requests_total", "Chat requests handled", ["endpoint", "framework", "mode"])
+REQUEST_SECONDS = registry.histogram(
+    "guardrails_request_duration_seconds", "End-to-end chat request latency", ["endpoint", "framework", "mode"],
+)
+INFLIGHT = registry.gauge("guardrails_inflight_requests", "Chat requests currently in progress")
+BLOCKS = registry.counter("guardrails_blocks_total", "Blocked requests by violation type", ["framework", "violation_type"])
+GUARD_SECONDS = registry.histogram(
+    "guardrails_guard_duration_seconds", "Guard invocation latency (cache=hit is a verdict-cache lookup)",
+    ["framework", "guard", "stage", "mode", "cache"],
+)
+PREFILTER = registry.counter("guardrails_prefilter_decisions_total", "Keyword prefilter outcomes", ["stage", "decision"])
+CACHE_HITS = registry.counter("guardrails_cache_hits_total", "Cache hits by cache (verdict / response / semantic)", ["cache"])
+LLM_REQUESTS = registry.counter(
+    "guardrails_llm_requests_total",
+    "Upstream LLM calls (aborted = closed early: guard verdict parsed, stream blocked, speculative cancel)",
+    ["model", "backend", "outcome"],
+)
+LLM_TTFT = registry.histogram("guardrails_llm_ttft_seconds", "Upstream LLM time to first token", ["model", "backend"])
+LLM_SECONDS = registry.histogram("guardrails_llm_duration_seconds", "Upstream LLM call duration", ["model", "backend"])
+LLM_TOKENS = registry.counter(
+    "guardrails_llm_output_tokens_total", "Generated tokens (stream chunks where the backend reports no usage)",
+    ["model", "backend"],
+)
+
+
+def _stage(span: tracing.Span) -> str:
+    # "Input Guard" -> "input"
+    return str(span.attributes.get("guard.stage", "")).split(" ")[0].lower()
+
+
+def _record_span(span: tracing.Span):
+    """Span processor: turn finished spans into metric updates."""
+    attrs = span.attributes
+    seconds = (span.end_ns - span.start_ns) / 1e9
+    name = span.name
+    if name == "guard.check":
+        hit = attrs.get("guard.cache_hit", False)
+        GUARD_SECONDS.labels(attrs.get("guard.framework", ""), attrs.get("guard.name", ""), _stage(span),
+                             attrs.get("guard.mode") or "", "hit" if hit else "miss").observe(seconds)
+        if hit:
+            CACHE_HITS.labels("verdict").inc()
+    elif name == "llm.chat":
+        model, backend = attrs.get("gen_ai.request.model", ""), attrs.get("gen_ai.system", "")
+        outcome = "error" if span.error else "completed" if attrs.get("llm.completed") else "aborted"
+        LLM_REQUESTS.labels(model, backend, outcome).inc()
+        LLM_SECONDS.labels(model, backend).observe(seconds)
+        if "llm.ttft_ms" in attrs:
+            LLM_TTFT.labels(model, backend).observe(attrs["llm.ttft_ms"] / 1000)
+        tokens = attrs.get("gen_ai.usage.output_tokens", attrs.get("llm.output_chunks", 0))
+        if tokens:
+            LLM_TOKENS.labels(model, backend).inc(tokens)
+    elif name == "guard.prefilter":
+        decision = "block" if "guard.blocked" in attrs else "skip" if "guard.skipped" in attrs else "pass"
+        PREFILTER.labels(_stage(span), decision).inc()
+    elif span.parent_id == "" and "http.route" in attrs:
+        framework, endpoint, mode = attrs.get("chat.framework", ""), attrs["http.route"], attrs.get("chat.guard_mode") or ""
+        REQUESTS.labels(endpoint, framework, mode).inc()
+        REQUEST_SECONDS.labels(endpoint, framework, mode).observe(seconds)
+        if attrs.get("chat.blocked"):
+            BLOCKS.labels(framework, attrs.get("chat.violation_type") or "unknown").inc()
+        if "chat.cache" in attrs:
+            CACHE_HITS.labels(attrs["chat.cache"]).inc()
+
+
+tracing.add_span_processor(_record_span)
+
+
+def render() -> str:
+    return registry.render()
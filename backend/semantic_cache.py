@@ -0,0 +1,162 @@
+"""
+Semantic FAQ cache — reuse an approved answer for paraphrased questions.
+Entries are (question embedding, guard-approved ChatResponse) kept in a NumPy matrix;
+a lookup is one matrix-vector product, restricted to the same scope (model, backend,
+framework, guard toggles, system prompt, guard config). Per-entry TTL, LRU eviction
+past SEMANTIC_CACHE_MAX_ENTRIES. Entries live in the worker process.
+"""
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config.settings import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SEC,
+)
+from backend.embeddings import embedder
+
+
+@dataclass
+class SemanticEntry:
+    id: str
+    scope: str
+    question: str
+    response: Dict[str, Any]
+    created_at: float
+    expires_at: float
+    last_hit: float
+    hits: int = 0
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "question": self.question,
+            "response": self.response.get("response", "")[:200],
+            "hits": self.hits,
+            "age_sec": round(now - self.created_at, 1),
+            "expires_in_sec": round(self.expires_at - now, 1),
+        }
+
+
+class SemanticCache:
+    def __init__(self, enabled: bool, threshold: float, max_entries: int, ttl_sec: float):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries: List[SemanticEntry] = []
+        self._vectors: Optional[np.ndarray] = None   # (n, dim), row i <-> _entries[i]
+        self._scopes = np.empty(0, dtype=object)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _remove(self, indices: List[int]):
+        if not indices:
+            return
+        drop = set(indices)
+        self._entries = [e for i, e in enumerate(self._entries) if i not in drop]
+        self._vectors = np.delete(self._vectors, indices, axis=0) if self._entries else None
+        self._scopes = np.delete(self._scopes, indices)
+
+    def _purge_expired(self, now: float):
+        self._remove([i for i, e in enumerate(self._entries) if e.expires_at <= now])
+
+    def _nearest(self, vec: np.ndarray, scope: str) -> Tuple[int, float]:
+        """(index, similarity) of the closest entry in `scope`, or (-1, -1.0)."""
+        if self._vectors is None:
+            return -1, -1.0
+        sims = np.where(self._scopes == scope, self._vectors @ vec, -1.0)
+        idx = int(np.argmax(sims))
+        return idx, float(sims[idx])
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            return await embedder.embed_one(text)
+        except Exception as e:
+            self.errors += 1
+            print(f"[SemanticCache] Embedding failed: {e}")
+            return None
+
+    async def lookup(self, text: str, scope: str) -> Optional[Tuple[SemanticEntry, float]]:
+        """Return (entry, similarity) of an approved answer for a paraphrase of `text`, or None."""
+        vec = await self._embed(text)
+        if vec is None:
+            return None
+        now = time.time()
+        self._purge_expired(now)
+        idx, sim = self._nearest(vec, scope)
+        if idx < 0 or sim < self.threshold:
+            self.misses += 1
+            return None
+        entry = self._entries[idx]
+        entry.hits += 1
+        entry.last_hit = now
+        self.hits += 1
+        return entry, sim
+
+    async def add(self, text: str, scope: str, response: Dict[str, Any]) -> Optional[str]:
+        """Store a guard-approved answer; a near-duplicate question in the same scope is replaced."""
+        vec = await self._embed(text)
+        if vec is None:
+            return None
+        now = time.time()
+        self._purge_expired(now)
+        idx, sim = self._nearest(vec, scope)
+        if idx >= 0 and sim >= self.threshold:
+            self._remove([idx])
+        entry = SemanticEntry(
+            id=uuid.uuid4().hex[:12], scope=scope, question=text, response=response,
+            created_at=now, expires_at=now + self.ttl_sec, last_hit=now,
+        )
+        self._entries.append(entry)
+        self._vectors = vec[None, :] if self._vectors is None else np.vstack([self._vectors, vec])
+        self._scopes = np.append(self._scopes, np.array([scope], dtype=object))
+        if len(self._entries) > self.max_entries:
+            # Evict least-recently hit
+            excess = len(self._entries) - self.max_entries
+            order = sorted(range(len(self._entries)), key=lambda i: self._entries[i].last_hit)
+            self._remove(order[:excess])
+            self.evictions += excess
+        return entry.id
+
+    def delete(self, entry_id: str) -> bool:
+        for i, e in enumerate(self._entries):
+            if e.id == entry_id:
+                self._remove([i])
+                return True
+        return False
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._remove(list(range(count)))
+        return count
+
+    def entries(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        self._purge_expired(now)
+        return [e.summary(now) for e in self._entries]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_sec": self.ttl_sec,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+# Global instance
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SEC,
+)
@@ -0,0 +1,147 @@
+"""
+Conversation sessions — server-side history for multi-turn chat (ChatRequest.session_id).
+Only turns that passed every input and output guard are recorded, so a later turn only needs
+its new message and reply guarded. The history is bound to the guard scope it was cleared under
+(framework, mode, toggles): a turn under a different scope starts a fresh history, and turns
+without any guard neither read nor extend it. History is append-only between trims: each LLM call is the
+previous call's messages plus the new turn, which keeps the prompt prefix cacheable by the
+backend. Bounded: LRU over SESSION_MAX_SESSIONS, idle TTL, SESSION_MAX_TURNS per session.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from backend.config.settings import (
+    SESSION_MAX_SESSIONS, SESSION_TTL_SEC, SESSION_MAX_TURNS, SESSION_CONTEXT_MAX_CHARS,
+)
+
+
+@dataclass
+class Session:
+    id: str
+    created_at: float
+    last_used: float
+    messages: List[Dict[str, str]] = field(default_factory=list)   # cleared user/assistant messages
+    cleared_turns: int = 0      # turns that passed all guards (including trimmed ones)
+    trimmed_turns: int = 0
+    guard_scope: Optional[str] = None   # guard config the history was cleared under
+    scope_resets: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    @property
+    def turns(self) -> int:
+        return len(self.messages) // 2
+
+    def add_turn(self, user: str, assistant: str, max_turns: int):
+        self.messages += [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+        self.cleared_turns += 1
+        if self.turns > max_turns:
+            # Drop the oldest half at once (not one turn per call) so the cached prefix
+            # stays valid for the next max_turns/2 turns instead of changing every turn
+            drop = self.turns - max_turns // 2
+            self.messages = self.messages[drop * 2:]
+            self.trimmed_turns += drop
+
+    def grounding_context(self, max_chars: int) -> str:
+        """Running hallucination context: the most recent cleared turns, newest kept."""
+        lines = [f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in self.messages]
+        context = "\n".join(lines)
+        return context[-max_chars:] if max_chars else context
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "turns": self.turns,
+            "cleared_turns": self.cleared_turns,
+            "trimmed_turns": self.trimmed_turns,
+            "scope_resets": self.scope_resets,
+            "age_sec": round(now - self.created_at, 1),
+            "idle_sec": round(now - self.last_used, 1),
+            "messages": self.messages,
+        }
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int, ttl_sec: float, max_turns: int, context_max_chars: int):
+        self.max_sessions = max_sessions
+        self.ttl_sec = ttl_sec
+        self.max_turns = max(2, max_turns)
+        self.context_max_chars = context_max_chars
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evictions = 0
+
+    def _purge_expired(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used < self.ttl_sec:
+                break
+            del self._sessions[oldest.id]
+            self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[Session]:
+        now = time.time()
+        self._purge_expired(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id: str) -> Session:
+        session = self.get(session_id)
+        if session is None:
+            now = time.time()
+            session = self._sessions[session_id] = Session(session_id, now, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def _scoped(self, session_id: Optional[str], scope: Optional[str]) -> Optional[Session]:
+        """The session, if its history was cleared under `scope` (None = unguarded turn: no history)."""
+        session = self._sessions.get(session_id) if session_id and scope else None
+        return session if session is not None and session.guard_scope == scope else None
+
+    def begin_turn(self, session: Session, scope: Optional[str]):
+        """A guarded turn under a different scope than the history's starts the history over."""
+        if scope is None or session.guard_scope == scope:
+            return
+        if session.messages:
+            session.messages = []
+            session.scope_resets += 1
+        session.guard_scope = scope
+
+    def history(self, session_id: Optional[str], scope: Optional[str]) -> List[Dict[str, str]]:
+        session = self._scoped(session_id, scope)
+        return list(session.messages) if session else []
+
+    def record(self, session_id: str, scope: Optional[str], user: str, assistant: str):
+        """Append a turn that passed every guard of `scope` (unguarded turns are never recorded)."""
+        if scope is None:
+            return
+        session = self.get_or_create(session_id)
+        self.begin_turn(session, scope)
+        session.add_turn(user, assistant, self.max_turns)
+
+    def grounding_context(self, session_id: Optional[str], scope: Optional[str]) -> str:
+        session = self._scoped(session_id, scope)
+        return session.grounding_context(self.context_max_chars) if session else ""
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge_expired(time.time())
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_sec": self.ttl_sec,
+            "max_turns": self.max_turns,
+            "evictions": self.evictions,
+        }
+
+
+# Global instance
+sessions = SessionStore(SESSION_MAX_SESSIONS, SESSION_TTL_SEC, SESSION_MAX_TURNS, SESSION_CONTEXT_MAX_CHARS)
@@ -0,0 +1,52 @@
+"""
+Speculative generation — start the LLM while the input guards are still running.
+Tokens are buffered (never shown) until the caller consumes them after the guards pass;
+if an input guard blocks, cancel() aborts the upstream generation.
+"""
+import asyncio
+from contextlib import aclosing, suppress
+from typing import AsyncGenerator, AsyncIterator
+
+_DONE = object()
+
+
+class SpeculativeStream:
+    """Eagerly drains an async token stream into a buffer in a background task."""
+
+    def __init__(self, stream: AsyncGenerator[str, None]):
+        self._stream = stream
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            # aclosing: cancelling the task closes the generator -> closes the HTTP stream
+            async with aclosing(self._stream) as stream:
+                async for chunk in stream:
+                    self._queue.put_nowait(chunk)
+        finally:
+            self._queue.put_nowait(_DONE)
+
+    @property
+    def buffered(self) -> int:
+        """Number of chunks generated but not yet consumed."""
+        return self._queue.qsize()
+
+    async def cancel(self):
+        """Abort the upstream generation and drop the buffer."""
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """Replay the buffered chunks, then keep streaming live ones."""
+        while True:
+            chunk = await self._queue.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if not self._task.cancelled():
+            self._task.result()  # re-raise a generation error, if any
+
+    async def aclose(self):
+        await self.cancel()
@@ -0,0 +1,233 @@
+"""
+Request tracing — OpenTelemetry-compatible spans without the SDK dependency.
+A trace covers one chat request: stage spans (input/output guards), one span per guard
+invocation (framework, guard, mode, cache hit) and one per upstream LLM call (model, backend,
+TTFT, chunks/s). Finished traces are appended as OTLP/JSON lines to TRACE_EXPORT_PATH
+(readable by the OTel Collector file receiver / otel-desktop-viewer) and can be attached
+to the response (ChatRequest.trace).
+Spans nest through a ContextVar, so guards run via asyncio tasks get the right parent.
+"""
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from backend.config.settings import TRACE_EXPORT_PATH, TRACE_SERVICE_NAME
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+
+class Span:
+    def __init__(self, name: str, trace: "Trace", parent_id: str = "", kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.set(**(attributes or {}))
+
+    def set(self, **attributes: Any):
+        """Set attributes (None values are skipped). Dotted names: pass as **{"guard.name": ...}."""
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def end(self, error: Optional[str] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error:
+            self.error = error
+        self.trace.spans.append(self)
+        for processor in _processors:
+            try:
+                processor(self)
+            except Exception as e:
+                print(f"[Tracing] WARN span processor failed: {e}")
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+class _NoopSpan:
+    """Returned when no trace is active — instrumentation stays unconditional."""
+
+    def set(self, **attributes: Any):
+        pass
+
+    def end(self, error: Optional[str] = None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.root = Span(name, self, attributes=attributes)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "backend.tracing"},
+                    "spans": [span.to_otlp() for span in self.spans],
+                }],
+            }]
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact per-span breakdown for the API response."""
+        names = {span.span_id: span.name for span in self.spans}
+        spans = sorted(self.spans, key=lambda s: s.start_ns)
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self.root.duration_ms, 2),
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": names.get(span.parent_id),
+                    "start_ms": round((span.start_ns - self.root.start_ns) / 1e6, 2),
+                    "duration_ms": round(span.duration_ms, 2),
+                    "attributes": span.attributes,
+                    **({"error": span.error} if span.error else {}),
+                }
+                for span in spans
+            ],
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Called with every finished span, on the thread that ended it (e.g. backend/prometheus.py)
+_processors: List[Callable[[Span], None]] = []
+
+
+def add_span_processor(processor: Callable[[Span], None]):
+    if processor not in _processors:
+        _processors.append(processor)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any):
+    """
+    Child of the current span, NOT made current — for work whose lifetime doesn't follow a
+    `with` block (async generators such as LLM streams). Call .end() when done.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace, parent.span_id, kind, attributes)
+
+
+def _reset(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        pass  # closed from another context (e.g. a cancelled stream) — the span still ends
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Any]:
+    """Child span of the current one, current for the duration of the block."""
+    child = start_span(name, kind, **attributes)
+    if child is NOOP_SPAN:
+        yield child
+        return
+    token = _current_span.set(child)
+    error = None
+    try:
+        yield child
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _reset(token)
+        child.end(error)
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Trace]:
+    """Start a new trace whose root span covers the block."""
+    new_trace = Trace(name, attributes)
+    token = _current_span.set(new_trace.root)
+    error = None
+    try:
+        yield new_trace
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _reset(token)
+        new_trace.root.end(error)
+
+
+class OTLPFileExporter:
+    """Appends one OTLP/JSON ExportTraceServiceRequest per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, payload: Dict[str, Any]):
+        line = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.exported += 1
+        except OSError as e:
+            self.errors += 1
+            print(f"[Tracing] WARN export failed: {e}")
+
+
+exporter: Optional[OTLPFileExporter] = OTLPFileExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+
+async def export(finished: Trace):
+    """Write a finished trace to the file exporter (off the event loop). No-op without TRACE_EXPORT_PATH."""
+    if exporter is not None:
+        await asyncio.to_thread(exporter.write, finished.to_otlp())
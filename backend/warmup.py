@@ -0,0 +1,117 @@
+"""
+Warm-up registry — guard frameworks are loaded on first use or by a background preload
+instead of at import time, so the server accepts requests (and /health answers) within seconds.
+WARMUP_EAGER picks the components preloaded at startup; the rest load on first use.
+Readiness per component is reported on /health.
+"""
+import asyncio
+import importlib
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend.config.settings import WARMUP_EAGER
+
+
+@dataclass
+class _Component:
+    name: str
+    loader: Callable[[], Awaitable[Any]]
+    eager: bool
+    status: str = "cold"          # cold | loading | ready | failed
+    load_sec: Optional[float] = None
+    detail: Any = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Future] = None
+
+
+class WarmupRegistry:
+    def __init__(self):
+        self._components: Dict[str, _Component] = {}
+
+    def register(self, name: str, loader: Callable[[], Awaitable[Any]]):
+        self._components[name] = _Component(name, loader, eager=name in WARMUP_EAGER)
+
+    def is_ready(self, name: str) -> bool:
+        comp = self._components.get(name)
+        return comp is None or comp.status == "ready"
+
+    async def _load(self, comp: _Component):
+        comp.status = "loading"
+        start = time.time()
+        try:
+            comp.detail = await comp.loader()
+            comp.status = "ready"
+            comp.error = None
+            print(f"[Warmup] {comp.name} ready ({time.time() - start:.1f}s)")
+        except Exception as e:
+            comp.status = "failed"
+            comp.error = str(e)
+            print(f"[Warmup] WARN {comp.name} failed to load: {e}")
+        comp.load_sec = round(time.time() - start, 2)
+
+    async def ensure(self, name: str) -> bool:
+        """Load `name` if needed (concurrent callers share one load). Never raises; False if it failed."""
+        comp = self._components.get(name)
+        if comp is None:
+            return True
+        if comp.status != "ready":
+            if comp.task is None or (comp.task.done() and comp.status == "failed"):
+                comp.task = asyncio.ensure_future(self._load(comp))
+            await asyncio.shield(comp.task)
+        return comp.status == "ready"
+
+    def start_eager(self):
+        """Kick off the background preload of every eager component (called at startup)."""
+        for comp in self._components.values():
+            if comp.eager:
+                asyncio.ensure_future(self.ensure(comp.name))
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            comp.name: {
+                "status": comp.status,
+                "mode": "eager" if comp.eager else "lazy",
+                "load_sec": comp.load_sec,
+                "detail": comp.detail,
+                "error": comp.error,
+            }
+            for comp in self._components.values()
+        }
+
+
+# --- Loaders ---
+
+async def _load_guardrails_ai():
+    def load():
+        from backend.guards import guardrails_ai as g
+        guards = {
+            "pii": g.pii_guard, "jailbreak": g.jailbreak_guard, "toxicity": g.toxicity_guard,
+            "off_topic": g.off_topic_guard, "hallucination": g.hallucination_guard, "competitor": g.competitor_guard,
+        }
+        return {name: ("installed" if guard.load() else "not installed") for name, guard in guards.items()}
+    return await asyncio.to_thread(load)
+
+
+async def _load_nemo():
+    engine = await asyncio.to_thread(importlib.import_module, "backend.guards.nemo.nemo_engine")
+    if not await engine.warm_up():
+        raise RuntimeError("nemoguardrails not available")
+
+
+async def _load_llama_guard():
+    checker = await asyncio.to_thread(importlib.import_module, "backend.guards.llama_guard.checker_llamaguard")
+    return await checker.llama_guard_checker.warm_up()
+
+
+async def _load_gpu():
+    torch = await asyncio.to_thread(importlib.import_module, "torch")
+    return {"torch_version": torch.__version__}
+
+
+# Global instance
+warmup = WarmupRegistry()
+warmup.register("guardrails_ai", _load_guardrails_ai)
+warmup.register("nemo", _load_nemo)
+warmup.register("llama_guard", _load_llama_guard)
+warmup.register("gpu", _load_gpu)
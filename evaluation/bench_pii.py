@@ -0,0 +1,110 @@
+"""
+PII scanner microbenchmark — single-pass compiled scanner vs. the previous per-pattern implementation.
+
+Usage:
+  python -m evaluation.bench_pii
+  python -m evaluation.bench_pii --repeat 2000
+"""
+
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from backend.guards.llama_guard.pii_llamaguard import pii_guard
+
+
+class LegacyPIIGuard:
+    """The previous PIIGuard.scan: one re.findall per pattern + a fresh regex per name keyword."""
+
+    def __init__(self):
+        self.patterns = {
+            "PHONE":         r"(?:0[689]\d{1}[-.\s]?\d{3}[-.\s]?\d{4}|0[2-9]\d{1}[-.\s]?\d{3}[-.\s]?\d{4})",
+            "ID_CARD":       r"\b\d{1}[-\s]?\d{4}[-\s]?\d{5}[-\s]?\d{2}[-\s]?\d{1}\b",
+            "ID_CARD_RAW":   r"\b\d{13}\b",
+            "EMAIL":         r"[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}",
+            "CREDIT_CARD":   r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b",
+            "BANK_ACCOUNT":  r"(?:เลขบัญชี|บัญชี|account)\s*[:：]?\s*\d{3}[-\s]?\d{1}[-\s]?\d{5}[-\s]?\d{1}",
+            "PASSPORT":      r"\b[A-Z]{1,2}\d{6,8}\b",
+            "LINE_ID":       r"(?:line|ไลน์|ไอดี)\s*[:：]?\s*[@]?[a-zA-Z0-9._\-]{3,}",
+            "DOB":           r"(?:เกิด|วันเกิด|born)\s*[:：]?\s*\d{1,2}[-/.\s]\d{1,2}[-/.\s]\d{2,4}",
+            "ADDRESS":       r"(?:บ้านเลขที่|ที่อยู่|ซอย|ถนน|ตำบล|อำเภอ|จังหวัด)\s*[:：]?\s*\S+",
+        }
+        self.name_keywords = ["ชื่อ", "นามสกุล", "นาย", "นาง", "นางสาว", "ด.ช.", "ด.ญ.", "คุณ"]
+
+    def scan(self, text: str) -> Tuple[bool, str]:
+        found: List[str] = []
+        for pii_type, pattern in self.patterns.items():
+            matches = re.findall(pattern, text, re.IGNORECASE)
+            if matches:
+                found.append(f"{pii_type}: {len(matches)}")
+
+        for keyword in self.name_keywords:
+            if keyword in text:
+                pattern = rf"{re.escape(keyword)}\s*[:：]?\s*([฀-๿a-zA-Z]+\s*[฀-๿a-zA-Z]*)"
+                match = re.search(pattern, text)
+                if match and len(match.group(1).strip()) > 2:
+                    found.append(f"NAME(via '{keyword}')")
+                    break
+
+        if found:
+            return False, ", ".join(found)
+        return True, "No PII detected"
+
+
+def load_messages() -> List[str]:
+    """Dataset inputs + a few longer synthetic chat turns."""
+    dataset = json.loads((Path(__file__).parent / "dataset.json").read_text(encoding="utf-8"))
+    messages = [case["input"] for case in dataset["test_cases"]]
+    messages += [
+        "สวัสดีค่ะ อยากทราบตารางรถไฟขบวนพิเศษกรุงเทพ-เชียงใหม่ ช่วงสงกรานต์ มีที่นั่งชั้น 2 ปรับอากาศเหลือไหมคะ " * 4,
+        "ผมชื่อ สมชาย ใจดี เบอร์ 081-234-5678 อีเมล somchai@example.com บัตรประชาชน 1-1002-00300-40-1 ช่วยจองตั๋วให้หน่อย",
+        "Please book 2 tickets Bangkok to Hua Hin, passport AB1234567, line: somchai_99, born 12/04/1990",
+    ]
+    return messages
+
+
+def bench(fn, messages: List[str], repeat: int) -> List[float]:
+    """Per-message cost (µs), median over `repeat` passes for each message."""
+    per_message = []
+    for text in messages:
+        fn(text)  # warm up
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(text)
+            samples.append(time.perf_counter() - t0)
+        per_message.append(statistics.median(samples) * 1e6)
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PII scanner microbenchmark")
+    parser.add_argument("--repeat", type=int, default=500, help="Runs per message")
+    args = parser.parse_args()
+
+    messages = load_messages()
+    legacy = LegacyPIIGuard()
+
+    mismatches = [m for m in messages if legacy.scan(m)[0] != pii_guard.scan(m)[0]]
+
+    legacy_us = bench(legacy.scan, messages, args.repeat)
+    new_us = bench(pii_guard.scan, messages, args.repeat)
+
+    print(f"\n{'=' * 60}")
+    print(f"  PII scanner microbenchmark — {len(messages)} messages × {args.repeat} runs")
+    print(f"{'=' * 60}")
+    print(f"  {'':<22} {'mean µs':>10} {'median µs':>10} {'max µs':>10}")
+    for label, values in (("legacy (per-pattern)", legacy_us), ("compiled single-pass", new_us)):
+        print(f"  {label:<22} {statistics.mean(values):>10.1f} {statistics.median(values):>10.1f} {max(values):>10.1f}")
+    print(f"\n  Speed-up (mean): {statistics.mean(legacy_us) / statistics.mean(new_us):.2f}x")
+    print(f"  Verdict mismatches: {len(mismatches)}")
+    for m in mismatches:
+        print(f"    - {m[:80]!r}: legacy={legacy.scan(m)} new={pii_guard.scan(m)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,32 @@
 SRT Chatbot Guardrails — Evaluation Script
 
 Measures guard performance with Precision, Recall, F1-Score per category.
+Cases are sent concurrently (--concurrency) at an optional target rate (--qps); each finished
+case is appended to results_<run>.partial.jsonl, so an interrupted run continues with --resume.
+Several frameworks / modes can be compared in one invocation (runs execute one after another).
 
 Usage:
   python -m evaluation.evaluate --framework guardrails_ai
   python -m evaluation.evaluate --framework nemo
   python -m evaluation.evaluate --framework llama_guard
+  python -m evaluation.evaluate --framework llama_guard --llama-guard-mode combined
   python -m evaluation.evaluate --framework guardrails_ai --model typhoon2.5
+  python -m evaluation.evaluate --framework guardrails_ai nemo llama_guard --concurrency 8 --qps 4
+  python -m evaluation.evaluate --framework nemo --nemo-mode emb qwen hybrid --resume
 """
 
 import json
 import time
+import asyncio
 import argparse
-import requests
+import httpx
 from collections import defaultdict
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 API_URL = "http://localhost:8000/chat"
+RESULTS_DIR = Path(__file__).parent
 
 # All 6 guards enabled for evaluation (Input 3 + Output 3)
 FRAMEWORK_DEFAULTS = {
@@ -37,6 +47,61 @@ FRAMEWORK_DEFAULTS = {
 }
 
 
+@dataclass
+class EvalRun:
+    framework: str
+    model: str
+    llama_guard_mode: str = "separate"
+    nemo_mode: str = "emb"
+
+    @property
+    def mode(self) -> Optional[str]:
+        if self.framework == "llama_guard":
+            return self.llama_guard_mode
+        if self.framework == "nemo":
+            return self.nemo_mode
+        return None
+
+    @property
+    def name(self) -> str:
+        # Default modes keep the historical file names (results_nemo.json, results_llama_guard.json)
+        default = {"llama_guard": "separate", "nemo": "emb"}.get(self.framework)
+        return self.framework if self.mode in (None, default) else f"{self.framework}_{self.mode}"
+
+    def payload(self, message: str) -> Dict[str, Any]:
+        payload = {
+            "message": message,
+            "model": self.model,
+            "framework": self.framework,
+            "backend": "ollama",
+            self.framework: FRAMEWORK_DEFAULTS.get(self.framework, {}),
+        }
+        if self.framework == "llama_guard":
+            payload["llama_guard_mode"] = self.llama_guard_mode
+        if self.framework == "nemo":
+            payload["nemo_mode"] = self.nemo_mode
+        return payload
+
+
+class RateLimiter:
+    """Spaces request starts 1/qps apart (qps <= 0: unlimited)."""
+
+    def __init__(self, qps: float):
+        self.interval = 1.0 / qps if qps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
 def calc_metrics(tp, tn, fp, fn):
     """Calculate Accuracy, Precision, Recall, F1."""
     total = tp + tn + fp + fn
@@ -47,69 +112,127 @@ def calc_metrics(tp, tn, fp, fn):
     return accuracy, precision, recall, f1
 
 
-def run_evaluation(framework: str, model: str, dataset_path: str):
+def classify(expected_blocked: bool, actually_blocked: bool) -> str:
+    if expected_blocked and actually_blocked:
+        return "TP"
+    if not expected_blocked and not actually_blocked:
+        return "TN"
+    if not expected_blocked and actually_blocked:
+        return "FP"
+    return "FN"
+
+
+def load_dataset(dataset_path: str) -> List[Dict[str, Any]]:
     with open(dataset_path, encoding="utf-8") as f:
         data = json.load(f)
-        dataset = data["test_cases"] if isinstance(data, dict) else data
-
-    toggles = FRAMEWORK_DEFAULTS.get(framework, {})
-    results = []
-    stats = defaultdict(lambda: {"tp": 0, "tn": 0, "fp": 0, "fn": 0, "latency": []})
+    return data["test_cases"] if isinstance(data, dict) else data
+
+
+def load_partial(path: Path) -> Dict[Any, Dict[str, Any]]:
+    """Finished cases of an interrupted run (cases that hit a request error are retried)."""
+    done: Dict[Any, Dict[str, Any]] = {}
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line of a killed run
+            if not result.get("error"):
+                done[result["id"]] = result
+    return done
+
+
+async def _run_case(client: httpx.AsyncClient, run: EvalRun, tc: Dict[str, Any], limiter: RateLimiter,
+                    timeout: float) -> Dict[str, Any]:
+    await limiter.wait()
+    start = time.time()
+    error = None
+    try:
+        res = await client.post(API_URL, json=run.payload(tc["input"]), timeout=timeout)
+        res.raise_for_status()
+        response_data = res.json()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        response_data = {"blocked": False, "response": f"ERROR: {e}"}
+    latency = time.time() - start
+
+    actually_blocked = response_data.get("blocked", False)
+    return {
+        **tc,
+        "blocked": actually_blocked,
+        "verdict": classify(tc["expected_blocked"], actually_blocked),
+        "latency": round(latency, 4),
+        "violation_type": response_data.get("violation_type", ""),
+        "response": (response_data.get("response") or "")[:120],
+        **({"error": error} if error else {}),
+    }
+
+
+async def run_cases(run: EvalRun, dataset: List[Dict[str, Any]], concurrency: int = 4, qps: float = 0.0,
+                    resume: bool = False, timeout: float = 120.0) -> List[Dict[str, Any]]:
+    """Send every case of one run; results are appended to the run's .partial.jsonl as they finish."""
+    partial_path = RESULTS_DIR / f"results_{run.name}.partial.jsonl"
+    done = load_partial(partial_path) if resume else {}
+    pending = [tc for tc in dataset if tc["id"] not in done]
+    if done:
+        print(f"  ↻ Resuming: {len(done)} cases already done, {len(pending)} to go")
+
+    # Rewrite the partial file with only the kept results (drops errored / torn lines)
+    with open(partial_path, "w", encoding="utf-8") as f:
+        for result in done.values():
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    limiter = RateLimiter(qps)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = list(done.values())
+    limits = httpx.Limits(max_connections=max(1, concurrency), max_keepalive_connections=max(1, concurrency))
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def worker(tc):
+            async with semaphore:
+                return await _run_case(client, run, tc, limiter, timeout)
+
+        with open(partial_path, "a", encoding="utf-8") as partial:
+            for next_done in asyncio.as_completed([worker(tc) for tc in pending]):
+                result = await next_done
+                partial.write(json.dumps(result, ensure_ascii=False) + "\n")
+                partial.flush()
+                results.append(result)
+
+                icon = "✅" if result["verdict"] in ("TP", "TN") else "❌"
+                err = "  [request error]" if result.get("error") else ""
+                print(f"  {icon} [{result['verdict']}] #{result['id']:>3} ({result['category']:<12}) | "
+                      f"{result['latency']:.2f}s | {result['description']}{err}")
+
+    return sorted(results, key=lambda r: r["id"])
+
+
+def run_evaluation(framework: str, model: str, dataset_path: str, llama_guard_mode: str = "separate",
+                   nemo_mode: str = "emb", concurrency: int = 4, qps: float = 0.0, resume: bool = False,
+                   timeout: float = 120.0) -> Dict[str, Any]:
+    run = EvalRun(framework, model, llama_guard_mode, nemo_mode)
+    dataset = load_dataset(dataset_path)
 
     print(f"\n{'='*70}")
-    print(f"  🔍 Evaluating: {framework} | Model: {model}")
+    mode_info = f" | Mode: {run.mode}" if run.mode else ""
+    print(f"  🔍 Evaluating: {framework}{mode_info} | Model: {model}")
     print(f"  Guards: Input(PII, Off-Topic, Jailbreak) + Output(Hallucination, Toxicity, Competitor)")
-    print(f"  Dataset: {len(dataset)} test cases")
+    print(f"  Dataset: {len(dataset)} test cases | Concurrency: {concurrency} | QPS: {qps or 'unlimited'}")
     print(f"{'='*70}\n")
 
-    for tc in dataset:
-        payload = {
-            "message": tc["input"],
-            "model": model,
-            "framework": framework,
-            "backend": "ollama",
-            framework: toggles,
-        }
+    wall_start = time.time()
+    results = asyncio.run(run_cases(run, dataset, concurrency, qps, resume, timeout))
+    wall_sec = time.time() - wall_start
+    return report(run, results, wall_sec)
+
 
-        start = time.time()
-        try:
-            res = requests.post(API_URL, json=payload, timeout=120)
-            response_data = res.json()
-        except Exception as e:
-            response_data = {"blocked": False, "response": f"ERROR: {e}"}
-        latency = time.time() - start
-
-        actually_blocked = response_data.get("blocked", False)
-        expected_blocked = tc["expected_blocked"]
-        cat = tc["category"]
-
-        # Classify
-        if expected_blocked and actually_blocked:
-            verdict = "TP"
-            stats[cat]["tp"] += 1
-        elif not expected_blocked and not actually_blocked:
-            verdict = "TN"
-            stats[cat]["tn"] += 1
-        elif not expected_blocked and actually_blocked:
-            verdict = "FP"
-            stats[cat]["fp"] += 1
-        else:
-            verdict = "FN"
-            stats[cat]["fn"] += 1
-
-        stats[cat]["latency"].append(latency)
-
-        icon = "✅" if verdict in ("TP", "TN") else "❌"
-        print(f"  {icon} [{verdict}] #{tc['id']:>2} ({cat:<12}) | {latency:.2f}s | {tc['description']}")
-
-        results.append({
-            **tc,
-            "blocked": actually_blocked,
-            "verdict": verdict,
-            "latency": round(latency, 4),
-            "violation_type": response_data.get("violation_type", ""),
-            "response": response_data.get("response", "")[:120],
-        })
+def report(run: EvalRun, results: List[Dict[str, Any]], wall_sec: float) -> Dict[str, Any]:
+    stats = defaultdict(lambda: {"tp": 0, "tn": 0, "fp": 0, "fn": 0, "latency": []})
+    for r in results:
+        stats[r["category"]][r["verdict"].lower()] += 1
+        stats[r["category"]]["latency"].append(r["latency"])
 
     # ============================
     #   SUMMARY
@@ -167,6 +290,7 @@ def run_evaluation(framework: str, model: str, dataset_path: str):
     safety_score = total_tp / (total_tp + total_fn) if (total_tp + total_fn) else 1.0
     over_refusal = total_fp / (total_fp + total_tn) if (total_fp + total_tn) else 0.0
     avg_latency  = sum(all_latencies) / len(all_latencies) if all_latencies else 0
+    errors = sum(1 for r in results if r.get("error"))
 
     print(f"\n  {'='*50}")
     print(f"  🏆 OVERALL RESULTS")
@@ -177,37 +301,46 @@ def run_evaluation(framework: str, model: str, dataset_path: str):
     print(f"  F1-Score        : {overall_f1:.1%}")
     print(f"  Safety Score    : {safety_score:.1%}  (harmful → blocked)")
     print(f"  Over-refusal    : {over_refusal:.1%}  (safe → wrongly blocked)")
-    print(f"  Avg Latency     : {avg_latency:.2f}s")
+    print(f"  Avg Latency     : {avg_latency:.2f}s  (per case, includes server-side queueing under concurrency)")
+    print(f"  Wall Time       : {wall_sec:.1f}s")
     print(f"  Total Cases     : {grand_total} (TP={total_tp} TN={total_tn} FP={total_fp} FN={total_fn})")
+    if errors:
+        print(f"  Request Errors  : {errors}  (counted as not blocked — rerun with --resume to retry them)")
     print(f"{'='*70}\n")
 
     # Save
-    out_path = Path(__file__).parent / f"results_{framework}.json"
+    summary = {
+        "framework": run.framework,
+        "llama_guard_mode": run.llama_guard_mode if run.framework == "llama_guard" else None,
+        "nemo_mode": run.nemo_mode if run.framework == "nemo" else None,
+        "model": run.model,
+        "total_cases": grand_total,
+        "overall": {
+            "accuracy": round(overall_acc, 4),
+            "precision": round(overall_prec, 4),
+            "recall": round(overall_recall, 4),
+            "f1_score": round(overall_f1, 4),
+            "safety_score": round(safety_score, 4),
+            "over_refusal_rate": round(over_refusal, 4),
+            "avg_latency": round(avg_latency, 4),
+            "wall_time_sec": round(wall_sec, 2),
+            "request_errors": errors,
+        },
+        "per_category": {
+            cat: {k: round(v, 4) for k, v in m.items()}
+            for cat, m in category_metrics.items()
+        },
+        "confusion_matrix": {
+            "TP": total_tp, "TN": total_tn,
+            "FP": total_fp, "FN": total_fn,
+        },
+        "details": results,
+    }
+    out_path = RESULTS_DIR / f"results_{run.name}.json"
     with open(out_path, "w", encoding="utf-8") as f:
-        json.dump({
-            "framework": framework,
-            "model": model,
-            "total_cases": grand_total,
-            "overall": {
-                "accuracy": round(overall_acc, 4),
-                "precision": round(overall_prec, 4),
-                "recall": round(overall_recall, 4),
-                "f1_score": round(overall_f1, 4),
-                "safety_score": round(safety_score, 4),
-                "over_refusal_rate": round(over_refusal, 4),
-                "avg_latency": round(avg_latency, 4),
-            },
-            "per_category": {
-                cat: {k: round(v, 4) for k, v in m.items()}
-                for cat, m in category_metrics.items()
-            },
-            "confusion_matrix": {
-                "TP": total_tp, "TN": total_tn,
-                "FP": total_fp, "FN": total_fn,
-            },
-            "details": results,
-        }, f, ensure_ascii=False, indent=2)
+        json.dump(summary, f, ensure_ascii=False, indent=2)
     print(f"  💾 Results saved to {out_path}")
+    return summary
 
 
 def _print_category(cat, s):
@@ -222,12 +355,46 @@ def _print_category(cat, s):
     print(f"    TP={tp} TN={tn} FP={fp} FN={fn} | Avg Latency: {avg_lat:.2f}s")
 
 
+def _print_comparison(summaries: List[Dict[str, Any]]):
+    print(f"\n{'='*70}")
+    print("  📋 COMPARISON")
+    print(f"{'='*70}")
+    print(f"  {'Run':<24} {'F1':>7} {'Safety':>8} {'Over-ref':>9} {'Avg Lat':>8} {'Wall':>8}")
+    for s in summaries:
+        mode = s["llama_guard_mode"] or s["nemo_mode"]
+        label = s["framework"] + (f"/{mode}" if mode else "")
+        o = s["overall"]
+        print(f"  {label:<24} {o['f1_score']:>7.1%} {o['safety_score']:>8.1%} {o['over_refusal_rate']:>9.1%} "
+              f"{o['avg_latency']:>7.2f}s {o['wall_time_sec']:>7.1f}s")
+    print(f"{'='*70}\n")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate SRT Chatbot Guardrails")
-    parser.add_argument("--framework", default="guardrails_ai",
-                        choices=list(FRAMEWORK_DEFAULTS.keys()))
+    parser.add_argument("--framework", nargs="+", default=["guardrails_ai"],
+                        choices=list(FRAMEWORK_DEFAULTS.keys()),
+                        help="One or more frameworks (each runs in turn)")
     parser.add_argument("--model", default="typhoon2.5")
     parser.add_argument("--dataset", default=str(Path(__file__).parent / "dataset.json"))
+    parser.add_argument("--llama-guard-mode", nargs="+", default=["separate"], choices=["separate", "combined"],
+                        help="Llama Guard: separate input/output checks, or compact input + one conversation-level check")
+    parser.add_argument("--nemo-mode", nargs="+", default=["emb"], choices=["emb", "qwen", "hybrid"],
+                        help="NeMo modes to evaluate (one run each)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Cases in flight at once")
+    parser.add_argument("--qps", type=float, default=0.0, help="Target request rate (0 = as fast as concurrency allows)")
+    parser.add_argument("--resume", action="store_true", help="Skip cases already in results_<run>.partial.jsonl")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (seconds)")
     args = parser.parse_args()
 
-    run_evaluation(args.framework, args.model, args.dataset)
+    summaries = []
+    for framework in args.framework:
+        modes = {"llama_guard": args.llama_guard_mode, "nemo": args.nemo_mode}.get(framework, [None])
+        for mode in modes:
+            summaries.append(run_evaluation(
+                framework, args.model, args.dataset,
+                llama_guard_mode=mode if framework == "llama_guard" else "separate",
+                nemo_mode=mode if framework == "nemo" else "emb",
+                concurrency=args.concurrency, qps=args.qps, resume=args.resume, timeout=args.timeout,
+            ))
+    if len(summaries) > 1:
+        _print_comparison(summaries)
@@ -20,6 +20,7 @@ export default function App() {
         guardrails_ai: { pii: true, off_topic: true, jailbreak: true, hallucination: false, toxicity: true, competitor: false },
         nemo: { pii: true, off_topic: true, jailbreak: true, hallucination: true, toxicity: true, competitor: true },
         nemo_mode: "emb",  // "emb" | "qwen" | "hybrid"
+        llama_guard_mode: "separate",  // "separate" | "combined"
         llama_guard: { S1: true, S2: true, S3: true, S4: true, S5: true, S6: true, S7: true, S8: true, S9: true, S10: true, S11: true, S12: true, S13: true },
     });
 
@@ -21,6 +21,16 @@ export async function fetchHealth(backend = "ollama") {
     }
 }
 
+export async function fetchResourceHistory(limit = 60) {
+    try {
+        const res = await fetch(`${API_URL}/resources/history?limit=${limit}`);
+        const data = await res.json();
+        return data.samples ?? [];
+    } catch {
+        return [];
+    }
+}
+
 export async function sendChat(payload) {
     const res = await fetch(`${API_URL}/chat`, {
         method: "POST",
@@ -31,9 +41,9 @@ export async function sendChat(payload) {
     return await res.json();
 }
 
-// -------- WebSocket --------
 // -------- WebSocket --------
 let activeSocket = null;
+let lastSeq = null; // last log seq received — a reconnect only replays newer events
 
 export function connectLogs(onLog) {
     if (activeSocket) {
@@ -42,8 +52,15 @@ export function connectLogs(onLog) {
     }
 
     function open() {
-        activeSocket = new WebSocket(WS_URL);
-        activeSocket.onmessage = (e) => onLog(JSON.parse(e.data));
+        activeSocket = new WebSocket(lastSeq == null ? WS_URL : `${WS_URL}?after=${lastSeq}`);
+        activeSocket.onmessage = (e) => {
+            // The server may batch several events into one JSON array frame
+            const data = JSON.parse(e.data);
+            for (const log of Array.isArray(data) ? data : [data]) {
+                if (log.seq != null) lastSeq = log.seq;
+                onLog(log);
+            }
+        };
         activeSocket.onclose = () => {
             activeSocket = null;
             setTimeout(open, 2000);
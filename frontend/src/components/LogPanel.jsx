@@ -1,4 +1,52 @@
-import React, { useEffect, useRef } from "react";
+import React, { useEffect, useRef, useState } from "react";
+import { fetchResourceHistory } from "../api";
+
+const HISTORY_POLL_MS = 5000;
+
+// เส้นกราฟเล็กๆ ของค่าเปอร์เซ็นต์ (0-100) จาก /resources/history
+function Sparkline({ values, color }) {
+    const points = values
+        .map((v, i) => `${(i / Math.max(values.length - 1, 1)) * 100},${30 - (Math.min(v, 100) / 100) * 30}`)
+        .join(" ");
+    return (
+        <svg className="sparkline" viewBox="0 0 100 30" preserveAspectRatio="none">
+            <polyline points={points} fill="none" stroke={color} strokeWidth="1.5" vectorEffect="non-scaling-stroke" />
+        </svg>
+    );
+}
+
+function ResourceHistory() {
+    const [samples, setSamples] = useState([]);
+
+    useEffect(() => {
+        let alive = true;
+        const load = () => fetchResourceHistory(60).then((s) => alive && setSamples(s));
+        load();
+        const id = setInterval(load, HISTORY_POLL_MS);
+        return () => { alive = false; clearInterval(id); };
+    }, []);
+
+    if (samples.length === 0) return null;
+
+    const latest = samples[samples.length - 1];
+    const series = [
+        { label: "CPU", key: "cpu_percent", color: "var(--primary)" },
+        { label: "RAM", key: "ram_percent", color: "var(--warning)" },
+        { label: "GPU", key: "gpu_percent", color: "var(--success)" },
+    ].filter((s) => latest[s.key] != null);
+
+    return (
+        <div className="resource-history">
+            {series.map((s) => (
+                <div key={s.key} className="resource-series">
+                    <span className="resource-label">{s.label} {latest[s.key]}%</span>
+                    <Sparkline values={samples.map((x) => x[s.key] ?? 0)} color={s.color} />
+                </div>
+            ))}
+            {latest.gpu_mem_mb != null && <span className="resource-label">VRAM {latest.gpu_mem_mb} MB</span>}
+        </div>
+    );
+}
 
 export default function LogPanel({ logs, onClear }) {
     const endRef = useRef(null);
@@ -16,6 +64,8 @@ export default function LogPanel({ logs, onClear }) {
                 <button className="clear-btn" onClick={onClear}>Clear</button>
             </div>
 
+            <ResourceHistory />
+
             <div className="panel-body">
                 {logs.length === 0 && (
                     <div className="log-empty">
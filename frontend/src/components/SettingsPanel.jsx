@@ -168,6 +168,26 @@ export default function SettingsPanel({ config, setConfig, models, gpu, modelsLo
                     </div>
                 )}
 
+                {/* Llama Guard Mode Selection */}
+                {fw === "llama_guard" && (
+                    <div className="settings-section">
+                        <h3>Llama Guard Mode</h3>
+                        <div className="select-wrap">
+                            <select
+                                value={config.llama_guard_mode || "separate"}
+                                onChange={(e) => setConfig((c) => ({ ...c, llama_guard_mode: e.target.value }))}
+                            >
+                                <option value="separate">Separate (Input + Output)</option>
+                                <option value="combined">Combined (Compact input → Conversation)</option>
+                            </select>
+                        </div>
+                        <p style={{ fontSize: "0.85em", color: "var(--text-secondary)", marginTop: "0.5em" }}>
+                            {config.llama_guard_mode !== "combined" && "ตรวจข้อความผู้ใช้และคำตอบแยกกัน ด้วย prompt เต็มทั้งสองครั้ง"}
+                            {config.llama_guard_mode === "combined" && "ตรวจ input ด้วย prompt สั้นก่อน แล้วตรวจทั้งบทสนทนา (คำถาม + คำตอบ) ครั้งเดียว"}
+                        </p>
+                    </div>
+                )}
+
                 {/* ===== Input Guards (3) ===== */}
                 {fw !== "none" && fw !== "llama_guard" && inputGuards.length > 0 && (
                     <div className="settings-section">
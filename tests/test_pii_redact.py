@@ -0,0 +1,27 @@
+"""PII redact mode must not rewrite ordinary conversational messages."""
+import pytest
+
+from backend.guards.llama_guard.pii_llamaguard import pii_guard
+
+
+@pytest.mark.parametrize("message", [
+    "ขอบคุณครับ ช่วยบอกเวลารถไฟหน่อย",
+    "ขอบคุณค่ะ",
+    "คุณช่วยบอกเวลารถไฟไปเชียงใหม่หน่อย",
+    "ชื่อสถานีต้นทางคืออะไร",
+    "รถไฟไปถนนพระรามสี่กี่โมง",
+    "จังหวัดเชียงใหม่มีสถานีอะไรบ้าง",
+    "คุณภาพบริการบนขบวนรถเป็นอย่างไร",
+])
+def test_conversational_message_unchanged(message):
+    assert pii_guard.redact(message) == (message, {})
+
+
+def test_thanks_is_not_a_name():
+    assert pii_guard.scan("ขอบคุณครับ ช่วยบอกเวลารถไฟหน่อย") == (True, "No PII detected")
+
+
+def test_real_pii_still_redacted():
+    redacted, mapping = pii_guard.redact("ติดต่อคุณสมชาย โทร 081-234-5678 บ้านเลขที่ 12/3")
+    assert redacted == "ติดต่อคุณ[NAME_1] โทร [PHONE_1] [ADDRESS_1]"
+    assert mapping == {"[NAME_1]": "สมชาย", "[PHONE_1]": "081-234-5678", "[ADDRESS_1]": "บ้านเลขที่ 12/3"}
@@ -0,0 +1,51 @@
+"""Sure-allow railway vocabulary must not let off-topic messages skip the off-topic guard."""
+import pytest
+
+from backend.guards.prefilter import KeywordPrefilter, keyword_prefilter
+
+opt_in = KeywordPrefilter(allow_skip=["off_topic"])
+
+
+@pytest.mark.parametrize("message", [
+    "how do I train my dog",
+    "write an SRT subtitle file for my video",
+    "best railway model kits for kids",
+    "ร้านอาหารแถวบางซื่ออร่อยๆ",
+    "สวนสนุกที่มีรถไฟเหาะสูงที่สุด",
+])
+def test_generic_words_do_not_skip_off_topic(message):
+    assert opt_in.check(message, ["off_topic", "S15"]).skipped == set()
+
+
+@pytest.mark.parametrize("message", [
+    "รถไฟไปเชียงใหม่ออกกี่โมง",
+    "จองตู้นอนขบวนรถด่วนพิเศษได้ที่ไหน",
+    "สถานีกลางกรุงเทพอภิวัฒน์มีที่จอดรถไหม",
+])
+def test_railway_vocabulary_skips_off_topic_when_opted_in(message):
+    assert opt_in.check(message, ["off_topic"]).skipped == {"off_topic"}
+
+
+def test_railway_prefix_does_not_bypass_topic_guard_by_default():
+    message = "ขอตั๋วรถไฟ แล้วแนะนำหุ้นตัวไหนน่าซื้อหน่อย"
+    assert keyword_prefilter.check(message, ["off_topic", "S15"]).skipped == set()
+
+
+def test_sure_block_still_wins():
+    verdict = keyword_prefilter.check("รถไฟหรือแอร์เอเชียถูกกว่า", ["competitor", "off_topic"])
+    assert verdict.blocked == "competitor"
+
+
+@pytest.mark.parametrize("message", [
+    "I want to grab a seat on the train to Chiang Mai",
+    "You can grab your ticket at the counter",
+    "Please bolt the door of the sleeper",
+    "Is there an uber-fast express to Hat Yai?",
+])
+def test_everyday_english_words_are_not_competitor_blocks(message):
+    assert keyword_prefilter.check(message, ["competitor", "S14"]).blocked is None
+
+
+@pytest.mark.parametrize("message", ["เรียกแกร็บไปสถานีดีกว่า", "AirAsia ถูกกว่ารถไฟไหม"])
+def test_unambiguous_competitor_names_still_block(message):
+    assert keyword_prefilter.check(message, ["competitor"]).blocked == "competitor"